@@ -3,20 +3,42 @@
 
 from flask import (
     Flask, render_template, request, jsonify, redirect,
-    url_for, session, send_file, flash
+    url_for, session, flash
 )
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
 import os
+import threading
 from functools import wraps
 from bson import ObjectId
-from pymongo import MongoClient
 import pymongo
 import gridfs
-import io
-import PyPDF2
-import docx
+
+import data_access
+import query_monitor
+import metrics
+import profiler
+
+import ingest_jobs
+import content_index
+from paging import keyset_page, text_search_page, count_matches
+import search_engine
+from book_loader import BookLoader, load_books
+import dashboard_stats
+from event_buffer import WriteBehindBuffer
+from streaming import (
+    send_gridfs_file, send_gridfs_image, send_image_bytes, send_local_file, image_not_modified
+)
+from image_pipeline import (
+    RENDITIONS, store_renditions, delete_renditions, find_rendition, preferred_format
+)
+from cover_cache import CoverCache
+from auth_cache import AuthCache
+from disk_cache import DiskCache
+from blob_store import store_book_blob, release_book_blob
+import resumable_upload
+from resumable_upload import UploadError
 
 # ==================== APP CONFIG ====================
 app = Flask(__name__)
@@ -28,88 +50,287 @@ app.config['COVER_FOLDER'] = 'covers'       # vẫn có thể dùng cho ảnh b
 app.config['ALLOWED_EXTENSIONS'] = {'pdf', 'epub', 'txt', 'doc', 'docx'}
 app.config['ALLOWED_IMAGES'] = {'png', 'jpg', 'jpeg', 'gif'}
 
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['COVER_FOLDER'], exist_ok=True)
-
-
-# ==================== MONGODB + GRIDFS ====================
-def connect_mongodb():
-    try:
-        # Tùy máy bạn, chỉnh connection string cho phù hợp
-        client = MongoClient('mongodb://localhost:27017/', serverSelectionTimeoutMS=5000)
-        client.admin.command('ping')
-        db = client['digital_library']
+# Cache byte ảnh bìa trong mỗi worker (tổng dung lượng / kích thước tối đa một ảnh)
+app.config['COVER_CACHE_BYTES'] = int(os.environ.get('COVER_CACHE_BYTES', 64 * 1024 * 1024))
+app.config['COVER_CACHE_MAX_OBJECT'] = int(os.environ.get('COVER_CACHE_MAX_OBJECT', 512 * 1024))
+
+# Cache quyền (role, status) của người dùng trong mỗi worker (giây)
+app.config['AUTH_CACHE_TTL'] = float(os.environ.get('AUTH_CACHE_TTL', 15))
+
+# Ghi trễ lượt tải / lịch sử đọc theo lô (WRITE_BEHIND=0 để ghi đồng bộ như cũ)
+app.config['WRITE_BEHIND'] = os.environ.get('WRITE_BEHIND', '1') == '1'
+app.config['WRITE_BEHIND_BATCH'] = int(os.environ.get('WRITE_BEHIND_BATCH', 500))
+app.config['WRITE_BEHIND_INTERVAL'] = float(os.environ.get('WRITE_BEHIND_INTERVAL', 1.0))
+app.config['WRITE_BEHIND_MAX_PENDING'] = int(os.environ.get('WRITE_BEHIND_MAX_PENDING', 10000))
+
+# Cache file sách trên đĩa cục bộ (tùy chọn): để trống BOOK_CACHE_DIR để tắt
+app.config['BOOK_CACHE_DIR'] = os.environ.get('BOOK_CACHE_DIR')
+app.config['BOOK_CACHE_MAX_BYTES'] = int(os.environ.get('BOOK_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+
+# Upload nhiều phần: mỗi chunk = một chunk GridFS (tối đa 8 MB, dưới giới hạn 16 MB / document)
+app.config['UPLOAD_CHUNK_SIZE'] = min(int(os.environ.get('UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024)),
+                                      8 * 1024 * 1024)
+
+# Tìm kiếm: số sách mỗi trang (client chọn per_page tối đa SEARCH_MAX_PAGE_SIZE);
+# đếm tổng tùy chọn, vượt ngưỡng thì chỉ hiển thị "hơn N" thay vì đếm chính xác
+app.config['SEARCH_PAGE_SIZE'] = int(os.environ.get('SEARCH_PAGE_SIZE', 24))
+app.config['SEARCH_MAX_PAGE_SIZE'] = int(os.environ.get('SEARCH_MAX_PAGE_SIZE', 96))
+app.config['SEARCH_COUNT'] = os.environ.get('SEARCH_COUNT', '1') == '1'
+app.config['SEARCH_COUNT_THRESHOLD'] = int(os.environ.get('SEARCH_COUNT_THRESHOLD', 1000))
+
+# Trang quản trị sách / người dùng: số dòng mỗi trang (phân trang keyset, không đọc cả collection)
+app.config['ADMIN_PAGE_SIZE'] = int(os.environ.get('ADMIN_PAGE_SIZE', 50))
+app.config['ADMIN_MAX_PAGE_SIZE'] = int(os.environ.get('ADMIN_MAX_PAGE_SIZE', 200))
+
+# Đếm lệnh MongoDB theo request (header X-DB-Queries / Server-Timing), bật khi phát triển
+app.config['QUERY_MONITOR'] = os.environ.get('QUERY_MONITOR', '0') == '1'
+
+# Số liệu Prometheus tại /metrics (METRICS=0 để tắt hẳn: không hook, không listener).
+# METRICS_DIR: thư mục chung để cộng số của mọi worker gunicorn / ingest_worker (gunicorn.conf.py
+# đặt sẵn); METRICS_TOKEN: nếu đặt thì scrape phải gửi "Authorization: Bearer <token>".
+# Không đặt token thì chỉ localhost (gọi thẳng, không qua proxy) đọc được; METRICS_PUBLIC=1 để mở cho mọi nơi
+app.config['METRICS'] = os.environ.get('METRICS', '1') == '1'
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR') or None
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN') or None
+app.config['METRICS_PUBLIC'] = os.environ.get('METRICS_PUBLIC', '0') == '1'
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+# Profile theo yêu cầu một request bằng link có chữ ký tạo ở /admin/profiles (PROFILING=1 để bật;
+# tắt thì request không đi qua middleware profiler)
+app.config['PROFILING'] = os.environ.get('PROFILING', '0') == '1'
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+app.config['PROFILE_KEEP'] = int(os.environ.get('PROFILE_KEEP', 50))
+app.config['PROFILE_TOKEN_TTL'] = int(os.environ.get('PROFILE_TOKEN_TTL', 3600))    # giây
+
+# Bộ máy tìm kiếm sách: "memory" (search_engine.py, hiểu tiếng Việt không dấu, BM25)
+# hoặc "mongo" (text index của MongoDB)
+app.config['SEARCH_ENGINE'] = os.environ.get('SEARCH_ENGINE', 'memory')
+app.config['SEARCH_INDEX_SNAPSHOT'] = os.environ.get('SEARCH_INDEX_SNAPSHOT', 'search_index.snapshot')
+
+# Các trường mà thẻ sách trong danh sách cần (không kéo preview / description)
+BOOK_CARD_FIELDS = {"title": 1, "author": 1, "cover_id": 1, "cover_image": 1}
+# Các cột của bảng quản trị
+ADMIN_BOOK_FIELDS = {"title": 1, "author": 1, "published_year": 1, "created_at": 1,
+                     "cover_id": 1, "cover_image": 1, "ingest_status": 1}
+ADMIN_USER_FIELDS = {"name": 1, "email": 1, "role": 1, "status": 1, "created_at": 1}
+# Số lệnh MongoDB tối đa mỗi request của các route nóng (query_monitor cảnh báo khi vượt,
+# test dùng query_monitor.check_budgets). Thêm truy vấn theo từng dòng (N+1) sẽ vượt ngay.
+QUERY_BUDGETS = {
+    'user_dashboard': 5,        # quyền + sách mới + yêu thích + nạp sách theo lô
+    'my_library': 6,            # quyền + 3 danh sách + nạp sách theo lô
+    'search_books': 8,          # quyền + nạp sách + khớp nội dung (index đồng bộ ở luồng nền)
+    'book_detail': 4,           # quyền + sách + yêu thích (lịch sử đọc ghi trễ)
+    'admin_dashboard': 4,
+    'admin_books': 4,           # quyền + một trang + đếm
+    'admin_users': 4,
+    'api_admin_books': 3,
+    'api_admin_users': 3,
+    'api_search_suggest': 3,
+    'api_related_books': 3,
+}
+
+# Mới nhất trước; _id phân định các bản ghi trùng created_at (khóa của phân trang keyset)
+NEWEST_FIRST = [("created_at", -1), ("_id", -1)]
+
+
+
+# ==================== KHỞI TẠO (APP FACTORY) ====================
+# Các thành phần dùng chung của process; create_app() gán giá trị (route dùng lúc chạy request)
+data = None                  # data_access.DataAccess
+db = None                    # primary: ghi + đọc cần mới nhất (đăng nhập, quyền, trang quản trị)
+catalog_db = None            # đọc danh mục / tìm kiếm, có thể đi tới secondary
+blob_db = None               # pool kết nối riêng cho GridFS / chunk upload
+fs = fs_images = None
+cover_cache = auth_cache = event_buffer = search_index = book_file_cache = None
+metrics_writer = None        # metrics.SnapshotWriter khi chạy nhiều process (METRICS_DIR)
+
+
+def create_app(config=None):
+    """
+    Cấu hình app (biến môi trường, ghi đè bằng dict config) rồi tạo lớp truy cập dữ liệu
+    và các cache / bộ đệm dùng chung. Route vẫn khai báo trên app của module này.
 
-        # Indexes
-        db.users.create_index("email", unique=True)
-        try:
-            # Text index cho tìm kiếm
-            db.books.create_index([("title", "text"),
-                                   ("author", "text"),
-                                   ("description", "text")])
-        except pymongo.errors.OperationFailure:
-            pass
+    Không có I/O mạng: MongoClient chỉ mở kết nối ở truy vấn đầu tiên, nên MongoDB chậm / chưa
+    chạy không làm treo lúc khởi động worker. Tạo index / admin: python bootstrap.py all
 
-        # GridFS buckets
-        fs = gridfs.GridFS(db)  # files: fs.files, fs.chunks
-        fs_images = gridfs.GridFS(db, collection="images")  # ảnh bìa: images.files, images.chunks
+        app = create_app({"MONGO_MAX_POOL_SIZE": 100})
+    """
+    global data, db, catalog_db, blob_db, fs, fs_images
+    global cover_cache, auth_cache, event_buffer, search_index, book_file_cache, metrics_writer
+
+    app.config.from_mapping(data_access.settings_from_env())
+    if config:
+        app.config.update(config)
+
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['COVER_FOLDER'], exist_ok=True)
+
+    listeners = []
+    if app.config['QUERY_MONITOR']:
+        query_monitor.init_app(app, QUERY_BUDGETS)
+        listeners.append(query_monitor.LISTENER)
+    if app.config['METRICS']:
+        metrics.init_app(app)
+    if app.config['PROFILING']:
+        profiler.init_app(app)
+    data = data_access.DataAccess(app.config, event_listeners=listeners,
+                                  pool_listeners=metrics.mongo_listeners if app.config['METRICS'] else None)
+    db, catalog_db, blob_db = data.db, data.catalog_db, data.blob_db
+    fs, fs_images = data.fs, data.fs_images
+    app.extensions['data_access'] = data
+
+    cover_cache = CoverCache(app.config['COVER_CACHE_BYTES'], app.config['COVER_CACHE_MAX_OBJECT'])
+    auth_cache = AuthCache(app.config['AUTH_CACHE_TTL'])
+    event_buffer = WriteBehindBuffer(db, app.config['WRITE_BEHIND_BATCH'],
+                                     app.config['WRITE_BEHIND_INTERVAL'],
+                                     app.config['WRITE_BEHIND_MAX_PENDING'],
+                                     enabled=app.config['WRITE_BEHIND'])
+    search_index = search_engine.SearchEngine(app.config['SEARCH_INDEX_SNAPSHOT'])
+    book_file_cache = (DiskCache(app.config['BOOK_CACHE_DIR'], app.config['BOOK_CACHE_MAX_BYTES'])
+                       if app.config['BOOK_CACHE_DIR'] else None)
+
+    if app.config['METRICS']:
+        metrics.clear_collectors()
+        metrics.register_cache("cover", cover_cache)
+        metrics.register_cache("auth", auth_cache)
+        if book_file_cache is not None:
+            metrics.register_cache("book_file", book_file_cache)
+        if metrics_writer is not None:
+            metrics_writer.close()
+            metrics_writer = None
+        if app.config['METRICS_DIR']:
+            metrics_writer = metrics.SnapshotWriter(app.config['METRICS_DIR'],
+                                                    app.config['METRICS_FLUSH_INTERVAL'])
+    return app
+
+
+_init_lock = threading.Lock()
+
+
+def _create_on_first_request(wsgi_app):
+    """
+    gunicorn app:app không kèm gunicorn.conf.py, flask run, hay import app rồi test_client():
+    chưa ai gọi create_app() -> tạo với cấu hình từ biến môi trường ở request đầu tiên
+    (trước khi Flask xử lý request, nên create_app vẫn gắn được hook before/after_request).
+    """
+    def middleware(environ, start_response):
+        if data is None:
+            with _init_lock:
+                if data is None:
+                    create_app()
+        return wsgi_app(environ, start_response)
+    return middleware
 
-        print("✅ MongoDB + GridFS sẵn sàng")
-        return db, fs, fs_images
-    except Exception as e:
-        print(f"❌ Lỗi kết nối MongoDB: {e}")
-        print("💡 Kiểm tra mongod đã chạy và cổng 27017.")
-        raise
 
-db, fs, fs_images = connect_mongodb()
+app.wsgi_app = _create_on_first_request(app.wsgi_app)
 
 
 # ==================== HELPERS ====================
 def allowed_file(filename, allowed_extensions):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
-def extract_text_preview(file_bytes, filename, max_chars=800):
-    """Trích văn bản để hiển thị preview ngắn (safe)."""
+def _cover_files_query(cover_id):
+    return {"$or": [{"_id": cover_id}, {"metadata.original_id": cover_id}]}
+
+def save_cover_renditions(image_bytes, cover_id, book_id, filename):
+    """Sinh sẵn các kích thước ảnh bìa; ảnh lỗi thì bỏ qua (vẫn còn ảnh gốc)."""
     try:
-        ext = filename.lower().split('.')[-1]
-        if ext == "pdf":
-            reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
-            text = ""
-            for page in reader.pages[:3]:
-                # .extract_text có thể trả None
-                text += (page.extract_text() or "")
-            text = text.strip()
-            return (text[:max_chars] + "...") if len(text) > max_chars else text
-        elif ext in ["doc", "docx"]:
-            # python-docx chỉ đọc .docx tốt; .doc có thể không đọc được => fallback
-            try:
-                doc = docx.Document(io.BytesIO(file_bytes))
-                text = "\n".join(p.text for p in doc.paragraphs[:30])
-            except Exception:
-                text = ""
-            text = text.strip()
-            if not text and ext == "doc":
-                return "Không thể tạo xem trước cho file .doc (định dạng cũ)."
-            return (text[:max_chars] + "...") if len(text) > max_chars else text
-        elif ext == "txt":
-            try:
-                text = file_bytes.decode("utf-8", errors="ignore")
-            except Exception:
-                text = file_bytes.decode("latin-1", errors="ignore")
-            text = text.strip()
-            return (text[:max_chars] + "...") if len(text) > max_chars else text
-        else:
-            return "Không thể tạo xem trước cho định dạng file này."
+        renditions = store_renditions(fs_images, image_bytes, cover_id,
+                                      book_id=book_id, filename=filename)
+    except Exception as e:
+        print(f"Lỗi tạo rendition ảnh bìa: {e}")
+        renditions = None
+    count, size = dashboard_stats.gridfs_usage(db, "images", _cover_files_query(cover_id))
+    dashboard_stats.bump(db, totals={"images_count": count, "images_bytes": size})
+    return renditions
+
+def delete_cover(cover_id):
+    """Xóa ảnh bìa GridFS kèm mọi rendition, bỏ khỏi cache và trừ thống kê."""
+    cover_id = ObjectId(cover_id)
+    count, size = dashboard_stats.gridfs_usage(db, "images", _cover_files_query(cover_id))
+    try:
+        fs_images.delete(cover_id)
     except Exception:
-        return "Không thể tạo xem trước."
+        pass
+    delete_renditions(db, fs_images, cover_id)
+    cover_cache.invalidate(cover_id)
+    dashboard_stats.bump(db, totals={"images_count": -count, "images_bytes": -size})
+
+def reuse_derived_fields(file_id, deduplicated):
+    """File trùng nội dung với sách đã xử lý xong -> dùng lại preview / thông tin dẫn xuất."""
+    if not deduplicated:
+        return None
+    same_file_book = db.books.find_one({"file_id": file_id, "preview": {"$nin": [None, ""]}},
+                                       {"preview": 1, "page_count": 1})
+    if not same_file_book:
+        return None
+    return {"preview": same_file_book["preview"], "page_count": same_file_book.get("page_count")}
+
+
+def schedule_ingest(book_id, file_id, filename, preview=True):
+    """
+    Giao phần xử lý file cho worker nền (ingest_worker.py) thay vì làm trong request:
+    trích preview (nếu chưa có) và index nội dung theo trang cho tìm kiếm toàn văn.
+    """
+    if preview:
+        ingest_jobs.enqueue(db, book_id, file_id, filename, kind="preview")
+    ingest_jobs.enqueue(db, book_id, file_id, filename, kind="content_index")
+
+
+def send_book_file(file_id, as_attachment):
+    """
+    Trả file sách trong GridFS: nếu bật cache đĩa và file đã có trên đĩa cục bộ thì phục vụ từ đó;
+    trượt cache (file được nạp vào đĩa ở nền) / đĩa lỗi thì stream thẳng từ GridFS.
+    """
+    if book_file_cache is not None:
+        entry = book_file_cache.fetch(file_id, fs)
+        if entry is not None:
+            path, meta = entry
+            try:
+                return send_local_file(
+                    path, as_attachment=as_attachment,
+                    download_name=meta.get("filename"),
+                    mimetype=meta.get("content_type"),
+                    etag=str(file_id),               # cùng ETag với GridFS để If-Range khớp
+                    last_modified=meta.get("upload_date")
+                )
+            except OSError:
+                pass   # file vừa bị evict -> đọc GridFS
+    return send_gridfs_file(fs.get(file_id), as_attachment=as_attachment)
     
 
 # ==================== AUTH DECORATORS ====================
+def get_auth_context(user_id):
+    """{role, status} của người dùng, qua auth_cache (chỉ đọc db.users khi hết hạn / bị xóa cache)."""
+    context = auth_cache.get(user_id)
+    if context is None:
+        user = db.users.find_one({"_id": ObjectId(user_id)}, {"role": 1, "status": 1})
+        context = ({"role": user.get('role'), "status": user.get('status')} if user
+                   else {"role": None, "status": None})
+        auth_cache.put(user_id, context)
+    return context
+
+
+def _session_context():
+    """Context của phiên hiện tại; None (và xóa phiên) nếu tài khoản không còn hoặc bị khóa."""
+    context = get_auth_context(session['user_id'])
+    if context["role"] is None or context["status"] == 'Blocked':
+        session.clear()
+        flash('Tài khoản của bạn đã bị khóa' if context["status"] == 'Blocked'
+              else 'Phiên đăng nhập không còn hợp lệ', 'error')
+        return None
+    if session.get('user_role') != context["role"]:
+        session['user_role'] = context["role"]
+    return context
+
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             return redirect(url_for('login'))
+        if _session_context() is None:
+            return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
 
@@ -118,14 +339,61 @@ def admin_required(f):
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             return redirect(url_for('login'))
-        user = db.users.find_one({"_id": ObjectId(session['user_id'])})
-        if not user or user.get('role') != 'Admin':
+        context = _session_context()
+        if context is None:
+            return redirect(url_for('login'))
+        if context["role"] != 'Admin':
             flash('Bạn không có quyền truy cập trang này', 'error')
             return redirect(url_for('user_dashboard'))
         return f(*args, **kwargs)
     return decorated_function
 
 
+# ==================== PHÂN TRANG / BỘ LỌC ====================
+def _page_args(default_size, max_size):
+    """(page_size, cursor) từ query string: per_page bị kẹp trong [1, max_size], after là con trỏ keyset."""
+    try:
+        page_size = int(request.args.get('per_page', default_size))
+    except ValueError:
+        page_size = default_size
+    return max(1, min(page_size, max_size)), request.args.get('after') or None
+
+
+def _admin_book_filters(args):
+    """Bộ lọc bảng sách: (giá trị hợp lệ để hiển thị lại trên form, truy vấn MongoDB)."""
+    filters = {
+        "author": args.get('author', '').strip(),
+        "year": args.get('year', '').strip(),
+        "status": args.get('status', ''),
+    }
+    query = {}
+    if filters["author"]:
+        query["author"] = filters["author"]
+    if filters["year"]:
+        try:
+            query["published_year"] = int(filters["year"])
+        except ValueError:
+            filters["year"] = ""
+    if filters["status"] == "done":
+        # Sách cũ chưa từng qua hàng đợi không có ingest_status: coi như đã xử lý
+        query["ingest_status"] = {"$nin": ["queued", "running", "failed"]}
+    elif filters["status"] in ("queued", "running", "failed"):
+        query["ingest_status"] = filters["status"]
+    else:
+        filters["status"] = ""
+    return filters, query
+
+
+def _admin_user_filters(args):
+    """Bộ lọc bảng người dùng theo trạng thái / vai trò."""
+    filters = {"status": args.get('status', ''), "role": args.get('role', '')}
+    if filters["status"] not in ("Active", "Blocked"):
+        filters["status"] = ""
+    if filters["role"] not in ("Admin", "User"):
+        filters["role"] = ""
+    return filters, {k: v for k, v in filters.items() if v}
+
+
 # ==================== ROUTES ====================
 
 @app.route('/')
@@ -150,6 +418,8 @@ def login():
             session['user_id'] = str(user['_id'])
             session['user_name'] = user['name']
             session['user_role'] = user['role']
+            # Vừa đọc user xong: nạp sẵn cache quyền cho các request tiếp theo
+            auth_cache.put(str(user['_id']), {"role": user.get('role'), "status": user.get('status')})
 
             if remember:
                 session.permanent = True
@@ -187,6 +457,7 @@ def register():
             "created_at": datetime.now()
         }
         db.users.insert_one(user_data)
+        dashboard_stats.bump(db, totals={"users": 1}, daily={"new_users": 1})
         flash('Đăng ký thành công! Vui lòng đăng nhập', 'success')
         return redirect(url_for('login'))
 
@@ -195,6 +466,8 @@ def register():
 
 @app.route('/logout')
 def logout():
+    if 'user_id' in session:
+        auth_cache.invalidate(session['user_id'])
     session.clear()
     flash('Đã đăng xuất thành công', 'success')
     return redirect(url_for('login'))
@@ -204,26 +477,13 @@ def logout():
 @app.route('/admin')
 @admin_required
 def admin_dashboard():
-    total_books = db.books.count_documents({})
-    total_users = db.users.count_documents({})
-    today = datetime.now().date()
-    downloads_today = db.downloads.count_documents({
-        "downloaded_at": {
-            "$gte": datetime.combine(today, datetime.min.time()),
-            "$lt": datetime.combine(today, datetime.max.time())
-        }
-    })
-    new_books_today = db.books.count_documents({
-        "created_at": {
-            "$gte": datetime.combine(today, datetime.min.time()),
-            "$lt": datetime.combine(today, datetime.max.time())
-        }
-    })
+    # Bộ đếm duy trì tăng dần (dashboard_stats): đọc 2 document nhỏ thay vì đếm collection
+    totals, today = dashboard_stats.read_dashboard(db)
     stats = {
-        'total_books': total_books,
-        'total_users': total_users,
-        'downloads_today': downloads_today,
-        'new_books_today': new_books_today
+        'total_books': totals['books'],
+        'total_users': totals['users'],
+        'downloads_today': today['downloads'],
+        'new_books_today': today['new_books']
     }
     return render_template('admin_dashboard.html', stats=stats)
 
@@ -231,8 +491,37 @@ def admin_dashboard():
 @app.route('/admin/books')
 @admin_required
 def admin_books():
-    books = list(db.books.find().sort("created_at", -1))
-    return render_template('admin_books.html', books=books)
+    filters, query = _admin_book_filters(request.args)
+    page_size, cursor = _page_args(app.config['ADMIN_PAGE_SIZE'], app.config['ADMIN_MAX_PAGE_SIZE'])
+    books, next_cursor = keyset_page(db.books, query, NEWEST_FIRST, ADMIN_BOOK_FIELDS,
+                                     page_size, cursor)
+    total = None if cursor else count_matches(db.books, query, app.config['SEARCH_COUNT_THRESHOLD'])
+    return render_template('admin_books.html', books=books, filters=filters,
+                           filter_args={k: v for k, v in filters.items() if v},
+                           per_page=page_size, next_cursor=next_cursor,
+                           is_first_page=not cursor, total=total)
+
+
+@app.route('/api/admin/books')
+@admin_required
+def api_admin_books():
+    """Trang tiếp theo của bảng sách (cùng bộ lọc) cho nút "Tải thêm"."""
+    _, query = _admin_book_filters(request.args)
+    page_size, cursor = _page_args(app.config['ADMIN_PAGE_SIZE'], app.config['ADMIN_MAX_PAGE_SIZE'])
+    books, next_cursor = keyset_page(db.books, query, NEWEST_FIRST, ADMIN_BOOK_FIELDS,
+                                     page_size, cursor)
+    return jsonify({
+        "items": [{
+            "id": str(book["_id"]),
+            "title": book.get("title", ""),
+            "author": book.get("author", ""),
+            "published_year": book.get("published_year"),
+            "created_at": book["created_at"].isoformat() if book.get("created_at") else None,
+            "ingest_status": book.get("ingest_status") or "done",
+        } for book in books],
+        "html": render_template('_admin_book_rows.html', books=books),
+        "next_cursor": next_cursor,
+    })
 
 
 @app.route('/admin/books/add', methods=['GET', 'POST'])
@@ -256,26 +545,33 @@ def admin_add_book():
             flash('File sách không hợp lệ', 'error')
             return render_template('admin_add_book.html')
 
-        file_bytes = file.read()
-        file_id = fs.put(
-            file_bytes,
+        # Hash SHA-256 khi đọc luồng upload; nội dung đã có thì chỉ tăng ref_count
+        file_id, deduplicated = store_book_blob(
+            db, fs, file.stream,
             filename=secure_filename(file.filename),
             content_type=getattr(file, "content_type", None)
         )
-        preview = extract_text_preview(file_bytes, file.filename)
+        # Cùng nội dung -> khỏi phân tích lại; ngược lại worker nền sẽ điền preview
+        derived = reuse_derived_fields(file_id, deduplicated)
 
         # Ảnh bìa -> GridFS (khuyến nghị)
+        book_id = ObjectId()   # tạo trước để liên kết rendition ảnh bìa với sách
         cover_image = request.files.get('cover_image')
         cover_id = None
+        cover_renditions = None
         cover_path = None  # legacy path nếu bạn vẫn muốn lưu ra thư mục
         if cover_image and allowed_file(cover_image.filename, app.config['ALLOWED_IMAGES']):
             try:
                 # Lưu vào GridFS ảnh
+                cover_bytes = cover_image.read()
                 cover_id = fs_images.put(
-                    cover_image.read(),
+                    cover_bytes,
                     filename=secure_filename(cover_image.filename),
                     content_type=getattr(cover_image, "content_type", None)
                 )
+                cover_renditions = save_cover_renditions(
+                    cover_bytes, cover_id, book_id, secure_filename(cover_image.filename)
+                )
             except Exception:
                 cover_id = None
             # Nếu muốn đồng thời lưu file ảnh ra thư mục (tùy chọn, giữ tương thích)
@@ -288,19 +584,29 @@ def admin_add_book():
                 cover_path = None
 
         book_data = {
+            "_id": book_id,
             "title": title,
             "author": author,
             "description": description,
             "published_year": published_year,
             "file_id": file_id,              # GridFS file
             "cover_id": cover_id,            # GridFS image id (khuyến nghị dùng)
+            "cover_renditions": cover_renditions,  # {size: {fmt: id}} sinh sẵn lúc upload
             "cover_image": cover_path,       # legacy path (nếu có)
-            "preview": preview,              # text xem trước
+            "preview": None,                 # text xem trước (worker nền điền sau)
             "created_at": datetime.now()
         }
+        if derived:
+            book_data.update(derived, ingest_status="done")
 
         db.books.insert_one(book_data)
-        flash('Thêm sách thành công', 'success')
+        dashboard_stats.bump(db, totals={"books": 1}, daily={"new_books": 1})
+        search_index.book_changed(db, book_id)
+        schedule_ingest(book_id, file_id, secure_filename(file.filename), preview=not derived)
+        if deduplicated:
+            flash('Thêm sách thành công (file đã có sẵn trong thư viện, dùng lại bản lưu cũ)', 'success')
+        else:
+            flash('Thêm sách thành công', 'success')
         return redirect(url_for('admin_books'))
 
     return render_template('admin_add_book.html')
@@ -327,21 +633,22 @@ def admin_edit_book(book_id):
         if cover_image and allowed_file(cover_image.filename, app.config['ALLOWED_IMAGES']):
             # lưu ảnh mới vào GridFS
             try:
+                cover_bytes = cover_image.read()
                 new_cover_id = fs_images.put(
-                    cover_image.read(),
+                    cover_bytes,
                     filename=secure_filename(cover_image.filename),
                     content_type=getattr(cover_image, "content_type", None)
                 )
                 update_data["cover_id"] = new_cover_id
+                update_data["cover_renditions"] = save_cover_renditions(
+                    cover_bytes, new_cover_id, book["_id"], secure_filename(cover_image.filename)
+                )
             except Exception:
                 pass
 
-            # xóa cover GridFS cũ nếu có
+            # xóa cover GridFS cũ (kèm các rendition) nếu có
             if book.get("cover_id"):
-                try:
-                    fs_images.delete(ObjectId(book["cover_id"]))
-                except Exception:
-                    pass
+                delete_cover(book["cover_id"])
 
             # tùy chọn: lưu ra thư mục legacy
             try:
@@ -354,6 +661,7 @@ def admin_edit_book(book_id):
                 pass
 
         db.books.update_one({"_id": ObjectId(book_id)}, {"$set": update_data})
+        search_index.book_changed(db, book_id)
         flash('Cập nhật sách thành công', 'success')
         return redirect(url_for('admin_books'))
 
@@ -367,15 +675,17 @@ def admin_delete_book(book_id):
     if book:
         # Xóa file sách từ GridFS
         try:
-            if book.get('file_id'):
-                fs.delete(ObjectId(book['file_id']))
+            # Blob dùng chung giữa các sách: chỉ xóa khi hết tham chiếu
+            if book.get('file_id') and release_book_blob(db, fs, book['file_id']):
+                if book_file_cache is not None:
+                    book_file_cache.invalidate(book['file_id'])
         except Exception as e:
             print(f"Lỗi xóa file GridFS: {e}")
 
-        # Xóa ảnh bìa GridFS
+        # Xóa ảnh bìa GridFS (kèm các rendition)
         try:
             if book.get('cover_id'):
-                fs_images.delete(ObjectId(book['cover_id']))
+                delete_cover(book['cover_id'])
         except Exception:
             pass
 
@@ -395,9 +705,17 @@ def admin_delete_book(book_id):
 
         # Xóa DB + liên quan
         db.books.delete_one({"_id": ObjectId(book_id)})
-        db.downloads.delete_many({"book_id": ObjectId(book_id)})
-        db.favorites.delete_many({"book_id": ObjectId(book_id)})
-        db.reading_history.delete_many({"book_id": ObjectId(book_id)})
+        search_index.book_changed(db, book_id)
+        removed_downloads = db.downloads.delete_many({"book_id": ObjectId(book_id)}).deleted_count
+        removed_favorites = db.favorites.delete_many({"book_id": ObjectId(book_id)}).deleted_count
+        removed_history = db.reading_history.delete_many({"book_id": ObjectId(book_id)}).deleted_count
+        dashboard_stats.bump(db, totals={"books": -1, "downloads": -removed_downloads,
+                                         "favorites": -removed_favorites,
+                                         "reading_history": -removed_history})
+        if book.get('created_at'):
+            dashboard_stats.bump(db, daily={"new_books": -1}, when=book['created_at'])
+        content_index.remove_book(db, ObjectId(book_id))
+        ingest_jobs.cancel_for_book(db, ObjectId(book_id))
 
         flash('Xóa sách thành công', 'success')
     else:
@@ -409,8 +727,69 @@ def admin_delete_book(book_id):
 @app.route('/admin/users')
 @admin_required
 def admin_users():
-    users = list(db.users.find().sort("created_at", -1))
-    return render_template('admin_users.html', users=users)
+    filters, query = _admin_user_filters(request.args)
+    page_size, cursor = _page_args(app.config['ADMIN_PAGE_SIZE'], app.config['ADMIN_MAX_PAGE_SIZE'])
+    users, next_cursor = keyset_page(db.users, query, NEWEST_FIRST, ADMIN_USER_FIELDS,
+                                     page_size, cursor)
+    total = None if cursor else count_matches(db.users, query, app.config['SEARCH_COUNT_THRESHOLD'])
+    return render_template('admin_users.html', users=users, filters=filters,
+                           filter_args={k: v for k, v in filters.items() if v},
+                           per_page=page_size, next_cursor=next_cursor,
+                           is_first_page=not cursor, total=total)
+
+
+@app.route('/admin/profiles', methods=['GET', 'POST'])
+@admin_required
+def admin_profiles():
+    """Danh sách profile gần đây + tạo link profile có chữ ký cho một đường dẫn."""
+    if not app.config['PROFILING']:
+        flash('Profiling đang tắt (bật bằng PROFILING=1)', 'error')
+        return redirect(url_for('admin_dashboard'))
+    link = None
+    if request.method == 'POST':
+        path = request.form.get('path', '').strip()
+        path = path.split('?', 1)[0] if path.startswith('/') else ''
+        if not path:
+            flash('Nhập đường dẫn bắt đầu bằng "/", ví dụ /book/<id>', 'error')
+        else:
+            token = profiler.sign(app.secret_key, path, session['user_id'])
+            link = {"path": path, "token": token,
+                    "url": f"{path}?{profiler.QUERY_PARAM}={token}"}
+    return render_template('admin_profiles.html', link=link,
+                           profiles=profiler.list_profiles(app.config['PROFILE_DIR']),
+                           ttl_minutes=app.config['PROFILE_TOKEN_TTL'] // 60)
+
+
+@app.route('/admin/profiles/<profile_id>.prof')
+@admin_required
+def admin_download_profile(profile_id):
+    path = profiler.profile_path(app.config['PROFILE_DIR'], profile_id)
+    if path is None:
+        return "Không tìm thấy profile", 404
+    return send_local_file(os.path.abspath(path), as_attachment=True,
+                           mimetype='application/octet-stream')
+
+
+@app.route('/api/admin/users')
+@admin_required
+def api_admin_users():
+    """Trang tiếp theo của bảng người dùng (cùng bộ lọc) cho nút "Tải thêm"."""
+    _, query = _admin_user_filters(request.args)
+    page_size, cursor = _page_args(app.config['ADMIN_PAGE_SIZE'], app.config['ADMIN_MAX_PAGE_SIZE'])
+    users, next_cursor = keyset_page(db.users, query, NEWEST_FIRST, ADMIN_USER_FIELDS,
+                                     page_size, cursor)
+    return jsonify({
+        "items": [{
+            "id": str(user["_id"]),
+            "name": user.get("name", ""),
+            "email": user.get("email", ""),
+            "role": user.get("role"),
+            "status": user.get("status"),
+            "created_at": user["created_at"].isoformat() if user.get("created_at") else None,
+        } for user in users],
+        "html": render_template('_admin_user_rows.html', users=users),
+        "next_cursor": next_cursor,
+    })
 
 
 @app.route('/admin/users/toggle/<user_id>')
@@ -420,6 +799,7 @@ def admin_toggle_user(user_id):
     if user:
         new_status = "Blocked" if user.get('status') == "Active" else "Active"
         db.users.update_one({"_id": ObjectId(user_id)}, {"$set": {"status": new_status}})
+        auth_cache.invalidate(str(user["_id"]))
         flash(f'Đã {"khóa" if new_status == "Blocked" else "mở khóa"} tài khoản', 'success')
     return redirect(url_for('admin_users'))
 
@@ -428,15 +808,11 @@ def admin_toggle_user(user_id):
 @app.route('/dashboard')
 @login_required
 def user_dashboard():
-    recent_books = list(db.books.find().sort("created_at", -1).limit(6))
+    recent_books = list(catalog_db.books.find({}, BOOK_CARD_FIELDS).sort("created_at", -1).limit(6))
 
     user_id = ObjectId(session['user_id'])
-    favorites = list(db.favorites.find({"user_id": user_id}).limit(5))
-    favorite_books = []
-    for fav in favorites:
-        book = db.books.find_one({"_id": fav['book_id']})
-        if book:
-            favorite_books.append(book)
+    favorites = db.favorites.find({"user_id": user_id}, {"book_id": 1}).limit(5)
+    favorite_books = load_books(catalog_db, (fav['book_id'] for fav in favorites), BOOK_CARD_FIELDS)
 
     return render_template('user_dashboard.html',
                            recent_books=recent_books,
@@ -458,8 +834,48 @@ def search_books():
         except ValueError:
             pass
 
-    books = list(db.books.find(search_filter))
-    return render_template('search_books.html', books=books, query=query)
+    page_size, cursor = _page_args(app.config['SEARCH_PAGE_SIZE'], app.config['SEARCH_MAX_PAGE_SIZE'])
+
+    total = None
+    # Index trong bộ nhớ còn đang nạp ở luồng nền (worker vừa khởi động) -> dùng text index
+    if query and app.config['SEARCH_ENGINE'] == 'memory' and search_index.ensure_ready(db):
+        book_ids, next_cursor, matched = search_index.search_page(
+            query, page_size, cursor, year=search_filter.get("published_year"))
+        books = load_books(catalog_db, book_ids, BOOK_CARD_FIELDS)
+        if app.config['SEARCH_COUNT']:
+            total = (matched, False)
+    else:
+        if query:
+            text_filter = {k: v for k, v in search_filter.items() if k != "$text"}
+            books, next_cursor = text_search_page(catalog_db.books, query, text_filter, BOOK_CARD_FIELDS,
+                                                  page_size, cursor)
+        else:
+            books, next_cursor = keyset_page(catalog_db.books, search_filter, NEWEST_FIRST,
+                                             BOOK_CARD_FIELDS, page_size, cursor)
+        if app.config['SEARCH_COUNT']:
+            total = count_matches(catalog_db.books, search_filter, app.config['SEARCH_COUNT_THRESHOLD'])
+
+    # Khớp trong nội dung sách (chỉ ở trang đầu): số trang + đoạn trích có tô sáng
+    content_results = []
+    if query and not cursor:
+        try:
+            matches = content_index.search_content(catalog_db, query)
+        except pymongo.errors.OperationFailure as e:
+            # Thiếu text index của book_pages / truy vấn $text không hợp lệ: vẫn trả kết quả theo thông tin sách
+            print(f"Lỗi tìm trong nội dung sách: {e}")
+            matches = []
+        if matches:
+            book_filter = {"_id": {"$in": [m["book_id"] for m in matches]}}
+            if "published_year" in search_filter:
+                book_filter["published_year"] = search_filter["published_year"]
+            found = {b["_id"]: b for b in catalog_db.books.find(book_filter, {"title": 1, "author": 1})}
+            content_results = [dict(m, book=found[m["book_id"]])
+                               for m in matches if m["book_id"] in found]
+
+    return render_template('search_books.html', books=books, query=query,
+                           year=year_filter, per_page=page_size, next_cursor=next_cursor,
+                           is_first_page=not cursor, total=total,
+                           content_results=content_results)
 
 
 @app.route('/book/<book_id>')
@@ -472,23 +888,20 @@ def book_detail(book_id):
 
     # Cập nhật lịch sử đọc
     user_id = ObjectId(session['user_id'])
-    db.reading_history.update_one(
-        {"user_id": user_id, "book_id": ObjectId(book_id)},
-        {"$set": {"updated_at": datetime.now(), "last_page": 1}},
-        upsert=True
-    )
+    event_buffer.touch_history(user_id, book["_id"], datetime.now())
 
     is_favorite = db.favorites.find_one({"user_id": user_id, "book_id": ObjectId(book_id)}) is not None
 
-    # Nếu sách có preview đã lưu thì dùng, nếu không thử tạo nhanh (cho dữ liệu cũ)
+    # Nếu sách có preview đã lưu thì dùng; dữ liệu cũ chưa từng qua worker nền thì xếp job
+    # (một lần: enqueue đặt ingest_status). Sách đã xử lý mà preview rỗng (PDF toàn ảnh / scan)
+    # không xếp lại, nếu không mỗi lượt xem lại trích + index cả file.
     preview_text = book.get("preview")
-    if not preview_text and book.get("file_id"):
+    if not preview_text and book.get("file_id") and "ingest_status" not in book:
         try:
             file_obj = fs.get(ObjectId(book["file_id"]))
-            file_bytes = file_obj.read()
-            preview_text = extract_text_preview(file_bytes, file_obj.filename)
-        except Exception:
-            preview_text = None
+            schedule_ingest(book["_id"], file_obj._id, file_obj.filename)
+        except gridfs.NoFile:
+            pass
 
     return render_template('book_detail.html', book=book, is_favorite=is_favorite, preview_text=preview_text)
 
@@ -504,12 +917,8 @@ def preview_book(book_id):
     # Ưu tiên GridFS
     if book.get('file_id'):
         try:
-            file_obj = fs.get(ObjectId(book['file_id']))
-            return send_file(
-                io.BytesIO(file_obj.read()),
-                download_name=file_obj.filename,
-                as_attachment=False   # ✅ preview: không ép tải về
-            )
+            # ✅ preview: không ép tải về; stream theo chunk + Range để trình xem PDF tua được
+            return send_book_file(ObjectId(book['file_id']), as_attachment=False)
         except gridfs.NoFile:
             flash('File trong GridFS không tồn tại', 'error')
             return redirect(url_for('book_detail', book_id=book_id))
@@ -517,7 +926,7 @@ def preview_book(book_id):
     # Fallback: dữ liệu cũ lưu theo đường dẫn
     file_path = book.get('file_path')
     if file_path and os.path.isfile(file_path):
-        return send_file(file_path, as_attachment=False)
+        return send_local_file(file_path, as_attachment=False)
 
     flash('Không tìm thấy file sách', 'error')
     return redirect(url_for('book_detail', book_id=book_id))
@@ -526,15 +935,66 @@ def preview_book(book_id):
 # ---------- Ảnh bìa / hình ảnh từ GridFS ----------
 @app.route('/cover/<cover_id>')
 def get_cover(cover_id):
-    """Serve ảnh bìa từ GridFS (images bucket)."""
+    """
+    Serve ảnh bìa từ GridFS (images bucket), cache vĩnh viễn theo _id.
+    ?size=thumb|card|detail -> rendition sinh sẵn lúc upload (WebP nếu trình duyệt hỗ trợ);
+    không bao giờ resize trên đường request, thiếu rendition thì trả ảnh gốc.
+    """
     try:
-        grid_out = fs_images.get(ObjectId(cover_id))
-        ct = getattr(grid_out, "content_type", None) or "image/jpeg"
-        return send_file(io.BytesIO(grid_out.read()), mimetype=ct)
+        cover_oid = ObjectId(cover_id)
+        size = request.args.get('size')
+        if size in RENDITIONS:
+            fmt = preferred_format(request.headers.get('Accept'))
+            etag = f"{cover_oid}-{size}-{fmt}"
+            not_modified = image_not_modified(etag, vary='Accept')
+            if not_modified is not None:
+                return not_modified
+            cached = cover_cache.get(etag)
+            if cached is not None:
+                rv = _send_cached_cover(cached, etag)
+            else:
+                rendition = find_rendition(db, cover_oid, size, fmt)
+                if not rendition:
+                    # Sách cũ chưa backfill: ảnh gốc, cache ngắn để sau này nhận rendition
+                    return _send_cover(cover_oid, cover_oid, str(cover_oid), immutable=False)
+                rv = _load_cover(rendition['_id'], cover_oid, etag)
+            rv.vary.add('Accept')
+            return rv
+
+        # Client đã có ảnh -> 304 mà không chạm MongoDB
+        not_modified = image_not_modified(cover_oid)
+        if not_modified is not None:
+            return not_modified
+        return _send_cover(cover_oid, cover_oid, str(cover_oid))
     except Exception:
         return "Không tìm thấy ảnh bìa", 404
 
 
+def _send_cached_cover(cached, etag, immutable=True):
+    data, mimetype, last_modified = cached
+    return send_image_bytes(data, mimetype, etag, last_modified, immutable)
+
+
+def _send_cover(file_id, cover_oid, etag, immutable=True):
+    """Ưu tiên cache ảnh bìa trong worker, trượt thì đọc GridFS."""
+    cached = cover_cache.get(etag)
+    if cached is not None:
+        return _send_cached_cover(cached, etag, immutable)
+    return _load_cover(file_id, cover_oid, etag, immutable)
+
+
+def _load_cover(file_id, cover_oid, etag, immutable=True):
+    """Đọc ảnh từ GridFS; ảnh đủ nhỏ thì nạp vào cache (ảnh lớn vẫn stream như cũ)."""
+    grid_out = fs_images.get(file_id)
+    if grid_out.length > cover_cache.max_object_bytes:
+        return send_gridfs_image(grid_out, etag=etag, immutable=immutable)
+    data = grid_out.read()
+    metrics.GRIDFS_BYTES.inc(len(data), bucket="images")
+    mimetype = getattr(grid_out, "content_type", None) or "image/jpeg"
+    cover_cache.put(etag, cover_oid, data, mimetype, grid_out.upload_date)
+    return send_image_bytes(data, mimetype, etag, grid_out.upload_date, immutable)
+
+
 @app.route('/image/<image_id>')
 def serve_image(image_id):
     """Alias để tương thích với template dùng /image/<id>."""
@@ -551,21 +1011,13 @@ def download_book(book_id):
 
     # Log download
     user_id = ObjectId(session['user_id'])
-    db.downloads.insert_one({
-        "user_id": user_id,
-        "book_id": ObjectId(book_id),
-        "downloaded_at": datetime.now()
-    })
+    event_buffer.record_download(user_id, book["_id"], datetime.now())
 
     # Ưu tiên GridFS
     if book.get('file_id'):
         try:
-            file_obj = fs.get(ObjectId(book['file_id']))
-            return send_file(
-                io.BytesIO(file_obj.read()),
-                download_name=file_obj.filename,
-                as_attachment=True
-            )
+            # Stream theo chunk, hỗ trợ Range để tải tiếp khi bị ngắt
+            return send_book_file(ObjectId(book['file_id']), as_attachment=True)
         except gridfs.NoFile:
             flash('File trong GridFS không tồn tại', 'error')
             return redirect(url_for('book_detail', book_id=book_id))
@@ -573,7 +1025,7 @@ def download_book(book_id):
     # Fallback: dữ liệu cũ lưu theo đường dẫn
     file_path = book.get('file_path')
     if file_path and os.path.isfile(file_path):   # ✅ dùng isfile để chắc chắn
-        return send_file(file_path, as_attachment=True)
+        return send_local_file(file_path, as_attachment=True)
 
     flash('Không tìm thấy file sách', 'error')
     return redirect(url_for('book_detail', book_id=book_id))
@@ -584,14 +1036,19 @@ def toggle_favorite(book_id):
     existing = db.favorites.find_one({"user_id": user_id, "book_id": ObjectId(book_id)})
 
     if existing:
-        db.favorites.delete_one({"_id": existing['_id']})
+        if db.favorites.delete_one({"_id": existing['_id']}).deleted_count:
+            dashboard_stats.bump(db, totals={"favorites": -1})
         message = 'Đã bỏ yêu thích'
     else:
-        db.favorites.insert_one({
-            "user_id": user_id,
-            "book_id": ObjectId(book_id),
-            "created_at": datetime.now()
-        })
+        try:
+            db.favorites.insert_one({
+                "user_id": user_id,
+                "book_id": ObjectId(book_id),
+                "created_at": datetime.now()
+            })
+            dashboard_stats.bump(db, totals={"favorites": 1})
+        except pymongo.errors.DuplicateKeyError:
+            pass    # bấm hai lần song song: index unique (user_id, book_id) giữ một bản
         message = 'Đã thêm vào yêu thích'
 
     flash(message, 'success')
@@ -603,31 +1060,19 @@ def toggle_favorite(book_id):
 def my_library():
     user_id = ObjectId(session['user_id'])
 
-    downloads = list(db.downloads.find({"user_id": user_id}).sort("downloaded_at", -1))
-    downloaded_books = []
-    for d in downloads:
-        book = db.books.find_one({"_id": d['book_id']})
-        if book:
-            downloaded_books.append(book)
-
-    favorites = list(db.favorites.find({"user_id": user_id}).sort("created_at", -1))
-    favorite_books = []
-    for fav in favorites:
-        book = db.books.find_one({"_id": fav['book_id']})
-        if book:
-            favorite_books.append(book)
-
-    history = list(db.reading_history.find({"user_id": user_id}).sort("updated_at", -1).limit(10))
-    history_books = []
-    for h in history:
-        book = db.books.find_one({"_id": h['book_id']})
-        if book:
-            history_books.append(book)
+    # Gom book_id của cả ba danh sách, nạp sách bằng một truy vấn $in
+    loader = BookLoader(catalog_db, BOOK_CARD_FIELDS)
+    downloads = db.downloads.find({"user_id": user_id}, {"book_id": 1}).sort("downloaded_at", -1)
+    downloaded = loader.want(d['book_id'] for d in downloads)
+    favorites = db.favorites.find({"user_id": user_id}, {"book_id": 1}).sort("created_at", -1)
+    favorited = loader.want(fav['book_id'] for fav in favorites)
+    history = db.reading_history.find({"user_id": user_id}, {"book_id": 1}).sort("updated_at", -1).limit(10)
+    read = loader.want(h['book_id'] for h in history)
 
     return render_template('my_library.html',
-                           downloaded_books=downloaded_books,
-                           favorite_books=favorite_books,
-                           history_books=history_books)
+                           downloaded_books=loader.resolve(downloaded),
+                           favorite_books=loader.resolve(favorited),
+                           history_books=loader.resolve(read))
 
 
 @app.route('/profile', methods=['GET', 'POST'])
@@ -671,6 +1116,28 @@ def profile():
 
 # ==================== APIs PHỤ TRỢ ====================
 
+@app.route('/api/search/suggest')
+@login_required
+def api_search_suggest():
+    """Gợi ý tên sách / tác giả khi gõ: trả lời từ index trong bộ nhớ, không truy vấn theo từng phím."""
+    prefix = request.args.get('q', '').strip()
+    try:
+        limit = max(1, min(int(request.args.get('limit', 8)), 20))
+    except ValueError:
+        limit = 8
+    if not prefix:
+        return jsonify([])
+    if not search_index.ensure_ready(db):
+        return jsonify([])          # index đang nạp ở luồng nền: chưa có gợi ý
+    suggestions = search_index.suggestions(prefix, limit)
+    for item in suggestions:
+        if item["type"] == "book":
+            item["url"] = url_for('book_detail', book_id=item["book_id"])
+        else:
+            item["url"] = url_for('search_books', q=item["label"])
+    return jsonify(suggestions)
+
+
 @app.route('/api/books/related/<book_id>')
 @login_required
 def api_related_books(book_id):
@@ -683,7 +1150,7 @@ def api_related_books(book_id):
     if not author:
         return jsonify([])
 
-    related = list(db.books.find({
+    related = list(catalog_db.books.find({
         "author": author,
         "_id": {"$ne": ObjectId(book_id)}
     }).sort("created_at", -1).limit(12))
@@ -700,38 +1167,171 @@ def api_related_books(book_id):
     return jsonify(result)
 
 
+# ---------- Upload sách lớn theo chunk (có thể tiếp tục) ----------
+@app.route('/api/uploads', methods=['POST'])
+@admin_required
+def api_upload_create():
+    """Tạo phiên upload: JSON {filename, size, content_type?, book_id?}."""
+    payload = request.get_json(silent=True) or {}
+    filename = secure_filename(payload.get('filename') or '')
+    if not filename or not allowed_file(filename, app.config['ALLOWED_EXTENSIONS']):
+        raise UploadError('File sách không hợp lệ')
+    try:
+        total_size = int(payload.get('size') or 0)
+    except (TypeError, ValueError):
+        raise UploadError('Kích thước file không hợp lệ')
+
+    book_id = None
+    if payload.get('book_id'):
+        try:
+            book_id = ObjectId(payload['book_id'])
+        except Exception:
+            raise UploadError('Không tìm thấy sách', 404)
+        if not db.books.find_one({"_id": book_id}, {"_id": 1}):
+            raise UploadError('Không tìm thấy sách', 404)
+
+    upload = resumable_upload.create_session(
+        db, filename, total_size, app.config['UPLOAD_CHUNK_SIZE'],
+        user_id=ObjectId(session['user_id']),
+        content_type=payload.get('content_type'),
+        book_id=book_id
+    )
+    return jsonify(resumable_upload.session_status(upload)), 201
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+@admin_required
+def api_upload_status(upload_id):
+    """Trạng thái phiên: danh sách chunk đã nhận / còn thiếu để tiếp tục upload."""
+    upload = resumable_upload.get_session(db, upload_id)
+    return jsonify(resumable_upload.session_status(upload))
+
+
+@app.route('/api/uploads/<upload_id>/chunks/<int:n>', methods=['PUT'])
+@admin_required
+def api_upload_chunk(upload_id, n):
+    """Nhận chunk n (thân request là dữ liệu thô, header X-Chunk-SHA256 để kiểm tra)."""
+    upload = resumable_upload.get_session(db, upload_id)
+    if request.content_length is None or request.content_length > upload['chunk_size']:
+        raise UploadError('Chunk quá lớn hoặc thiếu Content-Length', 413)
+    digest = resumable_upload.put_chunk(
+        blob_db, upload, n, request.get_data(cache=False),
+        request.headers.get('X-Chunk-SHA256')
+    )
+    return jsonify({'n': n, 'sha256': digest})
+
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+@admin_required
+def api_upload_finalize(upload_id):
+    """
+    Hoàn tất upload và gắn file vào sách.
+    Phiên có book_id -> thay file của sách đó; ngược lại tạo sách mới từ JSON
+    {title, author, description, published_year}.
+    """
+    upload = resumable_upload.get_session(db, upload_id)
+    if upload['status'] == 'finalized' and upload.get('book_id'):
+        return jsonify(resumable_upload.session_status(upload))   # gọi lại finalize: không tạo sách trùng
+    payload = request.get_json(silent=True) or {}
+    if not upload.get('book_id'):
+        try:
+            book_fields = {
+                "title": payload['title'].strip(),
+                "author": payload['author'].strip(),
+                "description": (payload.get('description') or '').strip(),
+                "published_year": int(payload['published_year']),
+            }
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise UploadError('Thiếu thông tin sách (title, author, published_year)')
+
+    file_id, deduplicated = resumable_upload.finalize(blob_db, upload)
+
+    derived = reuse_derived_fields(file_id, deduplicated)
+    derived_update = dict(derived, ingest_status="done") if derived else {"preview": None, "page_count": None}
+
+    if upload.get('book_id'):
+        book = db.books.find_one({"_id": upload['book_id']})
+        if not book:
+            raise UploadError('Không tìm thấy sách', 404)
+        db.books.update_one({"_id": book["_id"]},
+                            {"$set": dict(derived_update, file_id=file_id)})
+        # Bỏ tham chiếu tới file cũ (kể cả khi trùng nội dung: finalize đã tăng ref_count)
+        old_file_id = book.get('file_id')
+        if old_file_id:
+            if release_book_blob(db, fs, old_file_id) and book_file_cache is not None:
+                book_file_cache.invalidate(old_file_id)
+        book_id = book["_id"]
+    else:
+        # Gắn id sách vào phiên trước (nguyên tử): finalize gọi lại sau khi blob đã đăng ký
+        # không tạo thêm sách thứ hai
+        book_id = ObjectId()
+        if not db.upload_sessions.find_one_and_update(
+                {"_id": upload["_id"], "book_id": None}, {"$set": {"book_id": book_id}}):
+            return jsonify(resumable_upload.session_status(resumable_upload.get_session(db, upload_id)))
+        db.books.insert_one(dict(
+            book_fields,
+            _id=book_id,
+            file_id=file_id,
+            cover_id=None,
+            cover_image=None,
+            created_at=datetime.now(),
+            **derived_update
+        ))
+        dashboard_stats.bump(db, totals={"books": 1}, daily={"new_books": 1})
+        upload['book_id'] = book_id
+    search_index.book_changed(db, book_id)
+    schedule_ingest(book_id, file_id, upload['filename'], preview=not derived)
+
+    status = resumable_upload.session_status(upload)
+    status['deduplicated'] = deduplicated
+    return jsonify(status)
+
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@admin_required
+def api_upload_abort(upload_id):
+    upload = resumable_upload.get_session(db, upload_id)
+    resumable_upload.abort(db, upload)
+    return jsonify({'status': 'aborted'})
+
+
+@app.route('/api/books/<book_id>/ingest-status')
+@admin_required
+def api_ingest_status(book_id):
+    """Trạng thái xử lý nền của sách (trang admin poll tới khi done/failed)."""
+    status = ingest_jobs.job_status(db, ObjectId(book_id))
+    if status is None:
+        book = db.books.find_one({"_id": ObjectId(book_id)}, {"ingest_status": 1})
+        status = {"book_id": book_id, "status": (book or {}).get("ingest_status") or "done"}
+    return jsonify(status)
+
+
+@app.route('/api/cover-cache/stats')
+@admin_required
+def cover_cache_stats():
+    """Bộ đếm cache ảnh bìa của worker hiện tại (hit/miss/eviction); giám sát tự động dùng /metrics."""
+    return jsonify(cover_cache.stats())
+
+
 @app.route('/api/test-connection')
 def test_connection():
     """API kiểm tra MongoDB + thống kê collections + GridFS."""
     try:
         db.command('ping')
-        collections = db.list_collection_names()
-        stats = {}
-        for c in ['users', 'books', 'downloads', 'favorites', 'reading_history']:
-            stats[c] = db[c].count_documents({}) if c in collections else 0
-
-        # GridFS stats
-        files_count = db.fs.files.count_documents({})
-        total_size_cursor = db.fs.files.aggregate([
-            {"$group": {"_id": None, "total": {"$sum": "$length"}}}
-        ])
-        total_size_value = 0
-        for g in total_size_cursor:
-            total_size_value = g.get("total", 0)
-
-        images_count = db.images.files.count_documents({})
-        images_size_cursor = db.images.files.aggregate([
-            {"$group": {"_id": None, "total": {"$sum": "$length"}}}
-        ])
-        images_total_size = 0
-        for g in images_size_cursor:
-            images_total_size = g.get("total", 0)
+        # Số liệu lấy từ bộ đếm duy trì sẵn (dashboard_stats), không $group trên GridFS
+        totals, _ = dashboard_stats.read_dashboard(db)
+        stats = {c: totals[c] for c in ['users', 'books', 'downloads', 'favorites', 'reading_history']}
+        files_count = totals['files_count']
+        total_size_value = totals['files_bytes']
+        images_count = totals['images_count']
+        images_total_size = totals['images_bytes']
 
         return jsonify({
             'status': 'success',
             'message': 'Kết nối MongoDB thành công',
-            'database': 'digital_library',
+            'database': data.db_name,
             'collections': stats,
+            'pools': data.describe(),
             'gridfs': {
                 'files_count': files_count,
                 'files_total_bytes': total_size_value,
@@ -744,6 +1344,10 @@ def test_connection():
 
 
 # ==================== ERROR HANDLERS ====================
+@app.errorhandler(UploadError)
+def upload_error(error):
+    return jsonify({'status': 'error', 'message': error.message}), error.status
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('404.html'), 404
@@ -755,22 +1359,11 @@ def internal_error(error):
 
 # ==================== MAIN ====================
 if __name__ == '__main__':
-    # Tạo admin mặc định nếu chưa có
-    admin_exists = db.users.find_one({"role": "Admin"})
-    if not admin_exists:
-        admin_data = {
-            "name": "Administrator",
-            "email": "admin@library.com",
-            "password_hash": generate_password_hash("admin123"),
-            "role": "Admin",
-            "status": "Active",
-            "created_at": datetime.now()
-        }
-        db.users.insert_one(admin_data)
-        print("✅ Đã tạo tài khoản admin mặc định:")
-        print("   Email: admin@library.com")
-        print("   Password: admin123")
+    create_app({"QUERY_MONITOR": True})
 
+    # Index + admin mặc định không còn tạo lúc khởi động: chạy python bootstrap.py all
+    print("💡 Lần đầu chạy: python bootstrap.py all (tạo index + tài khoản admin)")
+    print("💡 Production (nhiều process): python serve.py")
     print("🚀 Ứng dụng Thư viện Số (GridFS) đang khởi động...")
     print("📍 Truy cập: http://localhost:5000")
     print("🔧 Test MongoDB: http://localhost:5000/api/test-connection")
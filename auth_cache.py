@@ -0,0 +1,63 @@
+# auth_cache.py - Cache quyền truy cập (role, status) theo user_id trong từng worker
+import threading
+import time
+from collections import OrderedDict
+
+
+class AuthCache:
+    """
+    Giữ {role, status} của người dùng trong ttl giây để login_required / admin_required
+    không phải đọc db.users ở mỗi request.
+
+    Worker đổi quyền / khóa tài khoản gọi invalidate() nên có hiệu lực ngay trong worker đó;
+    các worker khác thấy thay đổi muộn nhất sau ttl (mặc định ngắn).
+    """
+
+    def __init__(self, ttl=15.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()       # user_id -> (hết hạn lúc, context)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def put(self, user_id, context):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, context)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
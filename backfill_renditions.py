@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Script sinh rendition ảnh bìa (thumb/card/detail × WebP/JPEG) cho sách đã có
+Chạy một lần sau khi nâng cấp, hoặc với --force để sinh lại toàn bộ
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pymongo import MongoClient
+import gridfs
+
+from image_pipeline import RENDITIONS, FORMATS, store_renditions, delete_renditions
+import dashboard_stats
+import data_access
+
+_SETTINGS = data_access.settings_from_env()
+MONGO_URI = _SETTINGS["MONGO_URI"]
+DB_NAME = _SETTINGS["MONGO_DB"]
+
+# Mỗi process worker có kết nối riêng (MongoClient không an toàn khi fork)
+_db = None
+_fs_images = None
+
+
+def _init_worker():
+    global _db, _fs_images
+    client = MongoClient(MONGO_URI)
+    _db = client[DB_NAME]
+    _fs_images = gridfs.GridFS(_db, collection="images")
+
+
+def _process_book(book_id, cover_id, force):
+    """Sinh rendition cho một sách (chạy trong process worker)."""
+    expected = len(RENDITIONS) * len(FORMATS)
+    existing = _db.images.files.count_documents({"metadata.original_id": cover_id})
+    if existing >= expected and not force:
+        return book_id, "skip"
+
+    grid_out = _fs_images.get(cover_id)
+    image_bytes = grid_out.read()
+    delete_renditions(_db, _fs_images, cover_id)
+    renditions = store_renditions(_fs_images, image_bytes, cover_id,
+                                  book_id=book_id, filename=grid_out.filename or "cover")
+    _db.books.update_one({"_id": book_id}, {"$set": {"cover_renditions": renditions}})
+    return book_id, "ok"
+
+
+def backfill(workers, force=False):
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+    client.admin.command('ping')
+    db = client[DB_NAME]
+
+    query = {"cover_id": {"$ne": None}}
+    if not force:
+        query["cover_renditions"] = {"$in": [None, {}]}
+    books = list(db.books.find(query, {"_id": 1, "cover_id": 1}))
+    client.close()
+    print(f"🎨 Có {len(books)} sách cần sinh rendition ảnh bìa ({workers} process)")
+
+    done = skipped = failed = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = {
+            pool.submit(_process_book, b["_id"], b["cover_id"], force): b["_id"]
+            for b in books
+        }
+        for future in as_completed(futures):
+            try:
+                _, status = future.result()
+                if status == "skip":
+                    skipped += 1
+                else:
+                    done += 1
+            except Exception as e:
+                failed += 1
+                print(f"   ❌ Lỗi sinh rendition cho sách {futures[future]}: {e}")
+
+    print(f"✅ Xong: {done} sách, bỏ qua {skipped}, lỗi {failed}")
+
+    # Rendition được ghi thẳng vào GridFS: tính lại số ảnh / dung lượng cho dashboard
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+    dashboard_stats.rebuild_storage(client[DB_NAME])
+    client.close()
+    return failed == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sinh rendition ảnh bìa cho sách đã có")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="số process song song (mặc định: số CPU)")
+    parser.add_argument("--force", action="store_true",
+                        help="sinh lại kể cả khi sách đã có rendition")
+    args = parser.parse_args()
+
+    try:
+        ok = backfill(args.workers, force=args.force)
+    except KeyboardInterrupt:
+        print("\n⏹️  Đã hủy bởi người dùng")
+        ok = False
+    except Exception as e:
+        print(f"❌ Lỗi: {e}")
+        ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
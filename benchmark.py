@@ -0,0 +1,626 @@
+# benchmark.py - Đo tải HTTP các route nóng (tìm kiếm, chi tiết sách, ảnh bìa, tải sách, thư viện, dashboard)
+#
+#     python benchmark.py seed --books 5000 --users 50         # dữ liệu giả vào database riêng (--db)
+#     python benchmark.py run --concurrency 1,8,32 --duration 15
+#     python benchmark.py run --url http://host:5000 --server-pid 1234   # server đang chạy sẵn
+#     python benchmark.py run --inprocess --books 2000          # không cần mongod (cần mongomock)
+#     python benchmark.py compare bench_results/a.json bench_results/b.json
+#
+# Mặc định `run` tự khởi động server production (serve.py) trỏ vào database benchmark
+# (--db, mặc định digital_library_bench; không đọc MONGO_DB để không đụng dữ liệu thật).
+# seed xóa sạch database đích: từ chối nếu trong đó có người dùng không phải @bench.local
+# (trừ khi thêm --i-know-this-drops-everything).
+# Mỗi mức concurrency gồm một pha riêng cho từng route rồi một pha trộn theo ROUTE_MIX;
+# kết quả: throughput, p50/p95/p99, lỗi và RSS của server (tổng các process) theo từng pha,
+# lưu JSON vào bench_results/ để so sánh giữa các lần chạy.
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+from urllib.parse import urlencode, urlsplit
+
+BENCH_DB = "digital_library_bench"
+BENCH_PASSWORD = "bench123"
+BENCH_EMAIL = re.compile(r"@bench\.local$")
+RESULTS_DIR = "bench_results"
+
+# Tỉ lệ request trong pha trộn (ước lượng lưu lượng thật: đọc danh mục nhiều, tải file ít)
+ROUTE_MIX = {
+    "search": 30,
+    "book": 25,
+    "cover": 20,
+    "my_library": 10,
+    "dashboard": 10,
+    "download": 5,
+}
+
+WORDS = ("lập trình python cơ bản nâng cao lịch sử việt nam văn học kinh tế toán học vật lý "
+         "hóa học sinh học triết học tâm lý giáo dục âm nhạc hội họa du lịch nấu ăn y học "
+         "dữ liệu mạng máy tính thuật toán quản trị khởi nghiệp marketing thiết kế kiến trúc").split()
+SURNAMES = "Nguyễn Trần Lê Phạm Hoàng Huỳnh Phan Vũ Võ Đặng Bùi Đỗ Hồ Ngô Dương Lý".split()
+GIVEN = "An Bình Chi Dũng Giang Hà Hải Hạnh Hùng Khoa Lan Linh Minh Nam Phương Quân Thảo Trang Tuấn Vy".split()
+
+
+# ==================== DỮ LIỆU GIẢ ====================
+def _cover_bytes(rng):
+    from PIL import Image, ImageDraw
+    img = Image.new("RGB", (600, 800), tuple(rng.randrange(40, 220) for _ in range(3)))
+    ImageDraw.Draw(img).rectangle((60, 300, 540, 420), fill=(255, 255, 255))
+    out = BytesIO()
+    img.save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+def seed(db, fs, fs_images, books=5000, users=50, files=20, covers=30, file_kb=256,
+         per_user=20, seed_value=42, verbose=True, force=False):
+    """
+    Xóa database benchmark rồi tạo danh mục giả; trả số lượng đã tạo.
+    Database có người dùng thật (email không phải @bench.local) -> từ chối, trừ khi force.
+    """
+    import blob_store
+    import dashboard_stats
+    import schema
+    from image_pipeline import store_renditions
+    from werkzeug.security import generate_password_hash
+
+    if not force:
+        real_user = db.users.find_one({"email": {"$not": BENCH_EMAIL}}, {"email": 1})
+        if real_user is not None:
+            raise SystemExit(f"❌ Database {db.name} có người dùng thật ({real_user.get('email')}) - "
+                             f"không xóa. Dùng --db khác hoặc --i-know-this-drops-everything")
+
+    rng = random.Random(seed_value)
+    for name in db.list_collection_names():
+        db.drop_collection(name)
+
+    file_ids = []
+    for i in range(files):
+        body = (f"Sách mẫu số {i}\n".encode("utf-8") + os.urandom(16).hex().encode()) \
+            * max(1, file_kb * 1024 // 48)
+        file_id, _ = blob_store.store_book_blob(db, fs, BytesIO(body), f"bench_{i}.txt", "text/plain")
+        file_ids.append(file_id)
+
+    cover_ids = []
+    for i in range(covers):
+        data = _cover_bytes(rng)
+        cover_id = fs_images.put(data, filename=f"bench_{i}.jpg", content_type="image/jpeg")
+        store_renditions(fs_images, data, cover_id, filename=f"bench_{i}.jpg")
+        cover_ids.append(cover_id)
+
+    authors = [f"{rng.choice(SURNAMES)} {rng.choice(GIVEN)} {rng.choice(GIVEN)}"
+               for _ in range(max(1, books // 20))]
+    start = datetime.now() - timedelta(days=365)
+    docs = []
+    for i in range(books):
+        title = " ".join(rng.sample(WORDS, rng.randint(2, 5))).capitalize()
+        docs.append({
+            "title": title,
+            "author": rng.choice(authors),
+            "description": " ".join(rng.choices(WORDS, k=40)),
+            "published_year": rng.randint(1950, 2025),
+            "file_id": file_ids[i % len(file_ids)],
+            "cover_id": cover_ids[i % len(cover_ids)],
+            "cover_image": None,
+            "preview": " ".join(rng.choices(WORDS, k=120)),
+            "page_count": None,
+            "ingest_status": "done",
+            "created_at": start + timedelta(seconds=i * 365 * 86400 // max(1, books)),
+        })
+    book_ids = db.books.insert_many(docs).inserted_ids
+    for file_id in file_ids:
+        refs = sum(1 for d in docs if d["file_id"] == file_id)
+        db.fs.files.update_one({"_id": file_id}, {"$set": {"ref_count": refs}})
+
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    user_ids = db.users.insert_many([{
+        "name": f"Bench {i}",
+        "email": f"bench{i}@bench.local",
+        "password_hash": password_hash,
+        "role": "User",
+        "status": "Active",
+        "created_at": start,
+    } for i in range(users)]).inserted_ids
+
+    now = datetime.now()
+    favorites, downloads, history = [], [], []
+    for user_id in user_ids:
+        for j, book_id in enumerate(rng.sample(book_ids, min(per_user, len(book_ids)))):
+            when = now - timedelta(hours=j)
+            favorites.append({"user_id": user_id, "book_id": book_id, "created_at": when})
+            history.append({"user_id": user_id, "book_id": book_id, "last_page": 1, "updated_at": when})
+            downloads.append({"user_id": user_id, "book_id": book_id, "downloaded_at": when})
+    for name, rows in (("favorites", favorites), ("reading_history", history), ("downloads", downloads)):
+        if rows:
+            db[name].insert_many(rows)
+
+    schema.apply_indexes(db, verbose=False)
+    dashboard_stats.rebuild(db)
+    counts = {"books": books, "users": users, "files": files, "covers": covers,
+              "file_kb": file_kb, "per_user": per_user}
+    if verbose:
+        print(f"✅ Đã tạo dữ liệu benchmark: {counts}")
+    return counts
+
+
+def _catalog(db):
+    """Những id / từ khóa mà client dùng để tạo request."""
+    books = list(db.books.find({}, {"_id": 1, "cover_id": 1}).limit(20000))
+    users = [u["email"] for u in db.users.find({"email": {"$regex": r"@bench\.local$"}}, {"email": 1})]
+    if not books or not users:
+        raise SystemExit("❌ Chưa có dữ liệu benchmark - chạy: python benchmark.py seed")
+    return {
+        "book_ids": [str(b["_id"]) for b in books],
+        "cover_ids": [str(b["cover_id"]) for b in books if b.get("cover_id")],
+        "users": users,
+    }
+
+
+# ==================== CLIENT ====================
+class Client:
+    """Một người dùng ảo: một kết nối keep-alive + cookie phiên đăng nhập."""
+
+    def __init__(self, base_url, email, timeout=30):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.email = email
+        self.cookie = None
+        self.conn = None
+
+    def _connect(self):
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, body=None, headers=None):
+        """Trả (status, số byte thân); tự kết nối lại khi server đóng kết nối keep-alive."""
+        headers = dict(headers or {})
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        for attempt in range(2):
+            if self.conn is None:
+                self._connect()
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                size = 0
+                while True:
+                    block = response.read(64 * 1024)
+                    if not block:
+                        break
+                    size += len(block)
+                cookie = response.getheader("Set-Cookie")
+                if cookie and cookie.startswith("session="):
+                    self.cookie = cookie.split(";", 1)[0]
+                if response.getheader("Connection", "").lower() == "close":
+                    self.close()
+                return response.status, size
+            except (http.client.HTTPException, ConnectionError, socket.timeout):
+                self.close()
+                if attempt:
+                    raise
+
+    def login(self):
+        status, _ = self.request("POST", "/login",
+                                 urlencode({"email": self.email, "password": BENCH_PASSWORD}),
+                                 {"Content-Type": "application/x-www-form-urlencoded"})
+        if status != 302 or not self.cookie:
+            raise RuntimeError(f"Đăng nhập {self.email} thất bại (HTTP {status})")
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def route_request(route, catalog, rng):
+    """(method, path, headers) cho một request của route."""
+    if route == "search":
+        if rng.random() < 0.2:
+            return "GET", "/search", None
+        query = " ".join(rng.sample(WORDS, rng.choice((1, 1, 2))))
+        return "GET", "/search?" + urlencode({"q": query}), None
+    if route == "book":
+        return "GET", f"/book/{rng.choice(catalog['book_ids'])}", None
+    if route == "cover":
+        return ("GET", f"/cover/{rng.choice(catalog['cover_ids'])}?size=card",
+                {"Accept": "image/webp,image/*"})
+    if route == "download":
+        return "GET", f"/download/{rng.choice(catalog['book_ids'])}", None
+    if route == "my_library":
+        return "GET", "/my-library", None
+    if route == "dashboard":
+        return "GET", "/dashboard", None
+    raise ValueError(route)
+
+
+def percentile(sorted_values, p):
+    """Phân vị theo hạng gần nhất (sorted_values đã sắp xếp tăng dần)."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(p / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(samples, elapsed):
+    """samples: [(latency_s, ok, bytes)] -> thống kê của một route."""
+    latencies = sorted(s[0] * 1000 for s in samples)
+    errors = sum(1 for s in samples if not s[1])
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": _round(percentile(latencies, 50)),
+        "p95_ms": _round(percentile(latencies, 95)),
+        "p99_ms": _round(percentile(latencies, 99)),
+        "mean_ms": _round(sum(latencies) / len(latencies)) if latencies else None,
+        "max_ms": _round(latencies[-1]) if latencies else None,
+        "bytes": sum(s[2] for s in samples),
+    }
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+# ==================== RSS CỦA SERVER ====================
+def _children(pid):
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return []
+    result = []
+    for task in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                result += [int(c) for c in f.read().split()]
+        except OSError:
+            pass
+    return result
+
+
+def process_tree_rss(pid):
+    """Tổng RSS (byte) của process và mọi process con (đọc /proc - chỉ Linux; khác trả None)."""
+    if pid is None or not os.path.exists(f"/proc/{pid}"):
+        return None
+    total = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+        stack += _children(current)
+    return total
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            rss = process_tree_rss(self.pid)
+            if rss is not None:
+                self.samples.append(rss)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        rss = process_tree_rss(self.pid)
+        if rss is not None:
+            self.samples.append(rss)
+        if not self.samples:
+            return None
+        mb = 1024 * 1024
+        return {"start_mb": round(self.samples[0] / mb, 1),
+                "peak_mb": round(max(self.samples) / mb, 1),
+                "end_mb": round(self.samples[-1] / mb, 1)}
+
+
+# ==================== CHẠY TẢI ====================
+def run_phase(base_url, catalog, routes, concurrency, duration, warmup, server_pid, seed_value=0):
+    """
+    Một pha: concurrency người dùng ảo gửi request liên tục trong warmup + duration giây
+    (chỉ tính kết quả sau warmup). routes: {route: trọng số}.
+    """
+    names = list(routes)
+    weights = [routes[name] for name in names]
+    samples = {name: [] for name in names}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(concurrency + 1)
+    times = {}
+    failures = []
+
+    def worker(index):
+        rng = random.Random(seed_value * 1000 + index)
+        client = Client(base_url, catalog["users"][index % len(catalog["users"])])
+        try:
+            client.login()
+        except Exception as e:
+            failures.append(str(e))
+        start_barrier.wait()
+        local = {name: [] for name in names}
+        while time.perf_counter() < times["end"]:
+            route = rng.choices(names, weights)[0]
+            method, path, headers = route_request(route, catalog, rng)
+            t0 = time.perf_counter()
+            try:
+                status, size = client.request(method, path, headers=headers)
+                ok = status < 400 and not (status == 302 and route != "download")
+            except Exception:
+                size, ok = 0, False
+            t1 = time.perf_counter()
+            if t0 >= times["measure"]:
+                local[route].append((t1 - t0, ok, size))
+        client.close()
+        with lock:
+            for name, rows in local.items():
+                samples[name].extend(rows)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    now = time.perf_counter()
+    times["measure"] = now + warmup
+    times["end"] = times["measure"] + duration
+    start_barrier.wait()
+    time.sleep(max(0.0, times["measure"] - time.perf_counter()))
+    sampler = RssSampler(server_pid)
+    sampler.start()
+    for thread in threads:
+        thread.join()
+    rss = sampler.stop()
+    if failures:
+        raise RuntimeError(failures[0])
+
+    every = [row for rows in samples.values() for row in rows]
+    result = summarize(every, duration)
+    result["routes"] = {name: summarize(rows, duration) for name, rows in samples.items() if rows}
+    result["server_rss"] = rss
+    return result
+
+
+def _wait_for_server(base_url, timeout=60):
+    parts = urlsplit(base_url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((parts.hostname, parts.port or 80), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.3)
+    return False
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, db_name):
+    """Chạy serve.py (gunicorn) với database benchmark; trả Popen."""
+    env = dict(os.environ, MONGO_DB=db_name, PORT=str(port), WEB_ACCESS_LOG=os.devnull,
+               SEARCH_INDEX_SNAPSHOT=os.path.abspath(os.path.join(RESULTS_DIR, f"{db_name}.snapshot")))
+    here = os.path.dirname(os.path.abspath(__file__))
+    return subprocess.Popen([sys.executable, os.path.join(here, "serve.py")], cwd=here, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+
+def start_inprocess(args):
+    """
+    Server Werkzeug nhiều thread trong chính process này, MongoDB thay bằng mongomock.
+    Chỉ để so sánh tương đối: mongomock không có $text (khớp nội dung trong /search báo lỗi)
+    và bulk_write kiểu UpdateOne (lịch sử đọc không ghi được), RSS gồm cả client.
+    """
+    try:
+        import mongomock
+        import mongomock.gridfs
+    except ImportError:
+        raise SystemExit("❌ --inprocess cần mongomock: pip install mongomock")
+    import logging
+    from werkzeug.serving import make_server
+    import data_access
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    print("⚠️  --inprocess dùng mongomock: /search lỗi ở phần khớp nội dung ($text), chỉ so sánh tương đối")
+    mongomock.gridfs.enable_gridfs_integration()
+    client = mongomock.MongoClient()
+    data_access.MongoClient = lambda *a, **k: client
+    import app as appmod
+    appmod.create_app({"MONGO_DB": args.db,
+                       "SEARCH_INDEX_SNAPSHOT": os.path.join(RESULTS_DIR, "inprocess.snapshot")})
+    seed(appmod.db, appmod.fs, appmod.fs_images, books=args.books, users=args.users,
+         files=args.files, covers=args.covers, file_kb=args.file_kb, verbose=False)
+    server = make_server("127.0.0.1", _free_port(), appmod.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", appmod.db
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+def run(args):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    routes = [r for r in args.routes.split(",") if r] if args.routes else list(ROUTE_MIX)
+    levels = [int(c) for c in args.concurrency.split(",")]
+    server = inprocess = None
+
+    if args.inprocess:
+        inprocess, base_url, db = start_inprocess(args)
+        server_pid = os.getpid()
+        mode = "inprocess"
+    else:
+        import data_access
+        settings = dict(data_access.settings_from_env(), MONGO_DB=args.db)
+        db = data_access.DataAccess(settings).db
+        if args.url:
+            base_url, server_pid, mode = args.url.rstrip("/"), args.server_pid, "external"
+        else:
+            port = _free_port()
+            server = start_server(port, args.db)
+            base_url, server_pid, mode = f"http://127.0.0.1:{port}", server.pid, "serve.py"
+    try:
+        if not _wait_for_server(base_url):
+            raise SystemExit(f"❌ Server không phản hồi: {base_url}")
+        catalog = _catalog(db)
+        report = {
+            "meta": {
+                "started_at": datetime.now().isoformat(timespec="seconds"),
+                "commit": _git_commit(),
+                "mode": mode,
+                "url": base_url,
+                "database": args.db,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "server_env": {k: v for k, v in os.environ.items()
+                               if k.startswith(("WEB_", "MONGO_")) and k != "MONGO_URI"},
+                "catalog": {"books": db.books.estimated_document_count(),
+                            "users": len(catalog["users"])},
+                "duration_s": args.duration,
+                "warmup_s": args.warmup,
+                "mix": {r: ROUTE_MIX[r] for r in routes},
+            },
+            "runs": [],
+        }
+        for concurrency in levels:
+            phases = [] if args.mix_only else [(r, {r: 1}) for r in routes]
+            phases.append(("mix", {r: ROUTE_MIX[r] for r in routes}))
+            for phase, weights in phases:
+                result = run_phase(base_url, catalog, weights, concurrency, args.duration,
+                                   args.warmup, server_pid, seed_value=concurrency)
+                result.update(phase=phase, concurrency=concurrency)
+                report["runs"].append(result)
+                rss = result["server_rss"] or {}
+                print(f"   c={concurrency:<3} {phase:<11} {result['throughput_rps']:>8} req/s  "
+                      f"p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms  "
+                      f"lỗi {result['errors']}  RSS {rss.get('peak_mb', '-')} MB")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(30)
+        if inprocess is not None:
+            inprocess.shutdown()
+
+    out = args.out or os.path.join(RESULTS_DIR, f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Đã lưu kết quả: {out}")
+    return report
+
+
+# ==================== SO SÁNH ====================
+def compare(old, new, threshold=0.10):
+    """
+    So sánh hai báo cáo theo (concurrency, pha, route): p95 tăng / throughput giảm quá threshold
+    là hồi quy. Trả [(khóa, chỉ số, cũ, mới, tỉ lệ thay đổi)].
+    """
+    def index(report):
+        rows = {}
+        for run_ in report["runs"]:
+            rows[(run_["concurrency"], run_["phase"], "*")] = run_
+            for route, stats in run_["routes"].items():
+                rows[(run_["concurrency"], run_["phase"], route)] = stats
+        return rows
+
+    before, after = index(old), index(new)
+    regressions = []
+    for key in sorted(set(before) & set(after), key=str):
+        for metric, worse in (("p95_ms", 1), ("throughput_rps", -1)):
+            a, b = before[key].get(metric), after[key].get(metric)
+            if not a or b is None:
+                continue
+            change = (b - a) / a
+            if change * worse > threshold:
+                regressions.append((key, metric, a, b, round(change, 3)))
+    return regressions
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark HTTP của Thư viện Số")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def catalog_args(p):
+        p.add_argument("--db", default=BENCH_DB)
+        p.add_argument("--books", type=int, default=5000)
+        p.add_argument("--users", type=int, default=50)
+        p.add_argument("--files", type=int, default=20, help="số file sách khác nhau (dùng chung)")
+        p.add_argument("--covers", type=int, default=30, help="số ảnh bìa khác nhau (dùng chung)")
+        p.add_argument("--file-kb", type=int, default=256)
+
+    p_seed = sub.add_parser("seed", help="tạo danh mục giả trong database benchmark")
+    catalog_args(p_seed)
+    p_seed.add_argument("--i-know-this-drops-everything", dest="force", action="store_true",
+                        help="seed cả khi database có người dùng không phải @bench.local")
+
+    p_run = sub.add_parser("run", help="chạy tải và lưu kết quả JSON")
+    catalog_args(p_run)
+    p_run.add_argument("--url", help="server đang chạy sẵn (phải dùng cùng database benchmark)")
+    p_run.add_argument("--server-pid", type=int, help="pid server (--url) để đo RSS")
+    p_run.add_argument("--inprocess", action="store_true", help="server + mongomock trong process này")
+    p_run.add_argument("--concurrency", default="1,8,32")
+    p_run.add_argument("--duration", type=float, default=15.0, help="giây đo mỗi pha")
+    p_run.add_argument("--warmup", type=float, default=3.0, help="giây chạy trước khi đo mỗi pha")
+    p_run.add_argument("--routes", help=f"tập con của {','.join(ROUTE_MIX)}")
+    p_run.add_argument("--mix-only", action="store_true", help="chỉ chạy pha trộn")
+    p_run.add_argument("--out", help="file JSON kết quả")
+
+    p_cmp = sub.add_parser("compare", help="so sánh hai kết quả, exit 1 nếu có hồi quy")
+    p_cmp.add_argument("old")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args()
+    if args.command == "seed":
+        if args.db == "digital_library":
+            raise SystemExit("❌ Không seed vào database thật - dùng --db khác")
+        import data_access
+        data = data_access.DataAccess(dict(data_access.settings_from_env(), MONGO_DB=args.db))
+        seed(data.db, data.fs, data.fs_images, books=args.books, users=args.users, files=args.files,
+             covers=args.covers, file_kb=args.file_kb, force=args.force)
+    elif args.command == "run":
+        if args.db == "digital_library" and not args.inprocess:
+            raise SystemExit("❌ Không chạy benchmark trên database thật - dùng --db khác")
+        run(args)
+    else:
+        with open(args.old, encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        regressions = compare(old, new, args.threshold)
+        for (concurrency, phase, route), metric, a, b, change in regressions:
+            print(f"   ❌ c={concurrency} {phase}/{route} {metric}: {a} -> {b} ({change:+.1%})")
+        if regressions:
+            print(f"⚠️  {len(regressions)} chỉ số xấu đi quá {args.threshold:.0%}")
+            sys.exit(1)
+        print("✅ Không có hồi quy")
+
+
+if __name__ == "__main__":
+    main()
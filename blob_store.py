@@ -0,0 +1,122 @@
+# blob_store.py - Lưu file sách theo nội dung (SHA-256): trùng nội dung thì dùng chung một blob GridFS
+import hashlib
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from gridfs.errors import FileExists
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import dashboard_stats
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_stream(stream, chunk_size=HASH_CHUNK_SIZE):
+    """Tính SHA-256 theo từng khối (upload lớn đã được Werkzeug spool ra đĩa, không nằm trong RAM)."""
+    digest = hashlib.sha256()
+    while True:
+        block = stream.read(chunk_size)
+        if not block:
+            break
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def acquire_existing(db, sha256):
+    """Nếu đã có blob cùng hash thì tăng ref_count và trả _id, ngược lại None."""
+    doc = db.fs.files.find_one_and_update(
+        {"sha256": sha256},
+        {"$inc": {"ref_count": 1}},
+        projection={"_id": 1}
+    )
+    return doc["_id"] if doc else None
+
+
+def _count_new_blob(db, length):
+    dashboard_stats.bump(db, totals={"files_count": 1, "files_bytes": length},
+                         daily={"uploads": 1, "upload_bytes": length})
+
+
+def store_book_blob(db, fs, stream, filename, content_type=None):
+    """
+    Lưu file sách, khử trùng theo nội dung.
+    Trả (file_id, deduplicated): deduplicated=True nghĩa là dùng lại blob sẵn có.
+    """
+    sha256 = hash_stream(stream)
+    file_id = acquire_existing(db, sha256)
+    if file_id is not None:
+        return file_id, True
+
+    stream.seek(0)
+    file_id = ObjectId()
+    try:
+        fs.put(stream, _id=file_id, filename=filename, content_type=content_type,
+               sha256=sha256, ref_count=1)
+    except (FileExists, DuplicateKeyError):
+        # Upload song song cùng nội dung đã ghi trước (GridIn báo trùng index sha256 bằng FileExists)
+        # -> bỏ chunk vừa ghi, dùng blob kia
+        db.fs.chunks.delete_many({"files_id": file_id})
+        file_id = acquire_existing(db, sha256)
+        if file_id is None:
+            raise
+        return file_id, True
+    _count_new_blob(db, db.fs.files.find_one({"_id": file_id}, {"length": 1})["length"])
+    return file_id, False
+
+
+def release_book_blob(db, fs, file_id):
+    """
+    Bỏ một tham chiếu tới blob; chỉ xóa khỏi GridFS khi không còn sách nào dùng.
+    File cũ chưa có ref_count được coi là có đúng một tham chiếu.
+    Trả True nếu blob đã bị xóa.
+    """
+    file_id = ObjectId(file_id)
+    doc = db.fs.files.find_one_and_update(
+        {"_id": file_id},
+        {"$inc": {"ref_count": -1}},
+        projection={"ref_count": 1, "length": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if doc is None:
+        return False
+    if doc.get("ref_count", 0) > 0:
+        return False
+    # Chỉ xóa nếu vẫn không còn tham chiếu: acquire_existing song song có thể vừa $inc lại
+    # giữa hai bước (sách mới trỏ tới blob này) -> giữ blob
+    if db.fs.files.delete_one({"_id": file_id, "ref_count": {"$lte": 0}}).deleted_count != 1:
+        return False
+    db.fs.chunks.delete_many({"files_id": file_id})
+    dashboard_stats.bump(db, totals={"files_count": -1, "files_bytes": -doc.get("length", 0)})
+    return True
+
+
+def register_chunked_blob(db, file_id, sha256, length, chunk_size, filename, content_type=None):
+    """
+    Ghi document fs.files cho blob mà các chunk đã được ghi thẳng vào fs.chunks
+    (upload nhiều phần). Nếu nội dung đã tồn tại thì bỏ các chunk vừa ghi và dùng lại blob cũ.
+    Trả (file_id, deduplicated).
+    """
+    existing = acquire_existing(db, sha256)
+    if existing is not None:
+        db.fs.chunks.delete_many({"files_id": file_id})
+        return existing, True
+    try:
+        db.fs.files.insert_one({
+            "_id": file_id,
+            "length": length,
+            "chunkSize": chunk_size,
+            "uploadDate": datetime.now(timezone.utc),
+            "filename": filename,
+            "contentType": content_type,
+            "sha256": sha256,
+            "ref_count": 1,
+        })
+    except DuplicateKeyError:
+        db.fs.chunks.delete_many({"files_id": file_id})
+        existing = acquire_existing(db, sha256)
+        if existing is None:
+            raise
+        return existing, True
+    _count_new_blob(db, length)
+    return file_id, False
@@ -0,0 +1,41 @@
+# book_loader.py - Nạp sách theo lô: gom book_id của cả trang rồi đọc bằng một truy vấn $in
+#
+# Thay cho vòng lặp db.books.find_one từng dòng (N+1 truy vấn): số truy vấn mỗi trang
+# là hằng số, không phụ thuộc lịch sử dài hay ngắn của người dùng.
+#
+#     loader = BookLoader(db, BOOK_CARD_FIELDS)
+#     downloaded = loader.want(d["book_id"] for d in downloads)
+#     favorites = loader.want(f["book_id"] for f in favs)
+#     downloaded_books = loader.resolve(downloaded)   # một truy vấn cho cả hai danh sách
+#     favorite_books = loader.resolve(favorites)
+
+
+def load_books(db, book_ids, projection=None):
+    """Một truy vấn $in; giữ thứ tự book_ids, bỏ trùng, bỏ sách đã bị xóa."""
+    loader = BookLoader(db, projection)
+    return loader.resolve(loader.want(book_ids))
+
+
+class BookLoader:
+    def __init__(self, db, projection=None):
+        self.db = db
+        self.projection = projection
+        self._pending = []
+        self._books = {}        # book_id -> document (None = không còn tồn tại)
+
+    def want(self, book_ids):
+        """Đăng ký các sách cần nạp; trả danh sách id (đã bỏ trùng, giữ thứ tự) để resolve sau."""
+        ids = list(dict.fromkeys(book_ids))
+        self._pending.extend(book_id for book_id in ids if book_id not in self._books)
+        return ids
+
+    def resolve(self, ids):
+        """Các sách theo thứ tự ids; lần gọi đầu nạp mọi id đã đăng ký trong một truy vấn."""
+        if self._pending:
+            pending = list(dict.fromkeys(self._pending))
+            self._pending = []
+            for book in self.db.books.find({"_id": {"$in": pending}}, self.projection):
+                self._books[book["_id"]] = book
+            for book_id in pending:
+                self._books.setdefault(book_id, None)
+        return [self._books[book_id] for book_id in ids if self._books.get(book_id) is not None]
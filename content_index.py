@@ -0,0 +1,115 @@
+# content_index.py - Chỉ mục toàn văn theo trang cho nội dung sách (collection book_pages)
+#
+# Mỗi trang PDF / passage DOCX-TXT là một document {book_id, page, text, generation}.
+# Cập nhật tăng dần theo từng sách: ghi thế hệ mới rồi mới xóa thế hệ cũ,
+# nên tìm kiếm không bao giờ thấy sách "rỗng" trong lúc đang index lại.
+import re
+import unicodedata
+
+from bson import ObjectId
+from markupsafe import Markup, escape
+
+INSERT_BATCH = 100
+SNIPPET_CHARS = 240
+
+
+def index_book(db, book_id, file_id, pages):
+    """
+    Ghi lại chỉ mục nội dung của một sách từ iterator (page, text).
+    Bỏ kết quả nếu trong lúc chạy sách bị xóa hoặc đã đổi sang file khác.
+    Trả số trang/passage đã index.
+    """
+    generation = ObjectId()
+    batch = []
+    count = 0
+    for page, text in pages:
+        text = text.strip()
+        if not text:
+            continue
+        batch.append({"book_id": book_id, "page": page, "text": text, "generation": generation})
+        if len(batch) >= INSERT_BATCH:
+            db.book_pages.insert_many(batch, ordered=False)
+            count += len(batch)
+            batch = []
+    if batch:
+        db.book_pages.insert_many(batch, ordered=False)
+        count += len(batch)
+
+    book = db.books.find_one({"_id": book_id}, {"file_id": 1})
+    if not book or book.get("file_id") != file_id:
+        db.book_pages.delete_many({"book_id": book_id, "generation": generation})
+        return None
+    db.book_pages.delete_many({"book_id": book_id, "generation": {"$ne": generation}})
+    return count
+
+
+def remove_book(db, book_id):
+    db.book_pages.delete_many({"book_id": book_id})
+
+
+# ==================== TÌM KIẾM ====================
+def _fold(text):
+    """Bỏ dấu tiếng Việt từng ký tự, giữ nguyên độ dài để ánh xạ vị trí về văn bản gốc."""
+    out = []
+    for ch in text:
+        if ch in "đĐ":
+            out.append("d")
+            continue
+        base = unicodedata.normalize("NFD", ch)[0].lower()
+        out.append(base if len(base) == 1 else ch)
+    return "".join(out)
+
+
+def _query_terms(query):
+    return [t for t in re.findall(r"\w+", _fold(query)) if len(t) > 1]
+
+
+def make_snippet(text, terms, width=SNIPPET_CHARS):
+    """Đoạn trích quanh lần khớp đầu tiên, các từ khớp được bọc <mark> (đã escape HTML)."""
+    folded = _fold(text)
+    spans = []
+    for term in terms:
+        for m in re.finditer(r"\b" + re.escape(term) + r"\b", folded):
+            spans.append((m.start(), m.end()))
+    spans.sort()
+
+    start = max(0, spans[0][0] - width // 3) if spans else 0
+    end = min(len(text), start + width)
+    parts = []
+    cursor = start
+    for s, e in spans:
+        if s < cursor or e > end:
+            continue
+        parts.append(escape(text[cursor:s]))
+        parts.append(Markup("<mark>") + escape(text[s:e]) + Markup("</mark>"))
+        cursor = e
+    parts.append(escape(text[cursor:end]))
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(text) else ""
+    return Markup(prefix) + Markup("").join(parts) + Markup(suffix)
+
+
+def search_content(db, query, limit_books=10, pages_per_book=3, scan_limit=200):
+    """
+    Tìm trong nội dung sách: trả [{book_id, score, hits: [{page, snippet}]}]
+    xếp theo điểm textScore cao nhất của sách.
+    """
+    terms = _query_terms(query)
+    if not terms:
+        return []
+    cursor = db.book_pages.find(
+        {"$text": {"$search": query}},
+        {"book_id": 1, "page": 1, "text": 1, "score": {"$meta": "textScore"}}
+    ).sort([("score", {"$meta": "textScore"})]).limit(scan_limit)
+
+    results = {}
+    for doc in cursor:
+        entry = results.get(doc["book_id"])
+        if entry is None:
+            if len(results) >= limit_books:
+                continue
+            entry = results[doc["book_id"]] = {"book_id": doc["book_id"], "score": doc["score"], "hits": []}
+        if len(entry["hits"]) < pages_per_book:
+            entry["hits"].append({"page": doc["page"], "snippet": make_snippet(doc["text"], terms)})
+    return sorted(results.values(), key=lambda r: -r["score"])
+
@@ -0,0 +1,130 @@
+# cover_cache.py - Cache byte ảnh bìa trong từng worker (segmented LRU, giới hạn bộ nhớ)
+import threading
+from collections import OrderedDict
+
+
+class CoverCache:
+    """
+    Segmented LRU cho ảnh bìa:
+      - Lần đầu vào cache -> đoạn "probation"; được đọc lại -> lên "protected".
+      - Ảnh chỉ xem một lần (quét danh sách) chỉ đẩy nhau ra khỏi probation,
+        không làm trôi các bìa hay dùng ở protected.
+      - Tổng byte không vượt max_bytes; ảnh lớn hơn max_object_bytes không được nhận.
+
+    Mỗi entry gắn với cover_id gốc (group) để xóa mọi kích thước/định dạng
+    của một ảnh bìa khi admin thay hoặc xóa ảnh.
+    """
+
+    def __init__(self, max_bytes, max_object_bytes, protected_ratio=0.8):
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self.protected_max = int(max_bytes * protected_ratio)
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+        self._groups = {}
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.protected_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Trả (data, mimetype, last_modified) hoặc None."""
+        with self._lock:
+            entry = self._protected.get(key)
+            if entry is not None:
+                self._protected.move_to_end(key)
+                self.hits += 1
+                return entry[1:]
+            entry = self._probation.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            # Trúng lần thứ hai -> nâng lên protected
+            self._protected[key] = entry
+            self.protected_bytes += len(entry[1])
+            self._demote_protected()
+            self.hits += 1
+            return entry[1:]
+
+    def put(self, key, group, data, mimetype, last_modified=None):
+        """Thêm ảnh vào probation. Trả False nếu ảnh quá lớn (không nhận)."""
+        group = str(group)
+        size = len(data)
+        if size > self.max_object_bytes or size > self.max_bytes:
+            with self._lock:
+                self.rejections += 1
+            return False
+        with self._lock:
+            if key in self._protected or key in self._probation:
+                return True
+            self._probation[key] = (group, data, mimetype, last_modified)
+            self._groups.setdefault(group, set()).add(key)
+            self.current_bytes += size
+            self._evict()
+        return True
+
+    def invalidate(self, group):
+        """Xóa mọi entry của một ảnh bìa gốc (khi ảnh bị thay / xóa)."""
+        group = str(group)
+        with self._lock:
+            for key in self._groups.pop(group, ()):
+                entry = self._probation.pop(key, None)
+                if entry is None:
+                    entry = self._protected.pop(key, None)
+                    if entry is not None:
+                        self.protected_bytes -= len(entry[1])
+                if entry is not None:
+                    self.current_bytes -= len(entry[1])
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._probation.clear()
+            self._protected.clear()
+            self._groups.clear()
+            self.current_bytes = 0
+            self.protected_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._probation) + len(self._protected),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "rejections": self.rejections,
+                "invalidations": self.invalidations,
+            }
+
+    # ---- nội bộ (gọi khi đang giữ lock) ----
+    def _demote_protected(self):
+        """Protected vượt hạn mức -> đẩy entry cũ nhất về đầu mới của probation."""
+        while self.protected_bytes > self.protected_max and self._protected:
+            key, entry = self._protected.popitem(last=False)
+            self.protected_bytes -= len(entry[1])
+            self._probation[key] = entry
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes:
+            if self._probation:
+                key, entry = self._probation.popitem(last=False)
+            elif self._protected:
+                key, entry = self._protected.popitem(last=False)
+                self.protected_bytes -= len(entry[1])
+            else:
+                break
+            self.current_bytes -= len(entry[1])
+            keys = self._groups.get(entry[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._groups[entry[0]]
+            self.evictions += 1
@@ -5,11 +5,15 @@ from datetime import datetime, timedelta
 import random
 from bson import ObjectId
 
+import data_access
+import dashboard_stats
+
 def create_sample_data():
     """Tạo dữ liệu mẫu cho ứng dụng"""
     try:
-        client = MongoClient('mongodb://localhost:27017/')
-        db = client['digital_library']
+        settings = data_access.settings_from_env()
+        client = MongoClient(settings["MONGO_URI"])
+        db = client[settings["MONGO_DB"]]
         
         print("🎯 Tạo dữ liệu mẫu cho Thư viện Số...")
         
@@ -20,6 +24,7 @@ def create_sample_data():
         db.downloads.delete_many({})
         db.favorites.delete_many({})
         db.reading_history.delete_many({})
+        db.stats.delete_many({})          # thống kê dashboard tự dựng lại lần đọc đầu
         
         # Tạo users mẫu
         print("👥 Tạo người dùng mẫu...")
@@ -165,6 +170,8 @@ def create_sample_data():
             })
         
         db.downloads.insert_many(download_data)
+        for download in download_data:   # bộ đếm lượt tải theo sách (gợi ý tìm kiếm)
+            db.books.update_one({"_id": download["book_id"]}, {"$inc": {"download_count": 1}})
         print(f"✅ Đã tạo {len(download_data)} lượt tải")
         
         # Tạo favorites mẫu
@@ -211,6 +218,10 @@ def create_sample_data():
         db.reading_history.insert_many(history_data)
         print(f"✅ Đã tạo {len(history_data)} mục lịch sử đọc")
         
+        # Bộ đếm dashboard (app chỉ đọc, không tự dựng trong request)
+        dashboard_stats.rebuild(db)
+        print("✅ Đã dựng bộ đếm thống kê dashboard")
+        
         # Thống kê tổng quan
         print("\n📊 THỐNG KÊ DỮ LIỆU MẪU:")
         print(f"👥 Users: {db.users.count_documents({})}")
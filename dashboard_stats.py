@@ -0,0 +1,155 @@
+# dashboard_stats.py - Thống kê cho dashboard: bộ đếm tổng + bản ghi theo ngày, cập nhật tăng dần
+#
+# Collection stats:
+#   {_id: "totals", books, users, downloads, favorites, reading_history,
+#    files_count, files_bytes, images_count, images_bytes}
+#   {_id: "day:YYYY-MM-DD", date, downloads, new_books, new_users, uploads, upload_bytes}
+#
+# Mỗi lần ghi downloads / books / users / file gọi bump() ($inc nguyên tử, upsert), nên
+# dashboard chỉ đọc vài document nhỏ thay vì đếm / $group trên collection lớn.
+# Bộ đếm lệch (ghi ngoài app, lỗi giữa chừng) thì chạy lại từ dữ liệu gốc:
+#
+#     python dashboard_stats.py --rebuild
+#
+# Database mới / chưa có bộ đếm: python bootstrap.py stats (cũng nằm trong bootstrap.py all).
+import logging
+from datetime import datetime
+
+log = logging.getLogger("dashboard_stats")
+
+TOTAL_FIELDS = ("books", "users", "downloads", "favorites", "reading_history",
+                "files_count", "files_bytes", "images_count", "images_bytes")
+DAILY_FIELDS = ("downloads", "new_books", "new_users", "uploads", "upload_bytes")
+
+
+def day_key(when=None):
+    return "day:" + (when or datetime.now()).strftime("%Y-%m-%d")
+
+
+def bump(db, totals=None, daily=None, when=None):
+    """Cộng dồn bộ đếm tổng và / hoặc bộ đếm của ngày `when` (mặc định hôm nay)."""
+    if totals:
+        db.stats.update_one({"_id": "totals"}, {"$inc": totals}, upsert=True)
+    if daily:
+        when = when or datetime.now()
+        db.stats.update_one(
+            {"_id": day_key(when)},
+            {"$inc": daily,
+             "$setOnInsert": {"date": datetime.combine(when.date(), datetime.min.time())}},
+            upsert=True
+        )
+
+
+def gridfs_usage(db, bucket, query):
+    """(số file, tổng byte) của các file GridFS khớp query - dùng với query có index, phạm vi nhỏ."""
+    for row in db[f"{bucket}.files"].aggregate([
+        {"$match": query},
+        {"$group": {"_id": None, "count": {"$sum": 1}, "bytes": {"$sum": "$length"}}}
+    ]):
+        return row["count"], row["bytes"]
+    return 0, 0
+
+
+def read_dashboard(db, when=None):
+    """
+    Bộ đếm tổng + bộ đếm hôm nay trong một truy vấn. Chưa có bộ đếm thì trả 0 và cảnh báo:
+    dựng lại quét mọi collection nên chỉ chạy từ dòng lệnh, không trong request.
+    """
+    key = day_key(when)
+    docs = {d["_id"]: d for d in db.stats.find({"_id": {"$in": ["totals", key]}})}
+    if "totals" not in docs:
+        log.warning("Chưa có bộ đếm thống kê (stats.totals) - chạy: python dashboard_stats.py --rebuild")
+    totals = docs.get("totals", {})
+    today = docs.get(key, {})
+    return ({f: totals.get(f, 0) for f in TOTAL_FIELDS},
+            {f: today.get(f, 0) for f in DAILY_FIELDS})
+
+
+# ==================== SỬA CHỮA ====================
+def _daily_counts(collection, date_field, extra=None):
+    """{ "YYYY-MM-DD": {"count": n, ...} } theo ngày của date_field."""
+    group = {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": f"${date_field}"}},
+             "count": {"$sum": 1}}
+    group.update(extra or {})
+    return {row["_id"]: row for row in collection.aggregate([
+        {"$match": {date_field: {"$type": "date"}}},
+        {"$group": group},
+    ])}
+
+
+def rebuild_storage(db):
+    """Tính lại riêng số file / dung lượng GridFS (sau các script ghi thẳng vào GridFS)."""
+    files_count, files_bytes = gridfs_usage(db, "fs", {})
+    images_count, images_bytes = gridfs_usage(db, "images", {})
+    db.stats.update_one({"_id": "totals"}, {"$set": {
+        "files_count": files_count, "files_bytes": files_bytes,
+        "images_count": images_count, "images_bytes": images_bytes,
+    }}, upsert=True)
+
+
+def rebuild(db):
+    """
+    Dựng lại toàn bộ bộ đếm từ các collection gốc (quét toàn bộ - chỉ chạy khi sửa chữa).
+    Lượt ghi xảy ra trong lúc đang dựng có thể lệch một chút; chạy lại lúc ít tải nếu cần.
+    """
+    totals = {name: db[name].count_documents({})
+              for name in ("books", "users", "downloads", "favorites", "reading_history")}
+    totals["files_count"], totals["files_bytes"] = gridfs_usage(db, "fs", {})
+    totals["images_count"], totals["images_bytes"] = gridfs_usage(db, "images", {})
+
+    days = {}
+    sources = [
+        ("downloads", _daily_counts(db.downloads, "downloaded_at")),
+        ("new_books", _daily_counts(db.books, "created_at")),
+        ("new_users", _daily_counts(db.users, "created_at")),
+    ]
+    for field, counts in sources:
+        for day, row in counts.items():
+            days.setdefault(day, {})[field] = row["count"]
+    # uploadDate của GridFS là UTC; các mốc khác lưu giờ local (datetime.now())
+    for day, row in _daily_counts(db.fs.files, "uploadDate", {"bytes": {"$sum": "$length"}}).items():
+        days.setdefault(day, {}).update(uploads=row["count"], upload_bytes=row["bytes"])
+
+    db.stats.replace_one({"_id": "totals"}, dict(totals, rebuilt_at=datetime.now()), upsert=True)
+    for day, counts in days.items():
+        doc = {f: counts.get(f, 0) for f in DAILY_FIELDS}
+        doc["date"] = datetime.strptime(day, "%Y-%m-%d")
+        db.stats.replace_one({"_id": f"day:{day}"}, doc, upsert=True)
+    db.stats.delete_many({"_id": {"$regex": "^day:", "$nin": [f"day:{d}" for d in days]}})
+    rebuild_download_counts(db)
+    return totals, len(days)
+
+
+def rebuild_download_counts(db):
+    """Dựng lại books.download_count (số lượt tải theo sách) từ db.downloads."""
+    counts = {row["_id"]: row["count"] for row in db.downloads.aggregate([
+        {"$group": {"_id": "$book_id", "count": {"$sum": 1}}}
+    ])}
+    db.books.update_many({"download_count": {"$exists": True}, "_id": {"$nin": list(counts)}},
+                         {"$unset": {"download_count": ""}})
+    for book_id, count in counts.items():
+        db.books.update_one({"_id": book_id}, {"$set": {"download_count": count}})
+
+
+def main():
+    import argparse
+    from pymongo import MongoClient
+    import data_access
+
+    parser = argparse.ArgumentParser(description="Thống kê dashboard")
+    parser.add_argument("--rebuild", action="store_true", help="dựng lại bộ đếm từ dữ liệu gốc")
+    args = parser.parse_args()
+
+    settings = data_access.settings_from_env()
+    db = MongoClient(settings["MONGO_URI"])[settings["MONGO_DB"]]
+    if args.rebuild:
+        totals, days = rebuild(db)
+        print(f"✅ Đã dựng lại thống kê: {days} ngày")
+    totals, today = read_dashboard(db)
+    for name, value in totals.items():
+        print(f"   {name}: {value}")
+    print(f"📅 Hôm nay: {today}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# data_access.py - Lớp truy cập MongoDB: cấu hình pool kết nối từ biến môi trường
+#
+# Hai MongoClient (hai pool kết nối) tách biệt:
+#   - metadata: danh mục sách, người dùng, dashboard, hàng đợi job... (truy vấn ngắn, nhạy độ trễ)
+#   - blob: GridFS (tải sách, ảnh bìa, chunk upload) - một lượt tải chậm giữ kết nối rất lâu
+# Lượt tải chậm chỉ chiếm kết nối của pool blob, không làm trang dashboard phải xếp hàng chờ.
+#
+# Đọc danh mục / tìm kiếm (catalog_db) có thể đi tới secondary qua MONGO_CATALOG_READ_PREFERENCE;
+# ghi, đăng nhập, quyền và trang quản trị luôn đọc primary (db).
+import os
+
+import gridfs
+from pymongo import MongoClient
+from pymongo.read_preferences import (
+    Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+)
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+# Tên biến môi trường -> giá trị mặc định (cũng là khóa trong app.config)
+DEFAULTS = {
+    "MONGO_URI": "mongodb://localhost:27017/",
+    "MONGO_DB": "digital_library",
+    "MONGO_APP_NAME": "thuvienso",
+    # Pool metadata
+    "MONGO_MAX_POOL_SIZE": 50,
+    "MONGO_MIN_POOL_SIZE": 0,
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": 5000,
+    # Pool blob (MONGO_BLOB_URI trống = cùng server với metadata, nhưng vẫn là pool riêng)
+    "MONGO_BLOB_URI": "",
+    "MONGO_BLOB_MAX_POOL_SIZE": 20,
+    "MONGO_BLOB_WAIT_QUEUE_TIMEOUT_MS": 15000,
+    "MONGO_SEPARATE_BLOB_POOL": True,
+    # Chung cho cả hai pool
+    "MONGO_MAX_IDLE_TIME_MS": 60000,
+    "MONGO_CONNECT_TIMEOUT_MS": 5000,
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": 5000,
+    "MONGO_SOCKET_TIMEOUT_MS": 30000,         # 0 = không giới hạn
+    # Đọc danh mục / tìm kiếm
+    "MONGO_CATALOG_READ_PREFERENCE": "primary",
+    "MONGO_MAX_STALENESS_S": -1,              # -1 = không giới hạn độ trễ của secondary
+}
+
+
+def settings_from_env(environ=None):
+    """Cấu hình kết nối từ biến môi trường (thiếu thì dùng DEFAULTS), ép về đúng kiểu."""
+    environ = os.environ if environ is None else environ
+    settings = {}
+    for name, default in DEFAULTS.items():
+        raw = environ.get(name)
+        if raw is None or raw == "":
+            settings[name] = default
+        elif isinstance(default, bool):
+            settings[name] = raw.lower() in ("1", "true", "yes")
+        elif isinstance(default, int):
+            settings[name] = int(raw)
+        else:
+            settings[name] = raw
+    return settings
+
+
+def read_preference(config):
+    name = config["MONGO_CATALOG_READ_PREFERENCE"]
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"MONGO_CATALOG_READ_PREFERENCE không hợp lệ: {name} "
+                         f"(chọn một trong {', '.join(READ_PREFERENCES)})")
+    if name == "primary":
+        return Primary()
+    return READ_PREFERENCES[name](max_staleness=config["MONGO_MAX_STALENESS_S"])
+
+
+def client_options(config, kind):
+    """Tham số MongoClient cho pool "metadata" hoặc "blob"."""
+    blob = kind == "blob"
+    return {
+        "maxPoolSize": config["MONGO_BLOB_MAX_POOL_SIZE" if blob else "MONGO_MAX_POOL_SIZE"],
+        "minPoolSize": 0 if blob else config["MONGO_MIN_POOL_SIZE"],
+        "waitQueueTimeoutMS": config["MONGO_BLOB_WAIT_QUEUE_TIMEOUT_MS" if blob
+                                     else "MONGO_WAIT_QUEUE_TIMEOUT_MS"],
+        "maxIdleTimeMS": config["MONGO_MAX_IDLE_TIME_MS"],
+        "connectTimeoutMS": config["MONGO_CONNECT_TIMEOUT_MS"],
+        "serverSelectionTimeoutMS": config["MONGO_SERVER_SELECTION_TIMEOUT_MS"],
+        "socketTimeoutMS": config["MONGO_SOCKET_TIMEOUT_MS"] or None,
+        "appname": f"{config['MONGO_APP_NAME']}-{kind}",
+        # Không kết nối khi tạo client: kết nối mở ở truy vấn đầu tiên (import / fork không chờ mạng)
+        "connect": False,
+    }
+
+
+class DataAccess:
+    """
+    Giữ các MongoClient của một process.
+
+        data = DataAccess(settings_from_env())
+        data.db          # primary: ghi + đọc cần mới nhất
+        data.catalog_db  # đọc danh mục / tìm kiếm (theo read preference)
+        data.blob_db     # pool blob: fs.chunks, upload chunk
+        data.fs, data.fs_images
+    """
+
+    def __init__(self, config, event_listeners=(), pool_listeners=None):
+        self.config = {name: config.get(name, default) for name, default in DEFAULTS.items()}
+        self.db_name = self.config["MONGO_DB"]
+        # event_listeners: listener pymongo gắn vào mọi client (vd. query_monitor);
+        # pool_listeners: hàm kind -> listener riêng của từng pool (vd. metrics.mongo_listeners).
+        # Chỉ truyền khi cần đo.
+        def listeners(kind):
+            extra = list(event_listeners) + (list(pool_listeners(kind)) if pool_listeners else [])
+            return {"event_listeners": extra} if extra else {}
+
+        self.metadata_client = MongoClient(self.config["MONGO_URI"],
+                                           **client_options(self.config, "metadata"),
+                                           **listeners("metadata"))
+        if self.config["MONGO_SEPARATE_BLOB_POOL"]:
+            self.blob_client = MongoClient(self.config["MONGO_BLOB_URI"] or self.config["MONGO_URI"],
+                                           **client_options(self.config, "blob"), **listeners("blob"))
+        else:
+            self.blob_client = self.metadata_client
+        self.db = self.metadata_client[self.db_name]
+        self.catalog_db = self.metadata_client.get_database(
+            self.db_name, read_preference=read_preference(self.config))
+        self.blob_db = self.blob_client[self.db_name]
+        self.fs = gridfs.GridFS(self.blob_db)                          # fs.files, fs.chunks
+        self.fs_images = gridfs.GridFS(self.blob_db, collection="images")  # images.files, images.chunks
+
+    def ping(self):
+        """Kết nối thật tới MongoDB (ném lỗi nếu không tới được) - dùng cho bootstrap / health check."""
+        self.metadata_client.admin.command("ping")
+        if self.blob_client is not self.metadata_client:
+            self.blob_client.admin.command("ping")
+
+    def describe(self):
+        """Cấu hình pool đang dùng (không gồm URI vì có thể chứa mật khẩu)."""
+        return {
+            "database": self.db_name,
+            "metadata_pool": client_options(self.config, "metadata"),
+            "blob_pool": (client_options(self.config, "blob")
+                          if self.blob_client is not self.metadata_client else "metadata"),
+            "catalog_read_preference": self.config["MONGO_CATALOG_READ_PREFERENCE"],
+        }
+
+    def close(self):
+        self.metadata_client.close()
+        if self.blob_client is not self.metadata_client:
+            self.blob_client.close()
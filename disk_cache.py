@@ -0,0 +1,242 @@
+# disk_cache.py - Cache file sách trên đĩa cục bộ của app server (read-through trước GridFS)
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import metrics
+
+try:
+    import fcntl   # khóa liên process (Linux/macOS); Windows chỉ khóa trong process
+except ImportError:
+    fcntl = None
+
+FILL_THREADS = 2                # số file nạp song song ở nền trong mỗi process
+EVICT_EVERY_RATIO = 0.05        # quét dọn sau khi đã nạp thêm 5% max_bytes...
+EVICT_INTERVAL = 60.0           # ...hoặc mỗi 60 giây (process khác cũng nạp vào cùng thư mục)
+EVICT_LOW_WATERMARK = 0.9       # vượt max_bytes thì xóa tới còn 90% để không phải dọn liên tục
+
+
+class DiskCache:
+    """
+    Cache file GridFS theo file id trên đĩa:
+      - Trúng cache: trả đường dẫn để server gửi bằng sendfile (không đọc qua Python / MongoDB).
+      - Trượt cache: trả None ngay (route stream thẳng từ GridFS, byte đầu tiên không phải chờ)
+        và xếp việc nạp file vào đĩa cho luồng nền: file tạm rồi os.replace (ghi nguyên tử).
+      - Nhiều request cùng trượt một file (kể cả khác worker) chỉ nạp từ GridFS một lần.
+      - Tổng dung lượng vượt max_bytes -> xóa file lâu không dùng nhất (LRU theo mtime);
+        việc quét thư mục chạy ở luồng nền theo ngưỡng / chu kỳ, không theo từng lần trượt.
+
+    Layout: <directory>/<2 ký tự đầu>/<file_id>{,.meta,.lock}
+    File .lock không bao giờ bị xóa (process khác có thể đang giữ flock trên nó).
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fills = 0
+        self.evictions = 0
+        self._filling = set()           # key đang chờ / đang nạp trong process này
+        self._queue = None
+        self._pid = None
+        self._filled_since_evict = 0
+        self._evicted_at = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+
+    # ---- API ----
+    def fetch(self, file_id, fs):
+        """
+        Trả (path, meta) nếu file đã có trong cache. Trượt -> None (route stream thẳng từ
+        GridFS) và xếp file cho luồng nền nạp vào đĩa cho các lượt sau.
+        """
+        key = str(file_id)
+        entry = self._lookup(key)
+        if entry is not None:
+            self._count("hits")
+            return entry
+        self._count("misses")
+        self._schedule_fill(key, file_id, fs)
+        return None
+
+    def invalidate(self, file_id):
+        """Xóa file khỏi cache (khi sách bị xóa)."""
+        key = str(file_id)
+        with self._key_lock(key):
+            self._remove(key)
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "fills": self.fills,
+                "evictions": self.evictions,
+                "max_bytes": self.max_bytes,
+            }
+
+    # ---- nạp nền ----
+    def _schedule_fill(self, key, file_id, fs):
+        with self._locks_guard:
+            if key in self._filling:
+                return
+            self._filling.add(key)
+            # Tạo luồng sau fork (mỗi process worker có luồng riêng)
+            if self._queue is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                for i in range(FILL_THREADS):
+                    threading.Thread(target=self._run, args=(self._queue,),
+                                     name=f"disk-cache-{i}", daemon=True).start()
+        self._queue.put((key, file_id, fs))
+
+    def _run(self, jobs):
+        while True:
+            key, file_id, fs = jobs.get()
+            try:
+                with self._key_lock(key, blocking=False) as acquired:
+                    # Không lấy được khóa: process khác đang nạp đúng file này
+                    if acquired and not os.path.exists(self._path(key) + ".meta"):
+                        self._fill(key, fs.get(file_id))
+                self._maybe_evict(keep=key)
+            except Exception as e:      # lỗi đĩa / file đã bị xóa: lượt sau vẫn đọc GridFS
+                print(f"Lỗi cache đĩa cho file {key}: {e}")
+            finally:
+                with self._locks_guard:
+                    self._filling.discard(key)
+
+    def _maybe_evict(self, keep=None):
+        with self._locks_guard:
+            due = (self._filled_since_evict >= self.max_bytes * EVICT_EVERY_RATIO
+                   or time.monotonic() - self._evicted_at >= EVICT_INTERVAL)
+            if not due:
+                return
+            self._filled_since_evict = 0
+            self._evicted_at = time.monotonic()
+        self._evict(keep)
+
+    # ---- nội bộ ----
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _lookup(self, key):
+        path = self._path(key)
+        try:
+            with open(path + ".meta", encoding="utf-8") as f:
+                meta = json.load(f)
+            os.utime(path)   # cập nhật mtime để LRU biết file vừa được dùng
+        except (OSError, ValueError):
+            return None
+        if meta.get("upload_date"):
+            meta["upload_date"] = datetime.fromisoformat(meta["upload_date"])
+        return path, meta
+
+    @contextmanager
+    def _key_lock(self, key, blocking=True):
+        """Khóa theo key (trong process + flock giữa các process); yield False nếu không chờ được."""
+        with self._locks_guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        if not lock.acquire(blocking):
+            yield False
+            return
+        try:
+            if fcntl is None:
+                yield True
+                return
+            os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+            with open(self._path(key) + ".lock", "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    yield False
+                    return
+                try:
+                    yield True
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            lock.release()
+
+    def _fill(self, key, grid_out):
+        """Chép GridOut ra file tạm theo từng chunk rồi đổi tên nguyên tử."""
+        path = self._path(key)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in grid_out:
+                    out.write(chunk)
+                    metrics.GRIDFS_BYTES.inc(len(chunk), bucket="fs")
+                out.flush()
+                os.fsync(out.fileno())
+            meta = {
+                "filename": grid_out.filename,
+                "content_type": getattr(grid_out, "content_type", None),
+                "length": grid_out.length,
+                "upload_date": grid_out.upload_date.isoformat() if grid_out.upload_date else None,
+            }
+            # File dữ liệu vào chỗ trước, .meta sau: có .meta nghĩa là dữ liệu đã đầy đủ
+            os.replace(tmp_path, path)
+            with tempfile.NamedTemporaryFile("w", dir=folder, prefix=".tmp-",
+                                             delete=False, encoding="utf-8") as mf:
+                json.dump(meta, mf)
+            os.replace(mf.name, path + ".meta")
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._count("fills")
+        with self._locks_guard:
+            self._filled_since_evict += grid_out.length
+
+    def _remove(self, key):
+        # Giữ file .lock: xóa nó trong khi process khác đang flock thì hai bên khóa hai inode khác nhau
+        path = self._path(key)
+        for p in (path + ".meta", path):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self, keep=None):
+        """Vượt max_bytes thì xóa file ít dùng nhất tới khi còn EVICT_LOW_WATERMARK (chạy ở luồng nền)."""
+        entries = []
+        total = 0
+        for folder, _, files in os.walk(self.directory):
+            for name in files:
+                if "." in name:
+                    continue   # bỏ qua .meta / .lock / .tmp-*
+                try:
+                    st = os.stat(os.path.join(folder, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, name, st.st_size))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        target = self.max_bytes * EVICT_LOW_WATERMARK
+        for _, key, size in entries:
+            if total <= target:
+                break
+            if key == keep:
+                continue
+            with self._key_lock(key):
+                self._remove(key)
+            total -= size
+            self._count("evictions")
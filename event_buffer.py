@@ -0,0 +1,207 @@
+# event_buffer.py - Ghi trễ (write-behind) lượt tải và lịch sử đọc theo lô
+#
+# Request chỉ thêm sự kiện vào bộ đệm trong RAM rồi trả lời ngay; một luồng nền ghi
+# xuống MongoDB bằng insert_many / bulk_write khi đủ lô hoặc sau flush_interval giây.
+#   - Lịch sử đọc cùng (user, sách) được gộp: chỉ giữ lần xem mới nhất.
+#   - Bộ đệm có giới hạn: đầy thì request chờ luồng nền (tối đa block_timeout) rồi tự ghi.
+#   - close() (gọi lúc tắt process) ghi nốt mọi sự kiện còn lại.
+#   - Bộ đếm (stats, books.download_count) chỉ cộng cho lượt tải vừa được ghi mới; phần cộng
+#     lỗi được giữ lại và thử tiếp ở lần flush sau (không ghi lại lượt tải, không cộng hai lần).
+import atexit
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+import dashboard_stats
+
+
+class WriteBehindBuffer:
+    def __init__(self, db, batch_size=500, flush_interval=1.0, max_pending=10000,
+                 block_timeout=2.0, enabled=True):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.block_timeout = block_timeout
+        self.enabled = enabled
+        self._downloads = []
+        self._history = {}                  # (user_id, book_id) -> lần xem mới nhất
+        # Lượt tải đã ghi nhưng chưa cộng vào bộ đếm (chỉ luồng đang flush đụng tới)
+        self._uncounted = {"total": 0, "per_book": Counter(), "per_day": Counter()}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # một lần ghi tại một thời điểm
+        self._space = threading.Condition(self._lock)
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = None
+        self._pid = None
+        self.flushed = 0
+        self.flushes = 0
+        self.errors = 0
+        self.waits = 0
+        atexit.register(self.close)
+
+    def _pending(self):
+        return len(self._downloads) + len(self._history)
+
+    def _ensure_thread(self):
+        # Tạo luồng sau fork (mỗi process worker một luồng riêng)
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    # ==================== GHI SỰ KIỆN ====================
+    def _add(self, apply):
+        if not self.enabled or self._closed:
+            with self._lock:
+                apply()
+            self.flush()
+            return
+        with self._lock:
+            self._ensure_thread()
+            if self._pending() >= self.max_pending:
+                # Backpressure: chờ luồng nền giải phóng chỗ, quá hạn thì tự ghi
+                self.waits += 1
+                self._wakeup.set()
+                self._space.wait_for(lambda: self._pending() < self.max_pending, self.block_timeout)
+            full = self._pending() >= self.max_pending
+            apply()
+            if self._pending() >= self.batch_size:
+                self._wakeup.set()
+        if full:
+            self.flush()
+
+    def record_download(self, user_id, book_id, when):
+        self._add(lambda: self._downloads.append(
+            {"user_id": user_id, "book_id": book_id, "downloaded_at": when}))
+
+    def touch_history(self, user_id, book_id, when, last_page=1):
+        def apply():
+            self._history[(user_id, book_id)] = (when, last_page)
+        self._add(apply)
+
+    # ==================== XẢ XUỐNG MONGODB ====================
+    def flush(self):
+        """Ghi mọi sự kiện đang đệm; lỗi thì đưa lô trở lại bộ đệm để lần sau ghi tiếp."""
+        with self._flush_lock:
+            with self._lock:
+                downloads, self._downloads = self._downloads, []
+                history, self._history = self._history, {}
+                self._space.notify_all()
+            if not downloads and not history and not self._uncounted["total"]:
+                return 0
+            written = 0
+            # Hai loại sự kiện ghi độc lập: loại nào lỗi thì chỉ đưa loại đó trở lại bộ đệm
+            if downloads:
+                try:
+                    inserted, failed, error = self._write_downloads(downloads)
+                    if failed:
+                        self._requeue(error, downloads=failed)
+                    self._add_uncounted(inserted)
+                    written += len(downloads) - len(failed)
+                except Exception as e:
+                    self._requeue(e, downloads=downloads)
+            if self._uncounted["total"]:
+                try:
+                    self._write_download_counts()
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Lỗi cộng bộ đếm lượt tải (sẽ thử lại): {e}")
+            if history:
+                try:
+                    self._write_history(history)
+                    written += len(history)
+                except Exception as e:
+                    self._requeue(e, history=history)
+            self.flushes += 1
+            self.flushed += written
+            return written
+
+    def _requeue(self, error, downloads=(), history=None):
+        self.errors += 1
+        print(f"Lỗi ghi sự kiện (sẽ thử lại): {error}")
+        with self._lock:
+            self._downloads[:0] = downloads
+            for key, value in (history or {}).items():
+                current = self._history.get(key)
+                if current is None or current[0] < value[0]:
+                    self._history[key] = value
+
+    def _write_downloads(self, downloads):
+        """Trả (document vừa ghi mới, document cần ghi lại, lỗi)."""
+        try:
+            self.db.downloads.insert_many(downloads, ordered=False)
+            return downloads, [], None
+        except BulkWriteError as e:
+            # insert_many đã gán _id cho từng document: ghi lại lô lỗi lần trước
+            # thì các document đã vào trước đó báo trùng khóa - đã ghi (và đã đếm), bỏ qua
+            errors = e.details.get("writeErrors", [])
+            failed_at = {err["index"] for err in errors}
+            inserted = [d for i, d in enumerate(downloads) if i not in failed_at]
+            retry = [downloads[err["index"]] for err in errors if err.get("code") != 11000]
+            return inserted, retry, e
+
+    def _add_uncounted(self, downloads):
+        self._uncounted["total"] += len(downloads)
+        self._uncounted["per_book"].update(d["book_id"] for d in downloads)
+        self._uncounted["per_day"].update(d["downloaded_at"].date() for d in downloads)
+
+    def _write_download_counts(self):
+        """Cộng bộ đếm của các lượt tải đã ghi; phần nào ghi xong thì xóa khỏi _uncounted ngay."""
+        pending = self._uncounted
+        if pending["per_book"]:
+            # Lượt tải theo sách (gợi ý tìm kiếm xếp theo số này, không phải đếm lại db.downloads)
+            self.db.books.bulk_write([UpdateOne({"_id": book_id}, {"$inc": {"download_count": count}})
+                                      for book_id, count in pending["per_book"].items()], ordered=False)
+            pending["per_book"].clear()
+        for day, count in list(pending["per_day"].items()):
+            dashboard_stats.bump(self.db, daily={"downloads": count},
+                                 when=datetime.combine(day, datetime.min.time()))
+            del pending["per_day"][day]
+        dashboard_stats.bump(self.db, totals={"downloads": pending["total"]})
+        pending["total"] = 0
+
+    def _write_history(self, history):
+        result = self.db.reading_history.bulk_write([
+            UpdateOne({"user_id": user_id, "book_id": book_id},
+                      {"$max": {"updated_at": when}, "$set": {"last_page": last_page}},
+                      upsert=True)
+            for (user_id, book_id), (when, last_page) in history.items()
+        ], ordered=False)
+        if result.upserted_count:
+            dashboard_stats.bump(self.db, totals={"reading_history": result.upserted_count})
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self):
+        """Dừng luồng nền và ghi nốt phần còn lại (gọi khi tắt process)."""
+        self._closed = True
+        self._wakeup.set()
+        for _ in range(3):
+            self.flush()
+            if not self._pending() and not self._uncounted["total"]:
+                break
+            time.sleep(0.1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending_downloads": len(self._downloads),
+                "pending_history": len(self._history),
+                "uncounted_downloads": self._uncounted["total"],
+                "max_pending": self.max_pending,
+                "flushed": self.flushed,
+                "flushes": self.flushes,
+                "errors": self.errors,
+                "backpressure_waits": self.waits,
+            }
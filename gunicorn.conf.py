@@ -0,0 +1,74 @@
+# gunicorn.conf.py - Cấu hình chạy production (nhiều process × nhiều thread), đọc từ biến môi trường
+#
+#     python serve.py                      # hoặc: gunicorn -c gunicorn.conf.py app:app
+#     kill -HUP <pid master>               # reload êm: worker mới lên, worker cũ xử lý nốt request rồi thoát
+#
+# Master import app một lần (preload) rồi fork worker; MongoClient / GridFS / cache được tạo
+# SAU fork trong post_fork (MongoClient không an toàn khi dùng chung qua fork).
+# Số kết nối MongoDB tối đa = WEB_CONCURRENCY × (MONGO_MAX_POOL_SIZE + MONGO_BLOB_MAX_POOL_SIZE).
+#
+# /metrics cộng số liệu của mọi worker qua METRICS_DIR (mặc định <tmp>/thuvienso-metrics-<bind>,
+# mỗi instance trên cùng máy một thư mục riêng); chạy ingest_worker.py với cùng METRICS_DIR
+# để thấy cả thời gian trích preview.
+import multiprocessing
+import os
+import re
+import tempfile
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+# Mặc định: một worker mỗi core, mỗi worker vài thread (request chủ yếu chờ MongoDB)
+workers = _env_int("WEB_CONCURRENCY", multiprocessing.cpu_count())
+threads = _env_int("WEB_THREADS", 4)
+worker_class = "gthread" if threads > 1 else "sync"
+bind = os.environ.get("WEB_BIND", f"0.0.0.0:{_env_int('PORT', 5000)}")
+
+# Tái tạo worker sau N request (cộng ngẫu nhiên jitter để các worker không khởi động lại cùng lúc):
+# chặn bộ nhớ phình dần do thư viện đọc file / ảnh
+max_requests = _env_int("WEB_MAX_REQUESTS", 2000)
+max_requests_jitter = _env_int("WEB_MAX_REQUESTS_JITTER", max_requests // 10)
+
+timeout = _env_int("WEB_TIMEOUT", 120)                  # tải file lớn qua đường chậm
+graceful_timeout = _env_int("WEB_GRACEFUL_TIMEOUT", 30)
+keepalive = _env_int("WEB_KEEPALIVE", 5)
+
+# WEB_PRELOAD=0: mỗi worker tự import app - HUP khi đó nạp lại cả code mới (khởi động chậm hơn)
+preload_app = os.environ.get("WEB_PRELOAD", "1") == "1"
+wsgi_app = "app:app"
+
+accesslog = os.environ.get("WEB_ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.environ.get("WEB_LOG_LEVEL", "info")
+proc_name = "thuvienso"
+
+# Đặt trước khi import app (preload) để worker nào cũng đọc cùng một thư mục. Tên theo địa chỉ bind:
+# on_starting xóa thư mục này, không được đụng tới số liệu của instance khác chạy cùng máy
+os.environ.setdefault("METRICS_DIR", os.path.join(
+    tempfile.gettempdir(), "thuvienso-metrics-" + re.sub(r"[^0-9A-Za-z.-]+", "_", bind)))
+
+
+def on_starting(server):
+    # Khởi động lại master: số liệu bắt đầu lại từ 0 (Prometheus hiểu là counter reset)
+    import metrics
+    metrics.reset_directory(os.environ["METRICS_DIR"])
+
+
+def post_fork(server, worker):
+    import app
+    app.create_app()
+    server.log.info("Worker %s: đã tạo kết nối MongoDB sau fork", worker.pid)
+
+
+def worker_exit(server, worker):
+    # Ghi nốt lượt tải / lịch sử đọc đang đệm trước khi worker thoát (reload, tái tạo, tắt)
+    import app
+    if app.event_buffer is not None:
+        app.event_buffer.close()
+    if app.metrics_writer is not None:
+        app.metrics_writer.close()      # số đếm của worker được giữ lại sau khi nó thoát
+    if app.data is not None:
+        app.data.close()
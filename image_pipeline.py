@@ -0,0 +1,96 @@
+# image_pipeline.py - Tạo sẵn các kích thước ảnh bìa (WebP + JPEG) lúc upload
+from io import BytesIO
+
+# Bộ kích thước cố định (khung tối đa, giữ tỉ lệ). Ảnh hiển thị 50–200px
+# nên "thumb"/"card" đã đủ nét cả trên màn hình mật độ điểm ảnh x2.
+RENDITIONS = {
+    "thumb": (120, 160),     # bảng admin, danh sách nhỏ
+    "card": (300, 400),      # thẻ sách ở dashboard / tìm kiếm / thư viện
+    "detail": (600, 800),    # trang chi tiết sách
+}
+
+# Định dạng xuất: (định dạng Pillow, content-type, tham số lưu)
+FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 85, "optimize": True, "progressive": True}),
+}
+
+
+def _open_image(image_bytes):
+    """Mở ảnh, xoay theo EXIF và đưa về RGB (JPEG không có kênh alpha)."""
+    # Pillow chỉ được nạp khi thật sự xử lý ảnh (upload bìa), không làm chậm lúc khởi động worker
+    from PIL import Image, ImageOps
+    img = Image.open(BytesIO(image_bytes))
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    return img
+
+
+def generate_renditions(image_bytes):
+    """Trả về {(size, fmt): bytes} cho mọi kích thước trong RENDITIONS × FORMATS."""
+    from PIL import Image
+    source = _open_image(image_bytes)
+    result = {}
+    for size, box in RENDITIONS.items():
+        img = source.copy()
+        img.thumbnail(box, Image.Resampling.LANCZOS)
+        for fmt, (pil_format, _, options) in FORMATS.items():
+            out = BytesIO()
+            img.save(out, format=pil_format, **options)
+            result[(size, fmt)] = out.getvalue()
+    return result
+
+
+def store_renditions(fs_images, image_bytes, original_id, book_id=None, filename="cover"):
+    """
+    Tạo và lưu các rendition vào bucket images, liên kết qua metadata
+    (original_id = cover_id gốc, book_id, size, format).
+    Trả về {size: {fmt: ObjectId}} để lưu vào sách (field cover_renditions).
+    """
+    renditions = {}
+    base_name = filename.rsplit(".", 1)[0]
+    for (size, fmt), data in generate_renditions(image_bytes).items():
+        _, content_type, _ = FORMATS[fmt]
+        rendition_id = fs_images.put(
+            data,
+            filename=f"{base_name}_{size}.{fmt}",
+            content_type=content_type,
+            metadata={
+                "original_id": original_id,
+                "book_id": book_id,
+                "size": size,
+                "format": fmt,
+            }
+        )
+        renditions.setdefault(size, {})[fmt] = rendition_id
+    return renditions
+
+
+def delete_renditions(db, fs_images, original_id):
+    """Xóa toàn bộ rendition sinh ra từ một ảnh bìa gốc."""
+    for f in db.images.files.find({"metadata.original_id": original_id}, {"_id": 1}):
+        try:
+            fs_images.delete(f["_id"])
+        except Exception:
+            pass
+
+
+def find_rendition(db, original_id, size, fmt):
+    """Tìm rendition đã sinh sẵn (chỉ đọc metadata, không bao giờ resize ở đây)."""
+    return db.images.files.find_one(
+        {"metadata.original_id": original_id,
+         "metadata.size": size,
+         "metadata.format": fmt},
+        {"_id": 1}
+    )
+
+
+def preferred_format(accept_header):
+    """Chọn WebP nếu trình duyệt khai báo hỗ trợ trong Accept, ngược lại JPEG."""
+    return "webp" if "image/webp" in (accept_header or "") else "jpeg"
@@ -0,0 +1,139 @@
+# ingest_jobs.py - Hàng đợi job xử lý sách (trích preview, thông tin dẫn xuất) lưu trong MongoDB
+#
+# Vòng đời job: queued -> running -> done
+#                                  -> queued (thử lại, chờ backoff) -> ... -> failed
+# Worker chết giữa chừng: hết lease (locked_until) thì job running được worker khác nhận lại.
+import os
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+
+MAX_ATTEMPTS = int(os.environ.get('INGEST_MAX_ATTEMPTS', 3))
+BACKOFF_BASE_SECONDS = int(os.environ.get('INGEST_BACKOFF_SECONDS', 30))
+LEASE_SECONDS = int(os.environ.get('INGEST_LEASE_SECONDS', 300))
+
+ACTIVE_STATUSES = ["queued", "running"]
+
+
+def enqueue(db, book_id, file_id, filename, kind="preview"):
+    """
+    Thêm job cho sách (bỏ qua nếu đã có job cùng loại, cùng file đang chờ / đang chạy)
+    và đánh dấu sách đang được xử lý.
+    """
+    now = datetime.now()
+    db.ingest_jobs.update_one(
+        {"book_id": book_id, "kind": kind, "file_id": file_id,
+         "status": {"$in": ACTIVE_STATUSES}},
+        {"$setOnInsert": {
+            "book_id": book_id,
+            "kind": kind,
+            "file_id": file_id,
+            "filename": filename,
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": MAX_ATTEMPTS,
+            "run_after": now,
+            "created_at": now,
+            "updated_at": now,
+        }},
+        upsert=True
+    )
+    db.books.update_one({"_id": book_id}, {"$set": {"ingest_status": "queued"}})
+
+
+def claim_next(db, worker_id):
+    """Nhận job kế tiếp đã tới hạn (hoặc job running bị bỏ rơi quá lease)."""
+    now = datetime.now()
+    return db.ingest_jobs.find_one_and_update(
+        {"$or": [
+            {"status": "queued", "run_after": {"$lte": now}},
+            {"status": "running", "locked_until": {"$lt": now}},
+        ]},
+        {"$set": {"status": "running",
+                  "worker": worker_id,
+                  "started_at": now,
+                  "locked_until": now + timedelta(seconds=LEASE_SECONDS),
+                  "updated_at": now},
+         "$inc": {"attempts": 1}},
+        sort=[("run_after", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _has_other_active(db, job):
+    return db.ingest_jobs.count_documents(
+        {"book_id": job["book_id"], "_id": {"$ne": job["_id"]},
+         "status": {"$in": ACTIVE_STATUSES}}, limit=1) > 0
+
+
+def _book_filter(job):
+    """
+    Chỉ ghi vào sách khi sách vẫn trỏ tới file của job: file đã bị thay (upload lại) thì
+    kết quả của file cũ không được đè lên preview / trạng thái của file mới.
+    """
+    if job.get("file_id") is None:
+        return {"_id": job["book_id"]}
+    return {"_id": job["book_id"], "file_id": job["file_id"]}
+
+
+def complete(db, job, result):
+    """Ghi kết quả vào sách và đóng job (sách chỉ "done" khi không còn job nào khác đang chờ)."""
+    now = datetime.now()
+    db.ingest_jobs.update_one(
+        {"_id": job["_id"]},
+        {"$set": {"status": "done", "finished_at": now, "updated_at": now, "error": None},
+         "$unset": {"locked_until": ""}}
+    )
+    update = dict(result or {})
+    if not _has_other_active(db, job):
+        update["ingest_status"] = "done"
+    if update:
+        db.books.update_one(_book_filter(job), {"$set": update})
+
+
+def fail(db, job, error, fallback=None):
+    """
+    Job lỗi: còn lượt thì xếp lại với backoff lũy thừa (30s, 60s, 120s...),
+    hết lượt thì đánh dấu failed và ghi giá trị dự phòng (nếu có) vào sách.
+    """
+    now = datetime.now()
+    if job["attempts"] < job.get("max_attempts", MAX_ATTEMPTS):
+        delay = BACKOFF_BASE_SECONDS * (2 ** (job["attempts"] - 1))
+        db.ingest_jobs.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": "queued", "error": error, "updated_at": now,
+                      "run_after": now + timedelta(seconds=delay)},
+             "$unset": {"locked_until": ""}}
+        )
+        return
+    db.ingest_jobs.update_one(
+        {"_id": job["_id"]},
+        {"$set": {"status": "failed", "error": error, "finished_at": now, "updated_at": now},
+         "$unset": {"locked_until": ""}}
+    )
+    db.books.update_one(_book_filter(job),
+                        {"$set": dict(fallback or {}, ingest_status="failed")})
+
+
+def cancel_for_book(db, book_id):
+    """Sách bị xóa: bỏ các job chưa chạy."""
+    db.ingest_jobs.delete_many({"book_id": book_id, "status": "queued"})
+
+
+def job_status(db, book_id):
+    """Trạng thái job của sách cho trang admin poll (ưu tiên job còn đang chờ / chạy)."""
+    job = (db.ingest_jobs.find_one({"book_id": book_id, "status": {"$in": ACTIVE_STATUSES}},
+                                   sort=[("created_at", 1)])
+           or db.ingest_jobs.find_one({"book_id": book_id}, sort=[("created_at", -1)]))
+    if not job:
+        return None
+    return {
+        "book_id": str(book_id),
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "max_attempts": job.get("max_attempts", MAX_ATTEMPTS),
+        "error": job.get("error"),
+        "run_after": job["run_after"].isoformat() if job.get("run_after") else None,
+        "finished_at": job["finished_at"].isoformat() if job.get("finished_at") else None,
+    }
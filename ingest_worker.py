@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Worker nền xử lý hàng đợi ingest_jobs (trích preview, index nội dung theo trang của sách)
+Mỗi job chạy trong một process riêng, có giới hạn thời gian và bộ nhớ,
+nên PDF lớn / hỏng không làm treo web worker.
+
+    python ingest_worker.py --workers 4 --timeout 120 --memory-mb 1024
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from bson import ObjectId
+from pymongo import MongoClient
+import gridfs
+
+import data_access
+import ingest_jobs
+import metrics
+import search_engine
+
+try:
+    import resource   # giới hạn bộ nhớ process con (Linux/macOS)
+except ImportError:
+    resource = None
+
+# Cùng MONGO_URI / MONGO_DB với web app (data_access), nếu không job xếp một nơi, worker đọc nơi khác
+_SETTINGS = data_access.settings_from_env()
+MONGO_URI = _SETTINGS["MONGO_URI"]
+DB_NAME = _SETTINGS["MONGO_DB"]
+
+
+# ==================== HANDLERS (chạy trong process con) ====================
+def _handle_preview(db, fs, job):
+    from text_extract import extract_derived
+    return extract_derived(fs.get(ObjectId(job["file_id"])), job["filename"])
+
+
+def _handle_content_index(db, fs, job):
+    """Index toàn văn theo trang; file đã bị thay trong lúc chạy thì bỏ kết quả."""
+    import content_index
+    from text_extract import iter_pages
+    file_id = ObjectId(job["file_id"])
+    count = content_index.index_book(db, job["book_id"], file_id,
+                                     iter_pages(fs.get(file_id), job["filename"]))
+    if count is None:
+        return {}
+    return {"content_pages": count}
+
+
+# kind -> (handler, giá trị ghi vào sách khi hết lượt thử)
+JOB_HANDLERS = {
+    "preview": (_handle_preview, {"preview": "Không thể tạo xem trước."}),
+    "content_index": (_handle_content_index, {"content_pages": 0}),
+}
+
+
+def _child_main(conn, job, memory_mb):
+    """Điểm vào của process con: tự kết nối MongoDB, chạy handler, gửi kết quả qua pipe."""
+    try:
+        if resource is not None and memory_mb:
+            limit = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        client = MongoClient(MONGO_URI)
+        db = client[DB_NAME]
+        handler, _ = JOB_HANDLERS[job["kind"]]
+        conn.send(("ok", handler(db, gridfs.GridFS(db), job)))
+    except MemoryError:
+        conn.send(("error", f"Vượt giới hạn bộ nhớ {memory_mb} MB"))
+    except BaseException as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+def run_isolated(ctx, job, timeout, memory_mb):
+    """Chạy job trong process con; trả ("ok", result) hoặc ("error", message)."""
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_child_main, args=(child_conn, job, memory_mb), daemon=True)
+    process.start()
+    child_conn.close()
+    try:
+        if parent_conn.poll(timeout):
+            outcome = parent_conn.recv()
+        else:
+            outcome = ("error", f"Quá thời gian xử lý ({timeout}s)")
+    except EOFError:
+        outcome = ("error", f"Process xử lý bị dừng (exit code {process.exitcode})")
+    finally:
+        parent_conn.close()
+        process.join(1)
+        if process.is_alive():
+            process.kill()
+            process.join()
+    return outcome
+
+
+# ==================== POOL ====================
+class IngestWorkerPool:
+    def __init__(self, db, workers, timeout, memory_mb, poll_interval=2.0, once=False):
+        self.db = db
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.poll_interval = poll_interval
+        self.once = once
+        self.stop_event = threading.Event()
+        methods = multiprocessing.get_all_start_methods()
+        # forkserver/spawn: process con không thừa hưởng MongoClient của process cha
+        self.ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def _loop(self, index):
+        worker_id = f"{self.worker_prefix}:{index}"
+        while not self.stop_event.is_set():
+            job = ingest_jobs.claim_next(self.db, worker_id)
+            if job is None:
+                if self.once:
+                    return
+                self.stop_event.wait(self.poll_interval)
+                continue
+
+            started = time.monotonic()
+            if job["kind"] not in JOB_HANDLERS:
+                ingest_jobs.fail(self.db, dict(job, attempts=job.get("max_attempts", 1)),
+                                 f"Không có handler cho job '{job['kind']}'")
+                continue
+            status, payload = run_isolated(self.ctx, job, self.timeout, self.memory_mb)
+            elapsed = time.monotonic() - started
+            metrics.EXTRACTION_DURATION.observe(elapsed, kind=job["kind"], outcome=status)
+            if status == "ok":
+                ingest_jobs.complete(self.db, job, payload)
+                if "preview" in payload:
+                    search_engine.record_change(self.db, job["book_id"])   # preview được index tìm kiếm
+                print(f"   ✅ [{worker_id}] {job['kind']} sách {job['book_id']} ({elapsed:.1f}s)")
+            else:
+                _, fallback = JOB_HANDLERS[job["kind"]]
+                ingest_jobs.fail(self.db, job, payload, fallback)
+                print(f"   ❌ [{worker_id}] {job['kind']} sách {job['book_id']} "
+                      f"lần {job['attempts']}: {payload}")
+
+    def run(self):
+        threads = [threading.Thread(target=self._loop, args=(i,), daemon=True)
+                   for i in range(self.workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            while t.is_alive():
+                t.join(0.5)
+
+    def stop(self, *_):
+        print("\n⏹️  Đang dừng: chờ các job đang chạy hoàn tất...")
+        self.stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker xử lý hàng đợi ingest_jobs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="số job chạy song song (mặc định: số CPU)")
+    parser.add_argument("--timeout", type=int, default=int(os.environ.get("INGEST_TIMEOUT", 120)),
+                        help="thời gian tối đa cho một job (giây)")
+    parser.add_argument("--memory-mb", type=int, default=int(os.environ.get("INGEST_MEMORY_MB", 1024)),
+                        help="giới hạn bộ nhớ process con (MB, 0 = không giới hạn)")
+    parser.add_argument("--poll-interval", type=float, default=2.0,
+                        help="chu kỳ hỏi hàng đợi khi rảnh (giây)")
+    parser.add_argument("--once", action="store_true",
+                        help="xử lý hết job đang chờ rồi thoát")
+    parser.add_argument("--backfill-content", action="store_true",
+                        help="xếp job index nội dung cho các sách chưa được index")
+    args = parser.parse_args()
+
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+    try:
+        client.admin.command('ping')
+    except Exception as e:
+        print(f"❌ Lỗi kết nối MongoDB: {e}")
+        sys.exit(1)
+    db = client[DB_NAME]
+
+    if args.backfill_content:
+        queued = 0
+        for book in db.books.find({"file_id": {"$ne": None}, "content_pages": {"$exists": False}},
+                                  {"file_id": 1}):
+            grid_file = db.fs.files.find_one({"_id": book["file_id"]}, {"filename": 1})
+            if grid_file:
+                ingest_jobs.enqueue(db, book["_id"], book["file_id"], grid_file["filename"],
+                                    kind="content_index")
+                queued += 1
+        print(f"📚 Đã xếp {queued} sách vào hàng đợi index nội dung")
+
+    pool = IngestWorkerPool(db, args.workers, args.timeout, args.memory_mb,
+                            args.poll_interval, once=args.once)
+    signal.signal(signal.SIGTERM, pool.stop)
+    signal.signal(signal.SIGINT, pool.stop)
+    print(f"🚀 Ingest worker: {args.workers} luồng, timeout {args.timeout}s, "
+          f"bộ nhớ {args.memory_mb} MB/job")
+    # Thời gian xử lý job hiện trên /metrics của web app (cùng METRICS_DIR, cùng máy)
+    metrics_dir = os.environ.get("METRICS_DIR")
+    writer = (metrics.SnapshotWriter(metrics_dir, float(os.environ.get("METRICS_FLUSH_INTERVAL", 5)))
+              if metrics_dir else None)
+    pool.run()
+    if writer is not None:
+        writer.close()
+    print("👋 Ingest worker đã dừng")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,506 @@
+# metrics.py - Số liệu dạng Prometheus (text exposition 0.0.4) cho GET /metrics
+#
+# Ghi số liệu gần như không tốn gì: mỗi thread cộng vào dict riêng của mình (không lock,
+# không I/O). Chỉ khi scrape (hoặc định kỳ METRICS_FLUSH_INTERVAL giây) mới gộp các dict.
+#
+# Nhiều process (gunicorn, ingest_worker.py): đặt METRICS_DIR (gunicorn.conf.py đặt sẵn) -
+# mỗi process ghi ảnh chụp tổng của mình vào METRICS_DIR/<pid>.json, worker nhận scrape
+# cộng dồn tất cả. Process đã thoát: counter / histogram được gộp vào archive.json (không mất
+# số đã đếm khi worker bị tái tạo), gauge bị bỏ. Số của worker khác trễ tối đa một chu kỳ ghi.
+#
+#     http_request_duration_seconds{route,method,status}   mongodb_command_duration_seconds{pool,command}
+#     http_requests_in_flight                               mongodb_pool_checkout_wait_seconds{pool}
+#     gridfs_bytes_streamed_total{bucket}                   preview_extraction_duration_seconds{kind,outcome}
+#     cache_hits_total / cache_misses_total / cache_hit_ratio{cache}
+#
+# Truy cập GET /metrics (tên route, số lệnh MongoDB, dung lượng GridFS không công khai):
+#   - METRICS_TOKEN đặt: phải gửi "Authorization: Bearer <token>".
+#   - Không đặt token: chỉ nhận scrape gửi thẳng từ localhost (không qua proxy: không có
+#     X-Forwarded-For / X-Real-IP), còn lại 403.
+#   - METRICS_PUBLIC=1: bỏ kiểm tra (mạng nội bộ đã chặn sẵn từ bên ngoài).
+import bisect
+import json
+import os
+import threading
+import time
+import weakref
+
+from pymongo import monitoring
+
+# Bucket mặc định (giây)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+EXTRACT_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+ARCHIVE = "archive.json"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []          # mọi metric khai báo trong module này (giống nhau ở mọi process)
+_collectors = []        # hàm trả [(metric, nhãn, giá trị)] đọc lúc chụp (vd. bộ đếm của cache)
+_local = threading.local()
+_shards_lock = threading.Lock()     # chỉ dùng khi thread tạo dict riêng lần đầu / kết thúc
+
+
+class _ThreadShards:
+    """Các dict của một thread; thread kết thúc thì bị thu hồi và số liệu được gộp (_retire)."""
+
+    def __init__(self):
+        self.shards = {}        # metric -> dict
+        weakref.finalize(self, _retire, self.shards)
+
+
+def _retire(shards):
+    # Thread đã kết thúc (server Werkzeug tạo một thread mỗi request): gộp vào tổng của process
+    # để số dict không tăng mãi theo số thread đã từng chạy
+    with _shards_lock:
+        for metric, shard in shards.items():
+            try:
+                metric._shards.remove(shard)
+            except ValueError:
+                continue        # đã bỏ sau fork
+            for key, value in shard.items():
+                metric._retired[key] = metric._merge(metric._retired.get(key), value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._shards = []
+        self._retired = {}      # tổng của các thread đã kết thúc
+        _registry.append(self)
+
+    def _shard(self):
+        """Dict riêng của thread hiện tại cho metric này (chỉ thread đó ghi)."""
+        holder = getattr(_local, "holder", None)
+        if holder is None:
+            holder = _local.holder = _ThreadShards()
+        shard = holder.shards.get(self)
+        if shard is None:
+            shard = holder.shards[self] = {}
+            with _shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def collect(self):
+        """{nhãn: giá trị} tổng của process (gộp dict của các thread)."""
+        with _shards_lock:
+            shards = list(self._shards)
+            total = {key: self._merge(None, value) for key, value in self._retired.items()}
+        for shard in shards:
+            for key, value in shard.copy().items():
+                total[key] = self._merge(total.get(key), value)
+        return total
+
+    @staticmethod
+    def _merge(current, value):
+        return value if current is None else current + value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    """Gauge dạng tăng / giảm (tổng các thay đổi); chỉ tính các process còn sống."""
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        cell = shard.get(key)
+        if cell is None:
+            # [số mẫu theo từng bucket (+Inf cuối), tổng]
+            cell = shard[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        cell[0][bisect.bisect_left(self.buckets, value)] += 1
+        cell[1] += value
+
+    @staticmethod
+    def _merge(current, value):
+        counts, total = list(value[0]), value[1]
+        if current is None:
+            return [counts, total]
+        return [[a + b for a, b in zip(current[0], counts)], current[1] + total]
+
+
+# ==================== CÁC METRIC ====================
+REQUEST_DURATION = Histogram("http_request_duration_seconds",
+                             "Thời gian xử lý request tới khi có response (giây)",
+                             ("route", "method", "status"))
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Số request đang được xử lý")
+
+MONGO_COMMAND_DURATION = Histogram("mongodb_command_duration_seconds",
+                                   "Thời gian lệnh MongoDB theo pool và loại lệnh (giây)",
+                                   ("pool", "command"), MONGO_BUCKETS)
+MONGO_COMMAND_FAILURES = Counter("mongodb_command_failures_total",
+                                 "Số lệnh MongoDB bị lỗi", ("pool", "command"))
+POOL_CHECKOUT_WAIT = Histogram("mongodb_pool_checkout_wait_seconds",
+                               "Thời gian chờ lấy kết nối từ pool (giây)", ("pool",), MONGO_BUCKETS)
+POOL_CHECKOUT_FAILURES = Counter("mongodb_pool_checkout_failures_total",
+                                 "Số lần không lấy được kết nối (timeout, pool đóng, lỗi kết nối)",
+                                 ("pool", "reason"))
+POOL_IN_USE = Gauge("mongodb_pool_connections_in_use", "Số kết nối đang được mượn", ("pool",))
+POOL_OPEN = Gauge("mongodb_pool_connections_open", "Số kết nối đang mở", ("pool",))
+
+GRIDFS_BYTES = Counter("gridfs_bytes_streamed_total", "Số byte đọc từ GridFS theo bucket", ("bucket",))
+
+EXTRACTION_DURATION = Histogram("preview_extraction_duration_seconds",
+                                "Thời gian job ingest (trích preview, index nội dung) (giây)",
+                                ("kind", "outcome"), EXTRACT_BUCKETS)
+
+CACHE_HITS = Counter("cache_hits_total", "Số lần tìm thấy trong cache của worker", ("cache",))
+CACHE_MISSES = Counter("cache_misses_total", "Số lần trượt cache của worker", ("cache",))
+
+
+# ==================== MONGODB ====================
+class CommandMetrics(monitoring.CommandListener):
+    def __init__(self, pool):
+        self.pool = pool
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_DURATION.observe(event.duration_micros / 1e6,
+                                       pool=self.pool, command=event.command_name)
+
+    def failed(self, event):
+        MONGO_COMMAND_DURATION.observe(event.duration_micros / 1e6,
+                                       pool=self.pool, command=event.command_name)
+        MONGO_COMMAND_FAILURES.inc(pool=self.pool, command=event.command_name)
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    def __init__(self, pool):
+        self.pool = pool
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_checked_out(self, event):
+        POOL_CHECKOUT_WAIT.observe(event.duration, pool=self.pool)
+        POOL_IN_USE.inc(pool=self.pool)
+
+    def connection_check_out_failed(self, event):
+        POOL_CHECKOUT_WAIT.observe(event.duration, pool=self.pool)
+        POOL_CHECKOUT_FAILURES.inc(pool=self.pool, reason=event.reason)
+
+    def connection_checked_in(self, event):
+        POOL_IN_USE.dec(pool=self.pool)
+
+    def connection_created(self, event):
+        POOL_OPEN.inc(pool=self.pool)
+
+    def connection_closed(self, event):
+        POOL_OPEN.dec(pool=self.pool)
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+def mongo_listeners(pool):
+    """Listener truyền vào MongoClient của pool ("metadata" / "blob")."""
+    return [CommandMetrics(pool), PoolMetrics(pool)]
+
+
+# ==================== GRIDFS ====================
+class CountingReader:
+    """Bọc GridOut: đếm byte thực sự đọc ra (client ngắt giữa chừng thì chỉ đếm phần đã gửi)."""
+
+    def __init__(self, grid_out, bucket):
+        self._grid_out = grid_out
+        self._bucket = bucket
+
+    def read(self, size=-1):
+        chunk = self._grid_out.read(size)
+        if chunk:
+            GRIDFS_BYTES.inc(len(chunk), bucket=self._bucket)
+        return chunk
+
+    def __getattr__(self, name):
+        return getattr(self._grid_out, name)
+
+
+# ==================== CACHE ====================
+def register_cache(name, cache):
+    """Đọc hits / misses từ cache.stats() lúc chụp (cache tự đếm, không tốn thêm gì)."""
+    def collect():
+        stats = cache.stats()
+        return [(CACHE_HITS, (name,), stats["hits"]), (CACHE_MISSES, (name,), stats["misses"])]
+    _collectors.append(collect)
+
+
+def clear_collectors():
+    _collectors.clear()
+
+
+# ==================== FLASK ====================
+LOOPBACK = ("127.0.0.1", "::1")
+
+
+def scrape_allowed(config, request):
+    """Token (nếu đặt), ngược lại chỉ localhost gọi trực tiếp; METRICS_PUBLIC bỏ kiểm tra."""
+    token = config.get("METRICS_TOKEN")
+    if token:
+        return request.headers.get("Authorization") == f"Bearer {token}"
+    if config.get("METRICS_PUBLIC"):
+        return True
+    forwarded = "X-Forwarded-For" in request.headers or "X-Real-IP" in request.headers
+    return request.remote_addr in LOOPBACK and not forwarded
+
+
+def init_app(app):
+    """Đo thời gian / số request đang xử lý theo route và thêm GET /metrics."""
+    if "metrics" in app.extensions:
+        return
+    app.extensions["metrics"] = True
+    from flask import Response, abort, request
+
+    @app.before_request
+    def _start_timer():
+        request.environ["metrics.start"] = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+
+    @app.after_request
+    def _observe_request(response):
+        started = request.environ.get("metrics.start")
+        if started is not None:
+            rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            REQUEST_DURATION.observe(time.perf_counter() - started, route=rule,
+                                     method=request.method, status=response.status_code)
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        if request.environ.pop("metrics.start", None) is not None:
+            REQUESTS_IN_FLIGHT.dec()
+
+    @app.route("/metrics")
+    def metrics():
+        if not scrape_allowed(app.config, request):
+            abort(403)
+        return Response(render(collect_all(app.config.get("METRICS_DIR"))), content_type=CONTENT_TYPE)
+
+
+# ==================== GỘP & XUẤT ====================
+def snapshot():
+    """Tổng của process hiện tại: {tên metric: [[nhãn], giá trị]} (dạng ghi được ra JSON)."""
+    data = {}
+    for metric in _registry:
+        data[metric.name] = metric.collect()
+    for collect in list(_collectors):
+        for metric, key, value in collect():
+            values = data[metric.name]
+            values[key] = metric._merge(values.get(key), value)
+    return {name: [[list(key), value] for key, value in values.items()]
+            for name, values in data.items() if values}
+
+
+def _merge_into(total, snap, keep_gauges=True):
+    by_name = {metric.name: metric for metric in _registry}
+    for name, samples in snap.items():
+        metric = by_name.get(name)
+        if metric is None or (metric.kind == "gauge" and not keep_gauges):
+            continue
+        values = total.setdefault(name, {})
+        for key, value in samples:
+            key = tuple(key)
+            values[key] = metric._merge(values.get(key), value)
+    return total
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)      # người đọc luôn thấy file đầy đủ
+
+
+def write_snapshot(directory):
+    os.makedirs(directory, exist_ok=True)
+    _write_json(os.path.join(directory, f"{os.getpid()}.json"), snapshot())
+
+
+def collect_all(directory=None):
+    """Gộp số liệu: chỉ process này (không có directory) hoặc mọi process trong directory."""
+    if not directory:
+        return _merge_into({}, snapshot())
+    import fcntl
+    write_snapshot(directory)
+    with open(os.path.join(directory, ".lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            archive_path = os.path.join(directory, ARCHIVE)
+            archive = _merge_into({}, _read_json(archive_path))
+            total, retired = {}, False
+            for filename in os.listdir(directory):
+                stem, ext = os.path.splitext(filename)
+                if ext != ".json" or not stem.isdigit():
+                    continue
+                path = os.path.join(directory, filename)
+                if _pid_alive(int(stem)):
+                    _merge_into(total, _read_json(path))
+                else:
+                    # Process đã thoát: giữ counter / histogram trong archive, bỏ gauge
+                    _merge_into(archive, _read_json(path), keep_gauges=False)
+                    os.remove(path)
+                    retired = True
+            if retired:
+                _write_json(archive_path, {name: [[list(k), v] for k, v in values.items()]
+                                           for name, values in archive.items()})
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return _merge_into(total, {name: list(values.items()) for name, values in archive.items()})
+
+
+def reset_directory(directory):
+    """Master khởi động: xóa số liệu của lần chạy trước (giữ file của process còn sống)."""
+    os.makedirs(directory, exist_ok=True)
+    for filename in os.listdir(directory):
+        stem, ext = os.path.splitext(filename)
+        if filename == ARCHIVE or ext == ".tmp" or (ext == ".json" and stem.isdigit()
+                                                      and not _pid_alive(int(stem))):
+            os.remove(os.path.join(directory, filename))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(total):
+    """Văn bản exposition của Prometheus từ kết quả collect_all()."""
+    lines = []
+    for metric in _registry:
+        values = total.get(metric.name, {})
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for key in sorted(values):
+            value = values[key]
+            if metric.kind == "histogram":
+                counts, observed_sum = value
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    lines.append(f"{metric.name}_bucket"
+                                 f"{_labels(metric.labelnames, key, ('le', _number(bound)))} {cumulative}")
+                lines.append(f"{metric.name}_sum{_labels(metric.labelnames, key)} {_number(observed_sum)}")
+                lines.append(f"{metric.name}_count{_labels(metric.labelnames, key)} {cumulative}")
+            else:
+                lines.append(f"{metric.name}{_labels(metric.labelnames, key)} {_number(value)}")
+    # Tỉ lệ trúng cache tính sau khi đã cộng mọi worker
+    hits, misses = total.get(CACHE_HITS.name, {}), total.get(CACHE_MISSES.name, {})
+    lines.append("# HELP cache_hit_ratio Tỉ lệ trúng cache (mọi worker)")
+    lines.append("# TYPE cache_hit_ratio gauge")
+    for key in sorted(set(hits) | set(misses)):
+        lookups = hits.get(key, 0) + misses.get(key, 0)
+        ratio = hits.get(key, 0) / lookups if lookups else 0.0
+        lines.append(f"cache_hit_ratio{_labels(('cache',), key)} {_number(round(ratio, 4))}")
+    return "\n".join(lines) + "\n"
+
+
+# ==================== GHI ĐỊNH KỲ (NHIỀU PROCESS) ====================
+class SnapshotWriter:
+    """Thread nền ghi ảnh chụp của process vào METRICS_DIR mỗi interval giây."""
+
+    def __init__(self, directory, interval=5.0):
+        self.directory = directory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                write_snapshot(self.directory)
+            except OSError:
+                pass
+
+    def close(self):
+        """Dừng và ghi lần cuối (gọi trước khi process thoát để không mất số đếm)."""
+        self._stop.set()
+        self._thread.join(self.interval)
+        try:
+            write_snapshot(self.directory)
+        except OSError:
+            pass
+
+
+def _reset_after_fork():
+    # Process con (worker gunicorn) bắt đầu đếm từ 0: số của master không thuộc về nó
+    global _local, _shards_lock
+    _local = threading.local()
+    _shards_lock = threading.Lock()
+    for metric in _registry:
+        metric._shards = []
+        metric._retired = {}
+    _collectors.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -15,6 +15,10 @@ from io import BytesIO
 import PyPDF2
 import docx
 
+from blob_store import store_book_blob
+import dashboard_stats
+import data_access
+
 UPLOADS_DIR = "uploads"   # thư mục chứa sách cũ
 COVERS_DIR = "covers"     # thư mục chứa bìa cũ
 
@@ -22,11 +26,12 @@ COVERS_DIR = "covers"     # thư mục chứa bìa cũ
 def connect_mongodb():
     """Kết nối MongoDB"""
     try:
-        client = MongoClient('mongodb://localhost:27017/')
+        settings = data_access.settings_from_env()
+        client = MongoClient(settings["MONGO_URI"])
         client.admin.command('ping')
         print("✅ Kết nối MongoDB thành công")
 
-        db = client['digital_library']
+        db = client[settings["MONGO_DB"]]
         fs = gridfs.GridFS(db)
         fs_images = gridfs.GridFS(db, collection="images")
 
@@ -99,7 +104,7 @@ def migrate_books_to_gridfs(db, fs, fs_images):
             file_path = book["file_path"]
             try:
                 with open(file_path, "rb") as f:
-                    file_id = fs.put(f, filename=os.path.basename(file_path))
+                    file_id, _ = store_book_blob(db, fs, f, filename=os.path.basename(file_path))
                 updates["file_id"] = file_id
                 updates["preview_text"] = extract_text_preview(file_path)
                 print(f"   ✅ Đã migrate file cho sách '{book.get('title')}'")
@@ -166,6 +171,10 @@ def main():
         # Tùy chọn dọn dẹp
         cleanup_old_files(db)
 
+        # File ghi thẳng vào GridFS -> dựng lại bộ đếm dashboard từ dữ liệu gốc
+        dashboard_stats.rebuild(db)
+        print("📊 Đã dựng lại bộ đếm thống kê dashboard")
+
         print("\n🎉 Hoàn thành migration!")
         print("💡 Ứng dụng bây giờ đã tương thích với GridFS (app.py)")
 
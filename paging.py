@@ -0,0 +1,103 @@
+# paging.py - Phân trang keyset (con trỏ "sau bản ghi X") cho các danh sách lớn
+#
+# Thay cho skip/limit: mỗi trang chỉ đọc page_size + 1 document bắt đầu ngay sau khóa
+# sắp xếp của document cuối trang trước, nên trang 1 hay trang 1000 đều tốn như nhau.
+# Khóa sắp xếp luôn kết thúc bằng _id để thứ tự ổn định khi trùng giá trị.
+import base64
+import binascii
+
+from bson import json_util
+
+TEXT_SCORE = "score"
+
+
+def encode_cursor(values):
+    raw = json_util.dumps(values, json_options=json_util.CANONICAL_JSON_OPTIONS).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, size):
+    """Giải mã con trỏ từ query string; con trỏ hỏng / sai dạng coi như trang đầu."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json_util.loads(raw.decode("utf-8"))
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def after_filter(sort, values):
+    """Điều kiện "đứng sau" bộ giá trị values theo thứ tự sort (so sánh từ điển)."""
+    branches = []
+    for i, (field, direction) in enumerate(sort):
+        value = values[i]
+        cond = {f: values[j] for j, (f, _) in enumerate(sort[:i])}
+        if value is None:
+            if direction == 1:
+                cond[field] = {"$ne": None}
+            else:
+                continue        # null là nhỏ nhất: không có gì đứng sau khi sắp giảm dần
+        elif direction == 1:
+            cond[field] = {"$gt": value}
+        else:
+            # sắp giảm dần: document thiếu trường (null) nằm cuối danh sách
+            cond[field] = {"$not": {"$gte": value}}
+        branches.append(cond)
+    return {"$or": branches} if branches else {"_id": {"$exists": False}}
+
+
+def keyset_page(collection, query, sort, projection=None, page_size=24, cursor=None):
+    """
+    Một trang kết quả find() theo thứ tự sort (danh sách (field, 1|-1), kết thúc bằng _id).
+    Trả (docs, next_cursor) - next_cursor None khi đã hết.
+    """
+    values = decode_cursor(cursor, len(sort))
+    if values is not None:
+        query = {"$and": [query, after_filter(sort, values)]} if query else after_filter(sort, values)
+    docs = list(collection.find(query, projection).sort(sort).limit(page_size + 1))
+    return _split(docs, sort, page_size)
+
+
+def text_search_page(collection, text, query=None, projection=None, page_size=24, cursor=None):
+    """
+    Một trang kết quả $text xếp theo độ liên quan (textScore giảm dần, rồi _id giảm dần).
+    Dùng aggregate vì find() không lọc được theo textScore để đi tiếp sau con trỏ.
+    """
+    sort = [(TEXT_SCORE, -1), ("_id", -1)]
+    match = {"$text": {"$search": text}}
+    match.update(query or {})
+    project = dict(projection or {"_id": 1})
+    project[TEXT_SCORE] = {"$meta": "textScore"}
+    pipeline = [{"$match": match}, {"$project": project}]
+    values = decode_cursor(cursor, len(sort))
+    if values is not None:
+        pipeline.append({"$match": after_filter(sort, values)})
+    pipeline += [{"$sort": dict(sort)}, {"$limit": page_size + 1}]
+    return _split(list(collection.aggregate(pipeline)), sort, page_size)
+
+
+def _split(docs, sort, page_size):
+    if len(docs) <= page_size:
+        return docs, None
+    docs = docs[:page_size]
+    last = docs[-1]
+    return docs, encode_cursor([last.get(field) for field, _ in sort])
+
+
+def count_matches(collection, query, threshold):
+    """
+    Tổng số kết quả cho giao diện: (count, approximate).
+    Không lọc -> estimated_document_count (đọc metadata, không quét).
+    Có lọc -> đếm tối đa threshold + 1; vượt ngưỡng thì chỉ báo "hơn threshold".
+    """
+    if not query:
+        count = collection.estimated_document_count()
+        return count, count > threshold
+    count = collection.count_documents(query, limit=threshold + 1)
+    if count > threshold:
+        return threshold, True
+    return count, False
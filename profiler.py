@@ -0,0 +1,208 @@
+# profiler.py - Profile theo yêu cầu MỘT request cụ thể ở production (chỉ admin tạo được link)
+#
+# Admin vào /admin/profiles, nhập đường dẫn (vd. /book/<id>) -> nhận link có chữ ký:
+#     /book/<id>?_profile=<token>                    hoặc header   X-Profile: <token>
+# Request mang token hợp lệ (đúng chữ ký SECRET_KEY, đúng path, chưa hết hạn) VÀ cookie phiên của
+# chính admin đã tạo token chạy dưới cProfile - link lọt ra ngoài (log, Referer) vô dụng với người khác.
+# Kết quả lưu ở PROFILE_DIR:
+#     <id>.prof   pstats: python -m pstats <file>, snakeviz <file>
+#     <id>.json   tóm tắt: thời gian, thời gian trong MongoDB / render template, hàm tốn nhất
+# Response có header X-Profile-Id. Chỉ đo tới lúc có response: phần body stream sau đó
+# (file GridFS) không nằm trong profile.
+#
+# Mặc định tắt (bật bằng PROFILING=1): middleware không được gắn. Bật mà request không có token:
+# chỉ thêm hai lần tra dict trong environ.
+import cProfile
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+QUERY_PARAM = "_profile"
+HEADER = "HTTP_X_PROFILE"
+SALT = "request-profile"
+TOP_FUNCTIONS = 30
+
+# Nhóm thời gian trong báo cáo: tên nhóm -> hàm nhận filename của frame, trả True nếu thuộc nhóm
+_SEP = os.sep
+CATEGORIES = {
+    "mongo": lambda f: any(f"{_SEP}{pkg}{_SEP}" in f for pkg in ("pymongo", "gridfs", "bson")),
+    "template": lambda f: f"{_SEP}jinja2{_SEP}" in f or f.endswith(f"flask{_SEP}templating.py"),
+}
+
+PROFILE_ID = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9a-f]{6}$")
+
+# cProfile (Python 3.12+) chỉ cho một profiler hoạt động mỗi lúc: request thứ hai chạy bình thường
+_busy = threading.Lock()
+
+
+def _serializer(secret_key):
+    return URLSafeTimedSerializer(secret_key, salt=SALT)
+
+
+def sign(secret_key, path, user_id=None):
+    """Token cho phép profile đúng một đường dẫn (chỉ phần path, không gồm query)."""
+    return _serializer(secret_key).dumps({"path": path, "by": user_id})
+
+
+def verify(secret_key, token, path, max_age):
+    """Payload nếu token hợp lệ cho path, ngược lại None."""
+    try:
+        payload = _serializer(secret_key).loads(token, max_age=max_age)
+    except BadSignature:        # gồm cả SignatureExpired
+        return None
+    return payload if payload.get("path") == path else None
+
+
+def session_user(flask_app, environ):
+    """user_id của admin đang đăng nhập theo cookie phiên (có chữ ký) của request, không phải admin -> None."""
+    session = flask_app.session_interface.open_session(flask_app, flask_app.request_class(environ))
+    if not session or session.get("user_role") != "Admin":
+        return None
+    return session.get("user_id")
+
+
+def breakdown(stats):
+    """
+    Thời gian (ms) vào mỗi nhóm: cộng thời gian tích lũy của các lời gọi từ NGOÀI nhóm vào
+    hàm trong nhóm (không đếm hai lần khi hàm trong nhóm gọi nhau).
+    """
+    totals = dict.fromkeys(CATEGORIES, 0.0)
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for name, matches in CATEGORIES.items():
+            if not matches(func[0]):
+                continue
+            for caller, caller_stats in callers.items():
+                if not matches(caller[0]):
+                    totals[name] += caller_stats[3]
+    return {name: round(seconds * 1000, 2) for name, seconds in totals.items()}
+
+
+def top_functions(stats, limit=TOP_FUNCTIONS):
+    rows = []
+    for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append({"function": f"{os.path.basename(filename)}:{line}({func})",
+                     "calls": nc, "tottime_ms": round(tt * 1000, 3), "cumtime_ms": round(ct * 1000, 3)})
+    rows.sort(key=lambda row: -row["cumtime_ms"])
+    return rows[:limit]
+
+
+class ProfilingMiddleware:
+    """Bọc app.wsgi_app: request có token hợp lệ chạy dưới cProfile."""
+
+    def __init__(self, flask_app, wsgi_app):
+        self.flask_app = flask_app
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        token = environ.get(HEADER)
+        if token is None and QUERY_PARAM in environ.get("QUERY_STRING", ""):
+            token = (parse_qs(environ["QUERY_STRING"]).get(QUERY_PARAM) or [None])[0]
+        if token is None:
+            return self.wsgi_app(environ, start_response)
+
+        config = self.flask_app.config
+        payload = verify(self.flask_app.secret_key, token, environ.get("PATH_INFO", ""),
+                         config["PROFILE_TOKEN_TTL"])
+        # Token chỉ có hiệu lực trong phiên của admin đã tạo nó
+        if payload is None or payload.get("by") is None \
+                or session_user(self.flask_app, environ) != payload["by"]:
+            return self.wsgi_app(environ, start_response)
+        if not _busy.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+        try:
+            return self._profile(environ, start_response, payload)
+        finally:
+            _busy.release()
+
+    def _profile(self, environ, start_response, payload):
+        profile_id = f"{datetime.now():%Y%m%d-%H%M%S}-{os.urandom(3).hex()}"
+        status = {}
+
+        def capture(status_line, headers, exc_info=None):
+            status["code"] = int(status_line.split(" ", 1)[0])
+            headers.append(("X-Profile-Id", profile_id))
+            return start_response(status_line, headers, exc_info)
+
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            body = self.wsgi_app(environ, capture)
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - started
+            save(self.flask_app.config["PROFILE_DIR"], profile_id, profile, {
+                "id": profile_id,
+                "method": environ.get("REQUEST_METHOD"),
+                "path": environ.get("PATH_INFO"),
+                "status": status.get("code"),
+                "duration_ms": round(elapsed * 1000, 2),
+                "requested_by": payload.get("by"),
+                "pid": os.getpid(),
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+            }, self.flask_app.config["PROFILE_KEEP"])
+        return body
+
+
+def init_app(app):
+    if "profiler" in app.extensions:
+        return
+    app.extensions["profiler"] = True
+    app.wsgi_app = ProfilingMiddleware(app, app.wsgi_app)
+
+
+# ==================== LƯU / ĐỌC ====================
+def save(directory, profile_id, profile, meta, keep):
+    os.makedirs(directory, exist_ok=True)
+    stats = pstats.Stats(profile)
+    stats.dump_stats(os.path.join(directory, f"{profile_id}.prof"))
+    meta["breakdown_ms"] = breakdown(stats)
+    meta["top"] = top_functions(stats)
+    with open(os.path.join(directory, f"{profile_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    _prune(directory, keep)
+
+
+def _prune(directory, keep):
+    """Chỉ giữ keep profile mới nhất (id bắt đầu bằng thời điểm tạo nên sắp xếp được)."""
+    ids = sorted({name.rsplit(".", 1)[0] for name in os.listdir(directory)
+                  if PROFILE_ID.match(name.rsplit(".", 1)[0])}, reverse=True)
+    for old_id in ids[keep:]:
+        for ext in (".prof", ".json"):
+            try:
+                os.remove(os.path.join(directory, old_id + ext))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(directory, limit=50):
+    """Tóm tắt các profile mới nhất trước."""
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith(".json") or not PROFILE_ID.match(name[:-5]):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+        if len(profiles) >= limit:
+            break
+    return profiles
+
+
+def profile_path(directory, profile_id):
+    """Đường dẫn file .prof, None nếu id không hợp lệ / không còn."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(directory, f"{profile_id}.prof")
+    return path if os.path.isfile(path) else None
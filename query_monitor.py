@@ -0,0 +1,166 @@
+# query_monitor.py - Đếm lệnh MongoDB theo từng request (pymongo CommandListener)
+#
+# Bật bằng QUERY_MONITOR=1 (run_app.py / python app.py bật sẵn): mỗi response có
+#     X-DB-Queries: 4
+#     Server-Timing: db;dur=3.1;desc="4 MongoDB commands"     (tab Network / Timing của trình duyệt)
+# và log cảnh báo khi route vượt ngân sách khai báo trong QUERY_BUDGETS (app.py).
+# Tắt (mặc định ở production) thì listener không được gắn vào MongoClient: không tốn gì.
+#
+# Dùng trong test để chặn hồi quy N+1:
+#     app = create_app({"QUERY_MONITOR": True})
+#     client = app.test_client()        # đã đăng nhập
+#     assert_query_budget(client, "/my-library", 6)
+#     assert not check_budgets(app, client, ["/dashboard", "/my-library", "/search?q=python"])
+import contextvars
+import logging
+from contextlib import contextmanager
+
+from flask import request
+from pymongo import monitoring
+
+log = logging.getLogger("query_monitor")
+
+# Các QueryLog đang thu thập trong ngữ cảnh hiện tại (request + các count_queries() lồng nhau)
+_active = contextvars.ContextVar("query_logs", default=())
+
+
+class QueryLog:
+    def __init__(self):
+        self.commands = []      # [{"command", "collection", "database", "ms", "ok"}]
+        self._pending = {}      # request_id của pymongo -> mục trong commands
+
+    @property
+    def count(self):
+        return len(self.commands)
+
+    @property
+    def total_ms(self):
+        return round(sum(c["ms"] or 0 for c in self.commands), 2)
+
+    def by_collection(self):
+        """{"books.find": 2, ...} - dòng lặp lại nhiều là dấu hiệu N+1."""
+        summary = {}
+        for c in self.commands:
+            key = f"{c['collection'] or c['database']}.{c['command']}"
+            summary[key] = summary.get(key, 0) + 1
+        return summary
+
+    def summary(self):
+        return f"{self.count} lệnh, {self.total_ms} ms: " + ", ".join(
+            f"{key}×{n}" for key, n in sorted(self.by_collection().items(), key=lambda kv: -kv[1]))
+
+
+def _collection(event):
+    target = event.command.get(event.command_name)
+    if event.command_name == "getMore":
+        return event.command.get("collection")
+    return target if isinstance(target, str) else None
+
+
+class QueryListener(monitoring.CommandListener):
+    """Ghi mỗi lệnh vào các QueryLog đang mở của luồng / ngữ cảnh phát lệnh."""
+
+    def started(self, event):
+        logs = _active.get()
+        if not logs:
+            return
+        entry = {"command": event.command_name, "collection": _collection(event),
+                 "database": event.database_name, "ms": None, "ok": None}
+        for query_log in logs:
+            query_log.commands.append(entry)
+            query_log._pending[event.request_id] = entry
+
+    def _finish(self, event, ok):
+        for query_log in _active.get():
+            entry = query_log._pending.pop(event.request_id, None)
+            if entry is not None:
+                entry["ms"] = round(event.duration_micros / 1000, 3)
+                entry["ok"] = ok
+
+    def succeeded(self, event):
+        self._finish(event, True)
+
+    def failed(self, event):
+        self._finish(event, False)
+
+
+LISTENER = QueryListener()
+
+
+@contextmanager
+def count_queries():
+    """Thu mọi lệnh MongoDB phát ra trong khối with (kể cả request của test client)."""
+    query_log = QueryLog()
+    token = _active.set(_active.get() + (query_log,))
+    try:
+        yield query_log
+    finally:
+        _active.reset(token)
+
+
+def init_app(app, budgets=None):
+    """Gắn hook đếm lệnh theo request (listener phải được truyền vào MongoClient riêng)."""
+    if "query_monitor" in app.extensions:
+        return
+    app.extensions["query_monitor"] = budgets or {}
+
+    @app.before_request
+    def _start_query_log():
+        query_log = QueryLog()
+        request.environ["query_monitor.log"] = query_log
+        request.environ["query_monitor.token"] = _active.set(_active.get() + (query_log,))
+
+    @app.after_request
+    def _report_queries(response):
+        query_log = request.environ.get("query_monitor.log")
+        if query_log is None:
+            return response
+        response.headers["X-DB-Queries"] = str(query_log.count)
+        # Giá trị header phải là ASCII
+        response.headers.add("Server-Timing",
+                             f'db;dur={query_log.total_ms};desc="{query_log.count} MongoDB commands"')
+        budget = app.extensions["query_monitor"].get(request.endpoint)
+        if budget is not None and query_log.count > budget:
+            response.headers["X-DB-Query-Budget"] = f"exceeded {query_log.count}/{budget}"
+            log.warning("%s %s vượt ngân sách %d lệnh MongoDB - %s",
+                        request.method, request.path, budget, query_log.summary())
+        return response
+
+    @app.teardown_request
+    def _stop_query_log(exc):
+        token = request.environ.pop("query_monitor.token", None)
+        if token is not None:
+            try:
+                _active.reset(token)
+            except ValueError:
+                pass        # token tạo ở ngữ cảnh khác (response dạng stream)
+
+
+# ==================== HỖ TRỢ TEST ====================
+def assert_query_budget(client, path, budget, method="GET", **kwargs):
+    """Gửi request qua test client; AssertionError nếu số lệnh MongoDB vượt budget."""
+    with count_queries() as query_log:
+        response = client.open(path, method=method, **kwargs)
+    assert query_log.count <= budget, (
+        f"{method} {path}: {query_log.count} lệnh MongoDB > ngân sách {budget} ({query_log.summary()})")
+    return response
+
+
+def check_budgets(app, client, paths):
+    """
+    Chạy các path (GET) và so với ngân sách của endpoint tương ứng.
+    Trả [(path, endpoint, số lệnh, ngân sách, tóm tắt)] cho các route vượt ngân sách.
+    """
+    budgets = app.extensions.get("query_monitor") or {}
+    adapter = app.url_map.bind("localhost")
+    problems = []
+    for path in paths:
+        endpoint, _ = adapter.match(path.split("?", 1)[0])
+        budget = budgets.get(endpoint)
+        if budget is None:
+            raise KeyError(f"Chưa khai báo ngân sách cho endpoint {endpoint} ({path})")
+        with count_queries() as query_log:
+            client.get(path)
+        if query_log.count > budget:
+            problems.append((path, endpoint, query_log.count, budget, query_log.summary()))
+    return problems
@@ -0,0 +1,191 @@
+# resumable_upload.py - Upload sách lớn theo phiên, từng chunk, có thể tiếp tục khi bị ngắt
+#
+# Giao thức:
+#   1. Tạo phiên  -> nhận upload_id + chunk_size + total_chunks
+#   2. PUT chunk n (thân request = dữ liệu, header X-Chunk-SHA256) - gửi lại chunk đã xác nhận là no-op
+#   3. Hỏi trạng thái phiên để biết chunk nào còn thiếu (tiếp tục sau khi mất kết nối)
+#   4. Finalize -> kiểm tra đủ chunk, tính SHA-256 toàn file, ghi fs.files (có khử trùng)
+#
+# Mỗi chunk của client chính là một chunk GridFS (cùng chunk_size), ghi thẳng vào
+# fs.chunks nên worker chỉ giữ một chunk trong RAM, bất kể file lớn thế nào.
+import hashlib
+import math
+from datetime import datetime, timedelta
+
+from bson import Binary, ObjectId
+
+from blob_store import register_chunked_blob
+
+SESSION_TTL = timedelta(hours=24)
+
+
+class UploadError(Exception):
+    """Lỗi giao thức upload, kèm HTTP status để route trả về."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def create_session(db, filename, total_size, chunk_size, user_id,
+                   content_type=None, book_id=None):
+    if total_size <= 0:
+        raise UploadError("Kích thước file không hợp lệ")
+    expire_stale_sessions(db)
+    now = datetime.now()
+    session = {
+        "_id": ObjectId(),
+        "file_id": ObjectId(),          # id GridFS dùng cho các chunk
+        "filename": filename,
+        "content_type": content_type,
+        "total_size": total_size,
+        "chunk_size": chunk_size,
+        "total_chunks": math.ceil(total_size / chunk_size),
+        "chunks": {},                   # {"n": sha256} các chunk đã xác nhận
+        "book_id": book_id,             # sửa file cho sách có sẵn (None = tạo sách mới)
+        "user_id": user_id,
+        "status": "open",
+        "created_at": now,
+        "updated_at": now,
+    }
+    db.upload_sessions.insert_one(session)
+    return session
+
+
+def get_session(db, upload_id):
+    try:
+        session = db.upload_sessions.find_one({"_id": ObjectId(upload_id)})
+    except Exception:
+        session = None
+    if not session:
+        raise UploadError("Không tìm thấy phiên upload", 404)
+    return session
+
+
+def session_status(session):
+    """Trạng thái để client biết cần gửi tiếp chunk nào."""
+    received = sorted(int(n) for n in session["chunks"])
+    received_set = set(received)
+    return {
+        "upload_id": str(session["_id"]),
+        "status": session["status"],
+        "filename": session["filename"],
+        "total_size": session["total_size"],
+        "chunk_size": session["chunk_size"],
+        "total_chunks": session["total_chunks"],
+        "received": received,
+        "missing": [n for n in range(session["total_chunks"]) if n not in received_set],
+        "file_id": str(session["file_id"]) if session["status"] == "finalized" else None,
+        "book_id": str(session["book_id"]) if session.get("book_id") else None,
+    }
+
+
+def _expected_length(session, n):
+    if n < session["total_chunks"] - 1:
+        return session["chunk_size"]
+    return session["total_size"] - session["chunk_size"] * (session["total_chunks"] - 1)
+
+
+def put_chunk(db, session, n, data, checksum):
+    """Ghi chunk n vào fs.chunks (idempotent: gửi lại cùng nội dung không làm gì thêm)."""
+    if session["status"] != "open":
+        raise UploadError("Phiên upload đã kết thúc", 409)
+    if not 0 <= n < session["total_chunks"]:
+        raise UploadError("Số thứ tự chunk không hợp lệ")
+    if len(data) != _expected_length(session, n):
+        raise UploadError("Kích thước chunk không đúng")
+    digest = hashlib.sha256(data).hexdigest()
+    if checksum and checksum.lower() != digest:
+        raise UploadError("Checksum chunk không khớp, hãy gửi lại", 422)
+
+    confirmed = session["chunks"].get(str(n))
+    if confirmed == digest:
+        return digest
+    db.fs.chunks.replace_one(
+        {"files_id": session["file_id"], "n": n},
+        {"files_id": session["file_id"], "n": n, "data": Binary(data)},
+        upsert=True
+    )
+    db.upload_sessions.update_one(
+        {"_id": session["_id"]},
+        {"$set": {f"chunks.{n}": digest, "updated_at": datetime.now()}}
+    )
+    session["chunks"][str(n)] = digest
+    return digest
+
+
+def finalize(db, session):
+    """
+    Kiểm tra đủ chunk, tính SHA-256 toàn file bằng cách đọc lần lượt từng chunk
+    và đăng ký blob vào GridFS. Trả (file_id, deduplicated).
+
+    Phiên được giành nguyên tử (open -> finalizing): hai request finalize cùng lúc
+    thì request thứ hai nhận 409 thay vì đăng ký blob / tạo sách lần nữa.
+    """
+    if session["status"] == "finalized":
+        # Gọi lại sau khi blob đã đăng ký (vd. lần trước lỗi trước khi tạo sách): kết quả đã lưu
+        return session["file_id"], session.get("deduplicated", False)
+    missing = session_status(session)["missing"]
+    if missing:
+        raise UploadError(f"Còn thiếu {len(missing)} chunk", 409)
+
+    claimed = db.upload_sessions.find_one_and_update(
+        {"_id": session["_id"], "status": "open"},
+        {"$set": {"status": "finalizing", "updated_at": datetime.now()}}
+    )
+    if claimed is None:
+        raise UploadError("Phiên upload đang được hoàn tất hoặc đã kết thúc", 409)
+    session["status"] = "finalizing"
+    try:
+        return _finalize_claimed(db, session)
+    except BaseException:
+        # Trả phiên về open để client gửi lại chunk lỗi / gọi finalize lần nữa
+        db.upload_sessions.update_one({"_id": session["_id"], "status": "finalizing"},
+                                      {"$set": {"status": "open", "updated_at": datetime.now()}})
+        session["status"] = "open"
+        raise
+
+
+def _finalize_claimed(db, session):
+    digest = hashlib.sha256()
+    length = 0
+    cursor = db.fs.chunks.find(
+        {"files_id": session["file_id"]}, {"data": 1, "n": 1}
+    ).sort("n", 1).batch_size(4)
+    for expected_n, chunk in enumerate(cursor):
+        if chunk["n"] != expected_n:
+            raise UploadError("Dữ liệu chunk không liên tục", 409)
+        digest.update(chunk["data"])
+        length += len(chunk["data"])
+    if length != session["total_size"]:
+        raise UploadError("Tổng kích thước không khớp", 409)
+
+    file_id, deduplicated = register_chunked_blob(
+        db, session["file_id"], digest.hexdigest(), length, session["chunk_size"],
+        session["filename"], session.get("content_type")
+    )
+    db.upload_sessions.update_one(
+        {"_id": session["_id"]},
+        {"$set": {"status": "finalized", "file_id": file_id, "deduplicated": deduplicated,
+                  "sha256": digest.hexdigest(), "updated_at": datetime.now()}}
+    )
+    session["status"] = "finalized"
+    session["file_id"] = file_id
+    session["deduplicated"] = deduplicated
+    return file_id, deduplicated
+
+
+def abort(db, session):
+    """Hủy phiên: xóa chunk đã ghi (nếu chưa finalize) và phiên."""
+    if session["status"] != "finalized":
+        db.fs.chunks.delete_many({"files_id": session["file_id"]})
+    db.upload_sessions.delete_one({"_id": session["_id"]})
+
+
+def expire_stale_sessions(db, ttl=SESSION_TTL):
+    """Dọn phiên bỏ dở quá hạn (kèm các chunk mồ côi)."""
+    cutoff = datetime.now() - ttl
+    for stale in db.upload_sessions.find({"updated_at": {"$lt": cutoff}},
+                                         {"file_id": 1, "status": 1}):
+        abort(db, stale)
@@ -1,4 +1,8 @@
 ﻿# run_app.py - Script khởi chạy ứng dụng với kiểm tra
+#
+#     python run_app.py             # server phát triển (debug, reloader)
+#     python run_app.py --install   # cài requirements.txt trước (lần đầu)
+#     python run_app.py --prod      # sau các bước kiểm tra, chạy production qua serve.py
 import subprocess
 import sys
 import os
@@ -49,6 +53,11 @@ def setup_sample_data():
         print("⏭️  Bỏ qua tạo dữ liệu mẫu")
         return True
 
+def bootstrap():
+    """Tạo / cập nhật index MongoDB theo schema.py và tài khoản admin mặc định"""
+    print("\n🔧 Khởi tạo index + tài khoản admin...")
+    return subprocess.call([sys.executable, "bootstrap.py", "all"]) == 0
+
 def main():
     print("🚀 KHỞI CHẠY ỨNG DỤNG THƯ VIỆN SỐ")
     print("=" * 50)
@@ -57,8 +66,8 @@ def main():
     print("📁 Tạo các thư mục cần thiết...")
     create_directories()
     
-    # Cài đặt requirements
-    if not install_requirements():
+    # Cài đặt requirements (chỉ khi được yêu cầu, không chạy pip ở mỗi lần khởi động)
+    if "--install" in sys.argv and not install_requirements():
         print("❌ Không thể cài đặt các package cần thiết")
         return
     
@@ -70,7 +79,18 @@ def main():
     # Thiết lập dữ liệu mẫu
     if not setup_sample_data():
         print("⚠️  Có lỗi khi thiết lập dữ liệu mẫu, nhưng ứng dụng vẫn có thể chạy")
+
+    # Index + admin (sau dữ liệu mẫu: gộp bản ghi trùng trước khi tạo index unique)
+    if not bootstrap():
+        print("⚠️  Có bước khởi tạo chưa thành công, truy vấn có thể chậm")
     
+    # Production: nhiều process qua gunicorn
+    if "--prod" in sys.argv:
+        print("\n🎯 Khởi chạy production (serve.py)...")
+        from serve import main as serve
+        serve()
+        return
+
     # Chạy ứng dụng
     print("\n🎯 Khởi chạy ứng dụng...")
     print("🌐 Ứng dụng sẽ chạy tại: http://localhost:5000")
@@ -78,8 +98,8 @@ def main():
     print("-" * 50)
     
     try:
-        import app
-        app.app.run(debug=True, host='0.0.0.0', port=5000)
+        from app import create_app
+        create_app({"QUERY_MONITOR": True}).run(debug=True, host='0.0.0.0', port=5000)
     except ImportError as e:
         print(f"❌ Lỗi import app.py: {e}")
         print("💡 Đảm bảo file app.py tồn tại trong cùng thư mục")
@@ -0,0 +1,240 @@
+# schema.py - Khai báo mọi index của ứng dụng + kiểm tra query plan (không COLLSCAN)
+#
+# Index không còn được tạo lúc import app; chạy lệnh khi triển khai / sau khi đổi schema:
+#
+#     python schema.py apply        # tạo index (gộp bản ghi trùng trước khi tạo index unique)
+#     python schema.py verify       # explain() mọi dạng truy vấn của route, COLLSCAN -> exit 1
+#     python schema.py list         # in danh sách index đã khai báo
+import sys
+from collections import namedtuple
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from paging import after_filter
+from search_engine import CHANGE_TTL
+
+Index = namedtuple("Index", "collection keys options")
+QueryShape = namedtuple("QueryShape", "name collection filter sort")
+
+
+def _index(collection, keys, **options):
+    if isinstance(keys, str):
+        keys = [(keys, 1)]
+    return Index(collection, keys, options)
+
+
+INDEXES = [
+    # Người dùng
+    _index("users", "email", unique=True),
+    _index("users", [("created_at", -1), ("_id", -1)]),
+    _index("users", [("status", 1), ("created_at", -1), ("_id", -1)]),
+    _index("users", [("role", 1), ("created_at", -1), ("_id", -1)]),
+    # Sách
+    _index("books", [("title", "text"), ("author", "text"), ("description", "text")]),
+    _index("books", [("created_at", -1), ("_id", -1)]),
+    # Bộ lọc của bảng quản trị: khóa bằng nhau trước, rồi khóa phân trang keyset
+    _index("books", [("author", 1), ("created_at", -1), ("_id", -1)]),
+    _index("books", [("published_year", 1), ("created_at", -1), ("_id", -1)]),
+    _index("books", [("ingest_status", 1), ("created_at", -1), ("_id", -1)]),
+    _index("books", "file_id"),
+    # Gợi ý tìm kiếm đọc lượt tải theo sách (chỉ sách đã có lượt tải)
+    _index("books", [("download_count", -1)],
+           partialFilterExpression={"download_count": {"$gt": 0}}),
+    # Hoạt động của người dùng
+    _index("downloads", [("user_id", 1), ("downloaded_at", -1)]),
+    _index("downloads", "book_id"),
+    _index("favorites", [("user_id", 1), ("book_id", 1)], unique=True),
+    _index("favorites", [("user_id", 1), ("created_at", -1)]),
+    _index("favorites", "book_id"),
+    _index("reading_history", [("user_id", 1), ("book_id", 1)], unique=True),
+    _index("reading_history", [("user_id", 1), ("updated_at", -1)]),
+    _index("reading_history", "book_id"),
+    # GridFS: khử trùng file sách theo SHA-256 (file cũ chưa có sha256 không bị ràng buộc)
+    _index("fs.files", "sha256", unique=True,
+           partialFilterExpression={"sha256": {"$exists": True}}),
+    _index("fs.chunks", [("files_id", 1), ("n", 1)], unique=True),
+    # Rendition ảnh bìa theo (ảnh gốc, kích thước, định dạng)
+    _index("images.files", [("metadata.original_id", 1), ("metadata.size", 1),
+                            ("metadata.format", 1)]),
+    _index("images.chunks", [("files_id", 1), ("n", 1)], unique=True),
+    # Upload nhiều phần / hàng đợi job / index nội dung / log đồng bộ tìm kiếm
+    _index("upload_sessions", "updated_at"),
+    _index("ingest_jobs", [("status", 1), ("run_after", 1)]),
+    _index("ingest_jobs", [("book_id", 1), ("kind", 1)]),
+    # default_language "none": không stem/stopword (MongoDB không hỗ trợ tiếng Việt)
+    _index("book_pages", [("text", "text")], default_language="none", name="book_pages_text"),
+    _index("book_pages", [("book_id", 1), ("page", 1)]),
+    _index("search_changes", "ts", expireAfterSeconds=int(CHANGE_TTL.total_seconds())),
+]
+
+# Cặp (user_id, book_id) phải duy nhất: bản ghi trùng cũ bị gộp (giữ bản mới nhất) trước khi tạo index
+UNIQUE_PAIRS = {"favorites": "created_at", "reading_history": "updated_at"}
+
+
+def _sample():
+    return ObjectId()
+
+
+NEWEST_FIRST = [("created_at", -1), ("_id", -1)]
+
+
+def _after(query):
+    """Dạng truy vấn của trang thứ 2 trở đi trong phân trang keyset."""
+    cursor = after_filter(NEWEST_FIRST, [datetime.now(), _sample()])
+    return {"$and": [query, cursor]} if query else cursor
+
+
+# Mọi dạng truy vấn find() mà route / module dùng (giá trị mẫu, chỉ để lấy query plan)
+QUERY_SHAPES = [
+    QueryShape("login: users theo email", "users", {"email": "a@b.c"}, None),
+    QueryShape("admin_users", "users", _after({}), NEWEST_FIRST),
+    QueryShape("admin_users: lọc trạng thái", "users", _after({"status": "Blocked"}), NEWEST_FIRST),
+    QueryShape("admin_users: lọc vai trò", "users", _after({"role": "Admin"}), NEWEST_FIRST),
+    QueryShape("user_dashboard", "books", {}, [("created_at", -1)]),
+    QueryShape("admin_books / search_books: duyệt theo trang", "books", _after({}), NEWEST_FIRST),
+    QueryShape("admin_books: lọc tác giả", "books", _after({"author": "x"}), NEWEST_FIRST),
+    QueryShape("admin_books: lọc năm", "books", _after({"published_year": 2020}), NEWEST_FIRST),
+    QueryShape("admin_books: lọc trạng thái xử lý", "books", _after({"ingest_status": "failed"}),
+               NEWEST_FIRST),
+    QueryShape("api_related_books", "books", {"author": "x", "_id": {"$ne": _sample()}},
+               [("created_at", -1)]),
+    QueryShape("reuse_derived_fields", "books", {"file_id": _sample(), "preview": {"$nin": [None, ""]}},
+               None),
+    QueryShape("my_library: downloads", "downloads", {"user_id": _sample()}, [("downloaded_at", -1)]),
+    QueryShape("admin_delete_book: downloads", "downloads", {"book_id": _sample()}, None),
+    QueryShape("toggle_favorite / book_detail", "favorites",
+               {"user_id": _sample(), "book_id": _sample()}, None),
+    QueryShape("my_library: favorites", "favorites", {"user_id": _sample()}, [("created_at", -1)]),
+    QueryShape("admin_delete_book: favorites", "favorites", {"book_id": _sample()}, None),
+    QueryShape("book_detail: reading_history", "reading_history",
+               {"user_id": _sample(), "book_id": _sample()}, None),
+    QueryShape("my_library: reading_history", "reading_history", {"user_id": _sample()},
+               [("updated_at", -1)]),
+    QueryShape("admin_delete_book: reading_history", "reading_history", {"book_id": _sample()}, None),
+    QueryShape("blob_store: blob theo sha256", "fs.files", {"sha256": "0" * 64}, None),
+    QueryShape("get_cover: rendition", "images.files",
+               {"metadata.original_id": _sample(), "metadata.size": "card", "metadata.format": "webp"},
+               None),
+    QueryShape("delete_renditions", "images.files", {"metadata.original_id": _sample()}, None),
+    QueryShape("expire_stale_sessions", "upload_sessions", {"updated_at": {"$lt": datetime.now()}}, None),
+    QueryShape("ingest_jobs.claim_next", "ingest_jobs",
+               {"$or": [{"status": "queued", "run_after": {"$lte": datetime.now()}},
+                        {"status": "running", "locked_until": {"$lt": datetime.now()}}]},
+               [("run_after", 1)]),
+    QueryShape("ingest_jobs.job_status", "ingest_jobs",
+               {"book_id": _sample(), "status": {"$in": ["queued", "running"]}}, [("created_at", 1)]),
+    QueryShape("content_index: trang của sách", "book_pages", {"book_id": _sample()}, None),
+    QueryShape("search_engine.refresh", "search_changes", {"ts": {"$gte": datetime.now()}}, None),
+    QueryShape("search_engine.refresh_popularity", "books", {"download_count": {"$gt": 0}}, None),
+]
+
+
+# ==================== ÁP DỤNG ====================
+def dedupe_pairs(db, collection, newest_field):
+    """Gộp bản ghi trùng (user_id, book_id): giữ bản có newest_field mới nhất. Trả số bản đã xóa."""
+    removed = 0
+    duplicates = db[collection].aggregate([
+        {"$sort": {newest_field: -1}},
+        {"$group": {"_id": {"user_id": "$user_id", "book_id": "$book_id"},
+                    "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    for group in duplicates:
+        removed += db[collection].delete_many({"_id": {"$in": group["ids"][1:]}}).deleted_count
+    return removed
+
+
+def apply_indexes(db, verbose=True):
+    """Tạo mọi index đã khai báo (create_index idempotent: index đã có thì bỏ qua)."""
+    for collection, newest_field in UNIQUE_PAIRS.items():
+        removed = dedupe_pairs(db, collection, newest_field)
+        if removed and verbose:
+            print(f"   🧹 {collection}: gộp {removed} bản ghi trùng (user_id, book_id)")
+    failed = 0
+    for index in INDEXES:
+        try:
+            name = db[index.collection].create_index(index.keys, **index.options)
+            if verbose:
+                print(f"   ✅ {index.collection}.{name}")
+        except OperationFailure as e:
+            failed += 1
+            print(f"   ❌ {index.collection} {index.keys}: {e}")
+    return failed == 0
+
+
+# ==================== KIỂM TRA QUERY PLAN ====================
+def _stages(plan):
+    """Mọi stage trong cây query plan (kể cả các nhánh $or)."""
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+def explain_shape(db, shape):
+    cursor = db[shape.collection].find(shape.filter)
+    if shape.sort:
+        cursor = cursor.sort(shape.sort)
+    plan = cursor.limit(20).explain()["queryPlanner"]["winningPlan"]
+    return set(_stages(plan))
+
+
+def verify(db, shapes=QUERY_SHAPES):
+    """Trả [(tên, collection, các stage)] cho các truy vấn bị COLLSCAN."""
+    problems = []
+    for shape in shapes:
+        stages = explain_shape(db, shape)
+        if "COLLSCAN" in stages:
+            problems.append((shape.name, shape.collection, sorted(s for s in stages if s)))
+    return problems
+
+
+def assert_no_collscan(db, shapes=QUERY_SHAPES):
+    """Dùng trong test / CI: AssertionError liệt kê mọi truy vấn quét toàn collection."""
+    problems = verify(db, shapes)
+    assert not problems, "COLLSCAN: " + "; ".join(f"{name} ({coll})" for name, coll, _ in problems)
+
+
+def main():
+    import argparse
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Quản lý index MongoDB của Thư viện Số")
+    parser.add_argument("command", choices=["apply", "verify", "list"])
+    parser.add_argument("--report-only", action="store_true",
+                        help="verify: chỉ báo cáo, không trả exit code lỗi")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for index in INDEXES:
+            print(f"{index.collection:18} {index.keys} {index.options or ''}")
+        return
+
+    import data_access
+    settings = data_access.settings_from_env()
+    client = MongoClient(settings["MONGO_URI"], serverSelectionTimeoutMS=5000)
+    db = client[settings["MONGO_DB"]]
+    if args.command == "apply":
+        print(f"🔧 Tạo {len(INDEXES)} index...")
+        sys.exit(0 if apply_indexes(db) else 1)
+
+    existing = set(db.list_collection_names())
+    problems = verify(db)
+    for shape in QUERY_SHAPES:
+        mark = "❌" if any(p[0] == shape.name for p in problems) else "✅"
+        note = "" if shape.collection in existing else " (collection chưa tồn tại)"
+        print(f"   {mark} {shape.name} [{shape.collection}]{note}")
+    if problems:
+        print(f"⚠️  {len(problems)} truy vấn quét toàn collection - chạy: python schema.py apply")
+        if not args.report_only:
+            sys.exit(1)
+    else:
+        print("✅ Mọi truy vấn đều dùng index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,514 @@
+# search_engine.py - Công cụ tìm sách trong bộ nhớ, hiểu tiếng Việt (bỏ dấu) và xếp hạng BM25
+#
+# - Tách từ theo âm tiết, bỏ dấu thanh / dấu mũ, đ -> d: "lap trinh" khớp "Lập trình".
+#   Thêm cặp âm tiết liền nhau (lap_trinh) để từ ghép tiếng Việt được xếp cao hơn khớp rời.
+# - Inverted index: term -> array('I') các số nguyên docnum * số_trường + trường, kèm array('H') tần suất.
+#   Số sách chứa mỗi term (df của BM25) được duy trì khi thêm / gỡ sách, không đếm lại lúc tìm.
+# - BM25 theo từng trường (title/author/description/preview) có hệ số ưu tiên.
+# - Cập nhật tăng dần: mỗi lần thêm / sửa / xóa sách ghi một dòng vào search_changes;
+#   mọi worker đọc log này định kỳ nên index các process luôn đồng bộ.
+# - Snapshot ra file để worker khởi động là có index ngay, chỉ cần đọc bù log.
+# - Gợi ý khi gõ (SuggestIndex): mảng khóa đã sắp xếp + tìm nhị phân theo tiền tố,
+#   xếp theo lượt tải (books.download_count do write-behind duy trì); trả lời hoàn toàn từ bộ nhớ.
+# - Nạp / dựng index, đọc log thay đổi, lượt tải và ghi snapshot đều chạy ở luồng nền của
+#   worker: request tìm kiếm / gợi ý không bao giờ chờ MongoDB vì việc bảo trì index.
+#
+#     python search_engine.py --rebuild        # dựng lại index + ghi snapshot
+import array
+import bisect
+import math
+import os
+import pickle
+import re
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from paging import encode_cursor, decode_cursor
+
+FIELDS = ("title", "author", "description", "preview")
+FIELD_BOOSTS = (3.0, 2.0, 1.0, 0.5)
+K1 = 1.2
+B = 0.75
+
+SNAPSHOT_VERSION = 2
+SNAPSHOT_INTERVAL = 600                     # giây giữa hai lần ghi snapshot
+CHANGE_TTL = timedelta(days=7)              # log thay đổi giữ 7 ngày; snapshot cũ hơn -> dựng lại
+SYNC_OVERLAP = timedelta(seconds=10)        # đọc chồng lấn để không sót thay đổi ghi trễ / lệch giờ
+COMPACT_RATIO = 0.25
+POPULARITY_SECONDS = 300                    # chu kỳ đọc lại số lượt tải cho gợi ý
+SUGGEST_SCAN_LIMIT = 2000                   # số khóa tối đa duyệt cho một tiền tố
+
+_NF = len(FIELDS)
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def fold(text):
+    """Chữ thường, bỏ dấu tiếng Việt: "Lập Trình Đồ Họa" -> "lap trinh do hoa"."""
+    text = unicodedata.normalize("NFD", text.replace("đ", "d").replace("Đ", "D"))
+    return "".join(ch for ch in text if unicodedata.category(ch) != "Mn").lower()
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(fold(text or ""))
+
+
+def _terms(tokens):
+    """Âm tiết + cặp âm tiết liền kề."""
+    return tokens + [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def record_change(db, book_id):
+    """Báo cho mọi worker biết sách cần index lại (dùng cả ở process không giữ index)."""
+    db.search_changes.insert_one({"book_id": ObjectId(book_id), "ts": datetime.now()})
+
+
+class SuggestIndex:
+    """
+    Gợi ý tên sách / tác giả theo tiền tố (đã bỏ dấu) của bất kỳ từ nào trong tên:
+    "trinh" gợi ý "Lập trình Python". Mỗi từ bắt đầu một khóa trong mảng keys đã sắp xếp.
+    Không tự khóa: SearchEngine giữ lock khi gọi.
+    """
+
+    def __init__(self):
+        self.keys = []          # khóa đã sắp xếp
+        self.refs = []          # song song với keys: ("b", book_id) | ("a", khóa tác giả)
+        self.books = {}         # book_id -> (title, author)
+        self.authors = {}       # khóa tác giả -> {"name": tên hiển thị, "books": {book_id}}
+        self.popularity = {}    # book_id -> số lượt tải
+
+    @staticmethod
+    def _word_keys(label):
+        words = tokenize(label)
+        return [" ".join(words[i:]) for i in range(len(words))]
+
+    def _insert(self, key, ref, bulk):
+        if bulk:
+            self.keys.append(key)
+            self.refs.append(ref)
+            return
+        i = bisect.bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.refs.insert(i, ref)
+
+    def _delete(self, key, ref):
+        i = bisect.bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i] == key:
+            if self.refs[i] == ref:
+                del self.keys[i], self.refs[i]
+                return
+            i += 1
+
+    def set_book(self, book, bulk=False):
+        """Thêm / cập nhật sách. bulk=True: chỉ nối thêm, gọi finish() để sắp xếp một lần."""
+        self.remove_book(book["_id"])
+        title = (book.get("title") or "").strip()
+        author = (book.get("author") or "").strip()
+        self.books[book["_id"]] = (title, author)
+        for key in self._word_keys(title):
+            self._insert(key, ("b", book["_id"]), bulk)
+        author_key = " ".join(tokenize(author))
+        if author_key:
+            entry = self.authors.get(author_key)
+            if entry is None:
+                entry = self.authors[author_key] = {"name": author, "books": set()}
+                for key in self._word_keys(author):
+                    self._insert(key, ("a", author_key), bulk)
+            entry["books"].add(book["_id"])
+
+    def remove_book(self, book_id):
+        old = self.books.pop(book_id, None)
+        if old is None:
+            return
+        title, author = old
+        for key in self._word_keys(title):
+            self._delete(key, ("b", book_id))
+        author_key = " ".join(tokenize(author))
+        entry = self.authors.get(author_key)
+        if entry is not None:
+            entry["books"].discard(book_id)
+            if not entry["books"]:
+                del self.authors[author_key]
+                for key in self._word_keys(author):
+                    self._delete(key, ("a", author_key))
+
+    def finish(self):
+        order = sorted(range(len(self.keys)), key=self.keys.__getitem__)
+        self.keys = [self.keys[i] for i in order]
+        self.refs = [self.refs[i] for i in order]
+
+    def load(self, books):
+        """Dựng lại từ {book_id: (title, author)} (snapshot)."""
+        self.__init__()
+        for book_id, (title, author) in books.items():
+            self.set_book({"_id": book_id, "title": title, "author": author}, bulk=True)
+        self.finish()
+
+    def suggest(self, prefix, limit=8):
+        """Các gợi ý khớp tiền tố, xếp theo lượt tải, rồi ưu tiên khớp từ đầu tên, tên ngắn."""
+        prefix = " ".join(tokenize(prefix))
+        if not prefix:
+            return []
+        candidates = {}
+        i = bisect.bisect_left(self.keys, prefix)
+        end = min(len(self.keys), i + SUGGEST_SCAN_LIMIT)
+        while i < end and self.keys[i].startswith(prefix):
+            ref = self.refs[i]
+            if ref[0] == "b":
+                label = self.books[ref[1]][0]
+                popularity = self.popularity.get(ref[1], 0)
+            else:
+                entry = self.authors[ref[1]]
+                label = entry["name"]
+                popularity = sum(self.popularity.get(b, 0) for b in entry["books"])
+            from_start = " ".join(tokenize(label)).startswith(prefix)
+            rank = (-popularity, not from_start, len(label), label)
+            if ref not in candidates or rank < candidates[ref][0]:
+                candidates[ref] = (rank, label)
+            i += 1
+        ranked = sorted(candidates.items(), key=lambda item: item[1][0])[:limit]
+        suggestions = []
+        for (kind, value), (rank, label) in ranked:
+            if kind == "b":
+                suggestions.append({"type": "book", "label": label, "book_id": str(value),
+                                    "downloads": -rank[0]})
+            else:
+                suggestions.append({"type": "author", "label": label, "downloads": -rank[0]})
+        return suggestions
+
+
+class SearchEngine:
+    def __init__(self, snapshot_path=None, refresh_seconds=5.0):
+        self.snapshot_path = snapshot_path
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.RLock()
+        self._reset()
+        self.loaded = False
+        self.synced_at = None           # mốc ts của search_changes đã áp dụng
+        self._checked_at = 0.0
+        self._saved_at = 0.0
+        self._popularity_at = 0.0
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._kick = threading.Event()  # book_changed đánh thức luồng nền đọc log ngay
+
+    def _reset(self):
+        self.doc_ids = []                                   # docnum -> ObjectId
+        self.docnums = {}                                   # ObjectId -> docnum
+        self.years = array.array("i")
+        self.lengths = [array.array("I") for _ in FIELDS]
+        self.total_lengths = [0] * _NF
+        self.postings = {}                                  # term -> array('I')
+        self.freqs = {}                                     # term -> array('H')
+        self.df = Counter()                                 # term -> số sách còn sống chứa term
+        self.doc_terms = []                                 # docnum -> tuple term (None nếu đã gỡ)
+        self.deleted = set()
+        self.suggest = SuggestIndex()
+
+    # ==================== CẬP NHẬT ====================
+    def _add(self, book, bulk=False):
+        self._remove(book["_id"])
+        self.suggest.set_book(book, bulk)
+        docnum = len(self.doc_ids)
+        self.doc_ids.append(book["_id"])
+        self.docnums[book["_id"]] = docnum
+        year = book.get("published_year")
+        self.years.append(year if isinstance(year, int) else 0)
+        seen = set()
+        for f, field in enumerate(FIELDS):
+            value = book.get(field)
+            tokens = tokenize(value if isinstance(value, str) else "")
+            self.lengths[f].append(len(tokens))
+            self.total_lengths[f] += len(tokens)
+            for term, tf in Counter(_terms(tokens)).items():
+                term = sys.intern(term)     # doc_terms dùng chung chuỗi với khóa của postings
+                seen.add(term)
+                if term not in self.postings:
+                    self.postings[term] = array.array("I")
+                    self.freqs[term] = array.array("H")
+                self.postings[term].append(docnum * _NF + f)
+                self.freqs[term].append(min(tf, 0xFFFF))
+        self.doc_terms.append(tuple(seen))
+        self.df.update(seen)
+
+    def _remove(self, book_id):
+        docnum = self.docnums.pop(book_id, None)
+        if docnum is None:
+            return
+        self.suggest.remove_book(book_id)
+        self.deleted.add(docnum)
+        for f in range(_NF):
+            self.total_lengths[f] -= self.lengths[f][docnum]
+        for term in self.doc_terms[docnum]:
+            self.df[term] -= 1
+            if not self.df[term]:
+                del self.df[term]
+        self.doc_terms[docnum] = None
+
+    def _derive_doc_terms(self):
+        """Dựng doc_terms / df từ postings (sau khi nạp snapshot - không lưu hai thứ này trong file)."""
+        doc_terms = [set() for _ in self.doc_ids]
+        for term, postings in self.postings.items():
+            for p in postings:
+                doc_terms[p // _NF].add(term)
+        self.doc_terms = [None if docnum in self.deleted else tuple(terms)
+                          for docnum, terms in enumerate(doc_terms)]
+        self.df = Counter()
+        for terms in self.doc_terms:
+            if terms:
+                self.df.update(terms)
+
+    def _compact(self):
+        """Bỏ hẳn các docnum đã xóa khỏi postings khi chúng chiếm quá nhiều chỗ."""
+        remap = {}
+        for old, book_id in enumerate(self.doc_ids):
+            if old not in self.deleted:
+                remap[old] = len(remap)
+        self.doc_ids = [self.doc_ids[old] for old in remap]
+        self.docnums = {book_id: new for new, book_id in enumerate(self.doc_ids)}
+        self.years = array.array("i", (self.years[old] for old in remap))
+        self.lengths = [array.array("I", (lengths[old] for old in remap)) for lengths in self.lengths]
+        self.doc_terms = [self.doc_terms[old] for old in remap]
+        for term in list(self.postings):
+            postings = array.array("I")
+            freqs = array.array("H")
+            for p, tf in zip(self.postings[term], self.freqs[term]):
+                new = remap.get(p // _NF)
+                if new is not None:
+                    postings.append(new * _NF + p % _NF)
+                    freqs.append(tf)
+            if postings:
+                self.postings[term], self.freqs[term] = postings, freqs
+            else:
+                del self.postings[term], self.freqs[term]
+        self.deleted = set()
+
+    def apply(self, db, book_ids):
+        """Đọc lại các sách từ MongoDB: còn thì index lại, mất thì gỡ khỏi index."""
+        book_ids = list({ObjectId(b) for b in book_ids})
+        if not book_ids:
+            return
+        projection = dict.fromkeys(FIELDS + ("published_year",), 1)
+        found = {b["_id"]: b for b in db.books.find({"_id": {"$in": book_ids}}, projection)}
+        with self._lock:
+            for book_id in book_ids:
+                if book_id in found:
+                    self._add(found[book_id])
+                else:
+                    self._remove(book_id)
+            if len(self.deleted) > COMPACT_RATIO * max(len(self.doc_ids), 1):
+                self._compact()
+
+    def book_changed(self, db, book_id):
+        """
+        Gọi sau khi thêm / sửa / xóa sách: ghi log (mọi worker đọc) và đánh thức luồng nền của
+        worker này đọc log ngay - request không chờ đọc lại sách / cập nhật index.
+        """
+        record_change(db, book_id)
+        self._checked_at = 0.0
+        self._kick.set()
+
+    # ==================== NẠP / ĐỒNG BỘ ====================
+    def build(self, db):
+        started = datetime.now()
+        projection = dict.fromkeys(FIELDS + ("published_year",), 1)
+        with self._lock:
+            self._reset()
+            for book in db.books.find({}, projection).batch_size(500):
+                self._add(book, bulk=True)
+            self.suggest.finish()
+            self.synced_at = started
+            self.loaded = True
+
+    def refresh(self, db):
+        """Áp dụng các thay đổi trong search_changes kể từ lần đồng bộ trước."""
+        since = self.synced_at - SYNC_OVERLAP
+        changed = set()
+        latest = self.synced_at
+        for change in db.search_changes.find({"ts": {"$gte": since}}, {"book_id": 1, "ts": 1}):
+            changed.add(change["book_id"])
+            latest = max(latest, change["ts"])
+        self.apply(db, changed)
+        self.synced_at = latest
+        self._checked_at = time.monotonic()
+
+    def refresh_popularity(self, db):
+        """Số lượt tải theo sách từ bộ đếm books.download_count (không quét db.downloads)."""
+        counts = {book["_id"]: book["download_count"]
+                  for book in db.books.find({"download_count": {"$gt": 0}}, {"download_count": 1})}
+        with self._lock:
+            self.suggest.popularity = counts
+            self._popularity_at = time.monotonic()
+
+    def warm_up(self, db):
+        """Nạp snapshot (hoặc dựng mới) rồi đọc bù log - chạy ở luồng nền hoặc CLI."""
+        if not self._load_snapshot(db):
+            self.build(db)
+            self.save_snapshot()
+        self.refresh(db)
+        self.refresh_popularity(db)
+
+    def maintain(self, db):
+        """Một vòng bảo trì: đọc log thay đổi, lượt tải và ghi snapshot khi tới hạn."""
+        if not self.loaded:
+            self.warm_up(db)
+            return
+        now = time.monotonic()
+        if now - self._checked_at >= self.refresh_seconds:
+            self.refresh(db)
+            if self.snapshot_path and now - self._saved_at >= SNAPSHOT_INTERVAL:
+                self.save_snapshot()
+        if now - self._popularity_at >= POPULARITY_SECONDS:
+            self.refresh_popularity(db)
+
+    def _run(self, db):
+        while not self._stop.is_set():
+            try:
+                self.maintain(db)
+            except Exception as e:
+                print(f"Lỗi cập nhật index tìm kiếm (sẽ thử lại): {e}")
+            self._kick.wait(self.refresh_seconds)
+            self._kick.clear()
+
+    def ensure_ready(self, db):
+        """
+        Khởi động luồng bảo trì của worker (lần đầu / sau fork) và báo index đã dùng được chưa.
+        Không bao giờ chặn request: lúc index còn đang nạp, trả False để route dùng đường dự phòng.
+        """
+        if self._thread is None or self._pid != os.getpid():
+            with self._lock:
+                if self._thread is None or self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run, args=(db,),
+                                                    name="search-index", daemon=True)
+                    self._thread.start()
+        return self.loaded
+
+    def close(self):
+        self._stop.set()
+        self._kick.set()
+
+    def _load_snapshot(self, db):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            return False
+        if state.get("version") != SNAPSHOT_VERSION or state["synced_at"] < datetime.now() - CHANGE_TTL:
+            return False
+        # Dữ liệu bị thay ngoài app (vd. create_sample_data) -> số sách lệch -> dựng lại
+        if len(state["docnums"]) != db.books.estimated_document_count():
+            return False
+        for key in ("doc_ids", "docnums", "years", "lengths", "total_lengths",
+                    "postings", "freqs", "deleted", "synced_at"):
+            setattr(self, key, state[key])
+        self._derive_doc_terms()
+        self.suggest.load(state["suggest_books"])
+        self.loaded = True
+        self._saved_at = time.monotonic()
+        return True
+
+    def save_snapshot(self):
+        """Ghi snapshot nguyên tử (file tạm rồi os.replace) để worker khác không đọc file dở."""
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            state = {"version": SNAPSHOT_VERSION, "synced_at": self.synced_at,
+                     "doc_ids": self.doc_ids, "docnums": self.docnums, "years": self.years,
+                     "lengths": self.lengths, "total_lengths": self.total_lengths,
+                     "postings": self.postings, "freqs": self.freqs, "deleted": self.deleted,
+                     "suggest_books": self.suggest.books}
+            directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self.snapshot_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self._saved_at = time.monotonic()
+
+    # ==================== TÌM KIẾM ====================
+    def search(self, query, year=None):
+        """Trả [(score, book_id)] xếp theo điểm giảm dần, rồi book_id giảm dần."""
+        terms = set(_terms(tokenize(query)))
+        with self._lock:
+            live = len(self.doc_ids) - len(self.deleted)
+            if not terms or live <= 0:
+                return []
+            avg = [max(total / live, 1.0) for total in self.total_lengths]
+            scores = defaultdict(float)
+            for term in terms:
+                postings = self.postings.get(term)
+                if postings is None:
+                    continue
+                df = self.df.get(term, 0)
+                if not df:
+                    continue
+                idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+                for p, tf in zip(postings, self.freqs[term]):
+                    docnum, f = divmod(p, _NF)
+                    if docnum in self.deleted or (year and self.years[docnum] != year):
+                        continue
+                    norm = tf + K1 * (1 - B + B * self.lengths[f][docnum] / avg[f])
+                    scores[docnum] += FIELD_BOOSTS[f] * idf * tf * (K1 + 1) / norm
+            ranked = [(score, self.doc_ids[docnum]) for docnum, score in scores.items()]
+        ranked.sort(reverse=True)
+        return ranked
+
+    def suggestions(self, prefix, limit=8):
+        with self._lock:
+            return self.suggest.suggest(prefix, limit)
+
+    def search_page(self, query, page_size, cursor=None, year=None):
+        """
+        Một trang kết quả cùng định dạng con trỏ với paging.text_search_page.
+        Trả (book_ids, next_cursor, total).
+        """
+        ranked = self.search(query, year)
+        total = len(ranked)
+        after = decode_cursor(cursor, 2)
+        if after is not None:
+            ranked = [r for r in ranked if r < (after[0], after[1])]
+        page = ranked[:page_size]
+        next_cursor = encode_cursor(list(page[-1])) if len(ranked) > page_size else None
+        return [book_id for _, book_id in page], next_cursor, total
+
+
+def main():
+    import argparse
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Dựng lại index tìm kiếm sách và ghi snapshot")
+    parser.add_argument("--rebuild", action="store_true", help="dựng lại toàn bộ từ db.books")
+    parser.add_argument("--snapshot", default=os.environ.get("SEARCH_INDEX_SNAPSHOT",
+                                                             "search_index.snapshot"))
+    args = parser.parse_args()
+
+    import data_access
+    settings = data_access.settings_from_env()
+    db = MongoClient(settings["MONGO_URI"])[settings["MONGO_DB"]]
+    engine = SearchEngine(args.snapshot)
+    started = time.monotonic()
+    if args.rebuild or not engine._load_snapshot(db):
+        engine.build(db)
+    engine.refresh(db)
+    engine.save_snapshot()
+    print(f"✅ Index {len(engine.docnums)} sách, {len(engine.postings)} term "
+          f"({time.monotonic() - started:.1f}s) -> {args.snapshot}")
+
+
+if __name__ == "__main__":
+    main()
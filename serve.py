@@ -0,0 +1,32 @@
+# serve.py - Khởi chạy production: gunicorn nhiều process theo gunicorn.conf.py
+#
+#     WEB_CONCURRENCY=8 WEB_THREADS=4 PORT=8000 python serve.py
+#
+# Không cài package, không debug, không reloader (dùng run_app.py cho môi trường phát triển).
+# Windows không có fork: chạy server đơn process nhiều thread của Werkzeug để dùng tạm.
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    os.chdir(HERE)
+    if os.name == "nt":
+        print("⚠️  gunicorn cần Linux/macOS - chạy server đơn process (không dùng cho production)")
+        from app import create_app
+        create_app().run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), threaded=True)
+        return
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        print("❌ Chưa cài gunicorn: pip install -r requirements.txt")
+        sys.exit(1)
+    print("🚀 Thư viện Số (production) - cấu hình: gunicorn.conf.py")
+    args = [sys.executable, "-m", "gunicorn", "-c", os.path.join(HERE, "gunicorn.conf.py")] + sys.argv[1:]
+    # Thay process hiện tại bằng gunicorn: tín hiệu (HUP reload, TERM tắt) tới thẳng master
+    os.execv(sys.executable, args)
+
+
+if __name__ == "__main__":
+    main()
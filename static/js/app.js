@@ -323,10 +323,142 @@ async function testMongoConnection() {
     }
 }
 
+// Theo dõi sách đang được worker nền xử lý (trang quản lý sách)
+function watchIngestBadges(root) {
+    const badges = root.querySelectorAll('[data-ingest-book]');
+    badges.forEach(badge => {
+        const bookId = badge.getAttribute('data-ingest-book');
+        const timer = setInterval(async function() {
+            try {
+                const response = await fetch(`/api/books/${bookId}/ingest-status`);
+                const data = await response.json();
+                if (data.status === 'done') {
+                    badge.className = 'badge bg-success ms-1';
+                    badge.textContent = 'Đã xử lý';
+                    clearInterval(timer);
+                } else if (data.status === 'failed') {
+                    badge.className = 'badge bg-danger ms-1';
+                    badge.textContent = 'Lỗi xử lý';
+                    badge.title = data.error || '';
+                    clearInterval(timer);
+                }
+            } catch (error) {
+                clearInterval(timer);
+            }
+        }, 3000);
+    });
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    watchIngestBadges(document);
+});
+
+// Bảng quản trị: "Tải thêm" lấy trang kế tiếp (JSON) và nối dòng vào bảng thay vì chuyển trang
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('[data-load-more]').forEach(button => {
+        const target = document.querySelector(button.getAttribute('data-target'));
+        if (!target) return;
+        button.addEventListener('click', async function(event) {
+            event.preventDefault();
+            if (button.classList.contains('disabled')) return;
+            button.classList.add('disabled');
+            try {
+                const url = new URL(button.getAttribute('data-load-more'), window.location.origin);
+                url.searchParams.set('after', button.getAttribute('data-cursor'));
+                const response = await fetch(url);
+                if (!response.ok) throw new Error(response.statusText);
+                const data = await response.json();
+                const rows = document.createElement('tbody');
+                rows.innerHTML = data.html;
+                watchIngestBadges(rows);
+                target.append(...rows.children);
+                if (data.next_cursor) {
+                    button.setAttribute('data-cursor', data.next_cursor);
+                    const next = new URL(button.href);
+                    next.searchParams.set('after', data.next_cursor);
+                    button.href = next.toString();
+                    button.classList.remove('disabled');
+                } else {
+                    button.remove();
+                }
+            } catch (error) {
+                // Lỗi mạng: chuyển sang trang kế tiếp như một liên kết thường
+                window.location.href = button.href;
+            }
+        });
+    });
+});
+
+// Upload sách lớn theo chunk, tự tiếp tục từ chunk cuối đã xác nhận
+// bookFields: {title, author, description, published_year} hoặc {book_id} để thay file sách có sẵn
+async function sha256Hex(buffer) {
+    if (!window.crypto || !window.crypto.subtle) return null;
+    const hash = await window.crypto.subtle.digest('SHA-256', buffer);
+    return Array.from(new Uint8Array(hash)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function uploadBookResumable(file, bookFields = {}, onProgress = null) {
+    const storageKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+    let state = null;
+
+    // Có phiên cũ chưa xong -> hỏi server còn thiếu chunk nào
+    const savedId = localStorage.getItem(storageKey);
+    if (savedId) {
+        const response = await fetch(`/api/uploads/${savedId}`);
+        if (response.ok) state = await response.json();
+    }
+    if (!state || state.status !== 'open') {
+        const response = await fetch('/api/uploads', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({
+                filename: file.name,
+                size: file.size,
+                content_type: file.type || null,
+                book_id: bookFields.book_id || null
+            })
+        });
+        state = await response.json();
+        if (!response.ok) throw new Error(state.message || 'Không tạo được phiên upload');
+        localStorage.setItem(storageKey, state.upload_id);
+    }
+
+    let done = state.total_chunks - state.missing.length;
+    for (const n of state.missing) {
+        const start = n * state.chunk_size;
+        const buffer = await file.slice(start, start + state.chunk_size).arrayBuffer();
+        const headers = {'Content-Type': 'application/octet-stream'};
+        const checksum = await sha256Hex(buffer);
+        if (checksum) headers['X-Chunk-SHA256'] = checksum;
+
+        let response = null;
+        for (let attempt = 0; attempt < 3; attempt++) {
+            response = await fetch(`/api/uploads/${state.upload_id}/chunks/${n}`, {
+                method: 'PUT', headers: headers, body: buffer
+            });
+            if (response.ok) break;
+        }
+        if (!response.ok) throw new Error(`Lỗi gửi chunk ${n}, hãy thử lại để tiếp tục`);
+        done += 1;
+        if (onProgress) onProgress(done / state.total_chunks);
+    }
+
+    const response = await fetch(`/api/uploads/${state.upload_id}/finalize`, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify(bookFields)
+    });
+    const result = await response.json();
+    if (!response.ok) throw new Error(result.message || 'Không hoàn tất được upload');
+    localStorage.removeItem(storageKey);
+    return result;
+}
+
 // Export functions for global use
 window.showLoading = showLoading;
 window.hideLoading = hideLoading;
 window.confirmDelete = confirmDelete;
 window.toggleDarkMode = toggleDarkMode;
 window.copyToClipboard = copyToClipboard;
+window.uploadBookResumable = uploadBookResumable;
 window.testMongoConnection = testMongoConnection;
\ No newline at end of file
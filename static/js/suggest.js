@@ -0,0 +1,80 @@
+// Gợi ý khi gõ cho ô tìm kiếm (input[data-suggest]) - gọi /api/search/suggest
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('input[data-suggest]').forEach(input => {
+        const box = document.createElement('div');
+        box.className = 'list-group position-absolute w-100 shadow-sm d-none';
+        box.style.zIndex = 1050;
+        box.style.top = '100%';
+        input.parentElement.classList.add('position-relative');
+        input.parentElement.appendChild(box);
+        input.setAttribute('autocomplete', 'off');
+
+        let timer = null;
+        let controller = null;
+        let active = -1;
+
+        const hide = () => { box.classList.add('d-none'); active = -1; };
+        const items = () => box.querySelectorAll('.list-group-item');
+
+        const render = suggestions => {
+            box.innerHTML = '';
+            suggestions.forEach(item => {
+                const link = document.createElement('a');
+                link.href = item.url;
+                link.className = 'list-group-item list-group-item-action d-flex justify-content-between align-items-center';
+                const label = document.createElement('span');
+                const icon = document.createElement('i');
+                icon.className = (item.type === 'book' ? 'fas fa-book' : 'fas fa-user') + ' me-2 text-muted';
+                label.appendChild(icon);
+                label.appendChild(document.createTextNode(item.label));
+                link.appendChild(label);
+                if (item.downloads) {
+                    const badge = document.createElement('small');
+                    badge.className = 'text-muted';
+                    badge.textContent = `${item.downloads} lượt tải`;
+                    link.appendChild(badge);
+                }
+                box.appendChild(link);
+            });
+            active = -1;
+            box.classList.toggle('d-none', suggestions.length === 0);
+        };
+
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            const q = input.value.trim();
+            if (!q) {
+                hide();
+                return;
+            }
+            timer = setTimeout(async () => {
+                if (controller) controller.abort();
+                controller = new AbortController();
+                try {
+                    const response = await fetch(`/api/search/suggest?q=${encodeURIComponent(q)}`,
+                                                 {signal: controller.signal});
+                    if (response.ok) render(await response.json());
+                } catch (error) {
+                    if (error.name !== 'AbortError') hide();
+                }
+            }, 120);
+        });
+
+        input.addEventListener('keydown', event => {
+            const list = items();
+            if (box.classList.contains('d-none') || !list.length) return;
+            if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+                event.preventDefault();
+                active = (active + (event.key === 'ArrowDown' ? 1 : -1) + list.length) % list.length;
+                list.forEach((el, i) => el.classList.toggle('active', i === active));
+            } else if (event.key === 'Enter' && active >= 0) {
+                event.preventDefault();
+                window.location = list[active].href;
+            } else if (event.key === 'Escape') {
+                hide();
+            }
+        });
+
+        input.addEventListener('blur', () => setTimeout(hide, 150));
+    });
+});
@@ -0,0 +1,143 @@
+# streaming.py - Trả file sách theo luồng (GridFS + file legacy), hỗ trợ Range/If-Range
+import mimetypes
+import os
+import time
+import unicodedata
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.wsgi import wrap_file
+
+from metrics import CountingReader
+
+# Kích thước khối đọc cho file legacy trên đĩa
+LOCAL_BUFFER_SIZE = 256 * 1024
+# Ảnh GridFS: _id không bao giờ đổi nội dung -> cho cache 1 năm
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Ảnh gốc trả thay cho rendition chưa được sinh: cache ngắn để lấy bản chuẩn sau backfill
+FALLBACK_MAX_AGE = 3600
+
+
+def _content_disposition(rv, download_name, as_attachment):
+    """Đặt header Content-Disposition (hỗ trợ tên file Unicode theo RFC 5987)."""
+    if not download_name:
+        return
+    value = "attachment" if as_attachment else "inline"
+    try:
+        download_name.encode("ascii")
+        rv.headers.set("Content-Disposition", value, filename=download_name)
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", download_name)
+        simple = simple.encode("ascii", "ignore").decode("ascii")
+        quoted = quote(download_name, safe="!#$&+-.^_`|~")
+        rv.headers.set("Content-Disposition", value,
+                       **{"filename": simple, "filename*": f"UTF-8''{quoted}"})
+
+
+def _gridfs_response(grid_out, mimetype, bucket):
+    """Response stream từ GridOut + validator (ETag theo _id, Last-Modified = upload_date)."""
+    data = wrap_file(request.environ, CountingReader(grid_out, bucket), buffer_size=grid_out.chunk_size)
+    rv = Response(data, mimetype=mimetype or "application/octet-stream",
+                  direct_passthrough=True)
+    rv.content_length = grid_out.length
+    if grid_out.upload_date is not None:
+        rv.last_modified = grid_out.upload_date
+    rv.set_etag(str(grid_out._id))
+    return rv
+
+
+def send_gridfs_file(grid_out, as_attachment=False, download_name=None, mimetype=None, bucket="fs"):
+    """
+    Trả GridOut dưới dạng stream: đọc từng chunk GridFS khi client nhận,
+    không bao giờ giữ cả file trong RAM.
+      - ETag lấy theo _id (file GridFS không đổi nội dung), Last-Modified = upload_date
+      - Range / If-Range -> 206 Partial Content (GridOut seek được nên nhảy thẳng tới chunk cần)
+    """
+    download_name = download_name or grid_out.filename
+    if mimetype is None:
+        mimetype = getattr(grid_out, "content_type", None)
+    if mimetype is None and download_name:
+        mimetype = mimetypes.guess_type(download_name)[0]
+
+    rv = _gridfs_response(grid_out, mimetype, bucket)
+    _content_disposition(rv, download_name, as_attachment)
+    rv.cache_control.no_cache = True
+    # Báo trước cho trình xem PDF / trình tải rằng có thể dùng Range
+    rv.accept_ranges = "bytes"
+
+    return rv.make_conditional(request, accept_ranges=True,
+                               complete_length=grid_out.length)
+
+
+def send_local_file(file_path, as_attachment=False, download_name=None, mimetype=None,
+                    etag=None, last_modified=None):
+    """
+    Trả file trên đĩa (legacy hoặc cache đĩa của GridFS) với cùng hành vi như GridFS:
+    stream theo khối, ETag/Last-Modified và Range/If-Range.
+    Dùng wsgi.file_wrapper của server nếu có (gunicorn -> sendfile, không copy qua Python).
+    """
+    download_name = download_name or os.path.basename(file_path)
+    if mimetype is None:
+        mimetype = mimetypes.guess_type(download_name)[0]
+    stat = os.stat(file_path)
+
+    data = wrap_file(request.environ, open(file_path, "rb"), buffer_size=LOCAL_BUFFER_SIZE)
+    rv = Response(data, mimetype=mimetype or "application/octet-stream",
+                  direct_passthrough=True)
+    _content_disposition(rv, download_name, as_attachment)
+
+    rv.content_length = stat.st_size
+    rv.last_modified = last_modified or stat.st_mtime
+    rv.set_etag(etag or f"{int(stat.st_mtime)}-{stat.st_size}")
+    rv.cache_control.no_cache = True
+    rv.accept_ranges = "bytes"
+
+    return rv.make_conditional(request, accept_ranges=True,
+                               complete_length=stat.st_size)
+
+
+def _set_image_cache(rv, immutable=True):
+    """Cache-Control cho ảnh: immutable nếu URL luôn trỏ tới đúng một nội dung."""
+    max_age = IMMUTABLE_MAX_AGE if immutable else FALLBACK_MAX_AGE
+    rv.cache_control.public = True
+    rv.cache_control.max_age = max_age
+    if immutable:
+        rv.cache_control.immutable = True
+    rv.expires = int(time.time() + max_age)
+
+
+def image_not_modified(etag, vary=None):
+    """
+    Nếu client đã có ảnh (If-None-Match chứa đúng etag) thì trả 304 ngay,
+    không cần truy vấn MongoDB. Trả None nếu phải phục vụ ảnh bình thường.
+    """
+    if_none_match = request.if_none_match
+    if if_none_match.star_tag or not if_none_match.contains_weak(str(etag)):
+        return None
+    rv = Response(status=304)
+    rv.set_etag(str(etag))
+    if vary:
+        rv.vary.add(vary)
+    _set_image_cache(rv)
+    return rv
+
+
+def send_gridfs_image(grid_out, mimetype=None, etag=None, immutable=True, bucket="images"):
+    """Trả ảnh GridFS với ETag/Last-Modified, 304 Not Modified và Cache-Control dài hạn."""
+    if mimetype is None:
+        mimetype = getattr(grid_out, "content_type", None) or "image/jpeg"
+    rv = _gridfs_response(grid_out, mimetype, bucket)
+    if etag is not None:
+        rv.set_etag(str(etag))
+    _set_image_cache(rv, immutable)
+    return rv.make_conditional(request)
+
+
+def send_image_bytes(data, mimetype, etag, last_modified=None, immutable=True):
+    """Trả ảnh đã có sẵn trong bộ nhớ (cache) với cùng header như send_gridfs_image."""
+    rv = Response(data, mimetype=mimetype)
+    if last_modified is not None:
+        rv.last_modified = last_modified
+    rv.set_etag(str(etag))
+    _set_image_cache(rv, immutable)
+    return rv.make_conditional(request)
@@ -0,0 +1,34 @@
+# conftest.py - Fixture dùng chung cho test cần MongoDB thật
+#
+# Kết nối theo MONGO_URI (như ứng dụng); không có server thì test được skip.
+# Mỗi phiên test dùng một database riêng <MONGO_DB>_test_<pid>, xóa khi xong.
+import os
+import sys
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_access  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def mongo_settings():
+    settings = data_access.settings_from_env()
+    settings["MONGO_DB"] = f"{settings['MONGO_DB']}_test_{os.getpid()}"
+    return settings
+
+
+@pytest.fixture(scope="session")
+def mongo_db(mongo_settings):
+    client = MongoClient(mongo_settings["MONGO_URI"], serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError as e:
+        client.close()
+        pytest.skip(f"Không kết nối được MongoDB ({mongo_settings['MONGO_URI']}): {e}")
+    yield client[mongo_settings["MONGO_DB"]]
+    client.drop_database(mongo_settings["MONGO_DB"])
+    client.close()
@@ -0,0 +1,63 @@
+# test_cover_cache.py - Segmented LRU của cache ảnh bìa (không cần MongoDB)
+from cover_cache import CoverCache
+
+
+def put(cache, key, size, group="g"):
+    return cache.put(key, group, b"x" * size, "image/webp")
+
+
+def test_miss_then_hit():
+    cache = CoverCache(1000, 500)
+    assert cache.get("a") is None
+    put(cache, "a", 10)
+    assert cache.get("a") == (b"x" * 10, "image/webp", None)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_second_hit_promotes_to_protected():
+    cache = CoverCache(1000, 500)
+    put(cache, "a", 100)
+    assert "a" in cache._probation
+    cache.get("a")
+    assert "a" in cache._protected and "a" not in cache._probation
+    assert cache.protected_bytes == 100
+
+
+def test_scan_does_not_evict_protected_entries():
+    cache = CoverCache(300, 100)
+    put(cache, "hot", 100)
+    cache.get("hot")
+    for i in range(10):                     # quét một lượt nhiều ảnh chỉ xem một lần
+        put(cache, f"scan{i}", 100)
+    assert cache.get("hot") is not None
+    assert cache.current_bytes <= 300
+    assert cache.stats()["evictions"] == 8
+
+
+def test_protected_overflow_demotes_oldest_to_probation():
+    cache = CoverCache(1000, 500, protected_ratio=0.2)     # protected tối đa 200 byte
+    for key in ("a", "b", "c"):
+        put(cache, key, 100)
+        cache.get(key)
+    assert list(cache._protected) == ["b", "c"]
+    assert "a" in cache._probation
+    assert cache.protected_bytes == 200
+
+
+def test_rejects_objects_over_limit():
+    cache = CoverCache(1000, 50)
+    assert put(cache, "big", 51) is False
+    assert cache.get("big") is None
+    assert cache.stats()["rejections"] == 1
+
+
+def test_invalidate_removes_every_size_of_a_cover():
+    cache = CoverCache(1000, 500)
+    put(cache, ("c1", "card"), 10, group="c1")
+    put(cache, ("c1", "thumb"), 20, group="c1")
+    cache.get(("c1", "card"))
+    put(cache, ("c2", "card"), 30, group="c2")
+    cache.invalidate("c1")
+    assert cache.get(("c1", "card")) is None and cache.get(("c1", "thumb")) is None
+    assert cache.get(("c2", "card")) is not None
+    assert cache.current_bytes == 30 and cache.protected_bytes == 30
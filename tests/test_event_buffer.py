@@ -0,0 +1,151 @@
+# test_event_buffer.py - Gộp sự kiện và ghi lại khi lỗi của bộ đệm write-behind (không cần MongoDB)
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from event_buffer import WriteBehindBuffer
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = []
+        self.bulk_ops = []
+        self.updates = []
+        self.fail = 0               # số lần gọi tới bị lỗi
+        self.reject = set()         # insert_many: vị trí bị lỗi ghi (không phải trùng khóa)
+
+    def _maybe_fail(self):
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("mất kết nối")
+
+    def insert_many(self, docs, ordered=True):
+        self._maybe_fail()
+        errors = []
+        for i, doc in enumerate(docs):
+            if i in self.reject:
+                errors.append({"index": i, "code": 91, "errmsg": "lỗi ghi"})
+            elif any(d is doc for d in self.docs):
+                errors.append({"index": i, "code": 11000, "errmsg": "trùng khóa"})
+            else:
+                self.docs.append(doc)
+        self.reject = set()
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    def bulk_write(self, ops, ordered=True):
+        self._maybe_fail()
+        self.bulk_ops.extend(ops)
+        return SimpleNamespace(upserted_count=len(ops))
+
+    def update_one(self, query, update, upsert=False):
+        self._maybe_fail()
+        self.updates.append((query["_id"], update["$inc"]))
+
+
+class FakeDB:
+    def __init__(self):
+        for name in ("downloads", "books", "reading_history", "stats"):
+            setattr(self, name, FakeCollection())
+
+    def counted(self):
+        """Tổng lượt tải đã cộng vào stats.totals và books.download_count."""
+        totals = sum(inc.get("downloads", 0) for key, inc in self.stats.updates if key == "totals")
+        per_book = Counter()
+        for op in self.books.bulk_ops:
+            per_book[op._filter["_id"]] += op._doc["$inc"]["download_count"]
+        return totals, per_book
+
+
+@pytest.fixture
+def db():
+    return FakeDB()
+
+
+@pytest.fixture
+def buffer(db):
+    # Luồng nền không tự flush trong lúc test: chỉ flush khi test gọi
+    buf = WriteBehindBuffer(db, batch_size=1000, flush_interval=3600, max_pending=1000)
+    yield buf
+    buf.close()
+
+
+def test_history_keeps_latest_view_per_user_and_book(buffer, db):
+    now = datetime(2024, 1, 1, 8, 0)
+    buffer.touch_history("u1", "b1", now, last_page=3)
+    buffer.touch_history("u1", "b1", now + timedelta(minutes=5), last_page=7)
+    buffer.touch_history("u1", "b2", now)
+    buffer.touch_history("u2", "b1", now)
+    assert buffer.stats()["pending_history"] == 3
+    assert buffer.flush() == 3
+    ops = {(op._filter["user_id"], op._filter["book_id"]): op._doc for op in db.reading_history.bulk_ops}
+    assert ops[("u1", "b1")] == {"$max": {"updated_at": now + timedelta(minutes=5)},
+                                 "$set": {"last_page": 7}}
+    assert ("totals", {"reading_history": 3}) in db.stats.updates
+
+
+def test_downloads_are_batched_and_counted(buffer, db):
+    when = datetime(2024, 1, 1, 8, 0)
+    for book_id in ("b1", "b1", "b2"):
+        buffer.record_download("u1", book_id, when)
+    assert db.downloads.docs == []
+    assert buffer.flush() == 3
+    assert len(db.downloads.docs) == 3
+    assert db.counted() == (3, Counter({"b1": 2, "b2": 1}))
+    assert ("day:2024-01-01", {"downloads": 3}) in db.stats.updates
+    assert buffer.stats()["pending_downloads"] == 0
+
+
+def test_failed_insert_is_requeued(buffer, db):
+    buffer.record_download("u1", "b1", datetime.now())
+    db.downloads.fail = 1
+    assert buffer.flush() == 0
+    assert buffer.stats()["pending_downloads"] == 1 and buffer.stats()["errors"] == 1
+    assert buffer.flush() == 1
+    assert len(db.downloads.docs) == 1
+    assert db.counted() == (1, Counter({"b1": 1}))
+
+
+def test_partial_insert_failure_counts_each_download_once(buffer, db):
+    for book_id in ("b1", "b2", "b3"):
+        buffer.record_download("u1", book_id, datetime.now())
+    db.downloads.reject = {1}
+    assert buffer.flush() == 2
+    assert buffer.stats()["pending_downloads"] == 1
+    assert buffer.flush() == 1
+    assert len(db.downloads.docs) == 3
+    assert db.counted() == (3, Counter({"b1": 1, "b2": 1, "b3": 1}))
+
+
+def test_failed_counter_update_is_retried_without_rewriting(buffer, db):
+    buffer.record_download("u1", "b1", datetime.now())
+    db.books.fail = 1
+    assert buffer.flush() == 1
+    assert buffer.stats()["uncounted_downloads"] == 1
+    assert db.counted() == (0, Counter())
+    buffer.flush()
+    assert len(db.downloads.docs) == 1
+    assert buffer.stats()["uncounted_downloads"] == 0
+    assert db.counted() == (1, Counter({"b1": 1}))
+
+
+def test_disabled_buffer_writes_immediately(db):
+    buf = WriteBehindBuffer(db, enabled=False)
+    try:
+        buf.record_download("u1", "b1", datetime.now())
+        assert len(db.downloads.docs) == 1
+        assert buf._thread is None
+    finally:
+        buf.close()
+
+
+def test_close_flushes_everything(db):
+    buf = WriteBehindBuffer(db, batch_size=1000, flush_interval=3600)
+    buf.record_download("u1", "b1", datetime.now())
+    buf.touch_history("u1", "b1", datetime.now())
+    buf.close()
+    assert len(db.downloads.docs) == 1 and len(db.reading_history.bulk_ops) == 1
+    assert buf.stats()["pending_downloads"] == 0 and buf.stats()["pending_history"] == 0
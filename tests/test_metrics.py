@@ -0,0 +1,85 @@
+# test_metrics.py - Gộp dict theo thread / process và xuất định dạng Prometheus (không cần MongoDB)
+import gc
+import json
+import threading
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def registry():
+    """Metric tạo trong test được gỡ khỏi registry chung sau khi chạy."""
+    before = list(metrics._registry)
+    yield
+    metrics._registry[:] = before
+
+
+def run_in_threads(target, count):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    del threads
+    gc.collect()
+
+
+def test_counter_merges_threads_and_retires_finished_ones(registry):
+    counter = metrics.Counter("test_jobs_total", "Số job", ("kind",))
+    counter.inc(kind="a")
+    run_in_threads(lambda: counter.inc(2, kind="a"), 5)
+    assert counter.collect() == {("a",): 11}
+    assert len(counter._shards) == 1        # chỉ còn dict của thread chính
+    assert counter._retired == {("a",): 10}
+
+
+def test_histogram_buckets_and_render(registry):
+    hist = metrics.Histogram("test_latency_seconds", "Độ trễ", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        hist.observe(value, route="/x")
+    text = metrics.render(metrics._merge_into({}, metrics.snapshot()))
+    assert "# TYPE test_latency_seconds histogram" in text
+    assert 'test_latency_seconds_bucket{route="/x",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{route="/x",le="1.0"} 3' in text
+    assert 'test_latency_seconds_bucket{route="/x",le="+Inf"} 4' in text
+    assert 'test_latency_seconds_count{route="/x"} 4' in text
+    assert 'test_latency_seconds_sum{route="/x"} 4.05' in text
+
+
+def test_render_escapes_label_values(registry):
+    counter = metrics.Counter("test_escape_total", "Nhãn đặc biệt", ("name",))
+    counter.inc(name='a"b\\c\nd')
+    text = metrics.render(metrics._merge_into({}, metrics.snapshot()))
+    assert 'test_escape_total{name="a\\"b\\\\c\\nd"} 1' in text
+
+
+def test_merge_into_sums_processes_and_can_drop_gauges(registry):
+    counter = metrics.Counter("test_merge_total", "Tổng", ("k",))
+    gauge = metrics.Gauge("test_merge_gauge", "Gauge")
+    snap = {counter.name: [[["x"], 2]], gauge.name: [[[], 3]], "unknown_metric": [[[], 1]]}
+    total = metrics._merge_into({}, snap)
+    metrics._merge_into(total, snap, keep_gauges=False)
+    assert total[counter.name] == {("x",): 4}
+    assert total[gauge.name] == {(): 3}
+    assert "unknown_metric" not in total
+
+
+def test_collect_all_archives_dead_processes(registry, tmp_path):
+    counter = metrics.Counter("test_archive_total", "Tổng")
+    gauge = metrics.Gauge("test_archive_gauge", "Gauge")
+    counter.inc(1)
+    dead_pid = 2 ** 22 + 1                  # vượt pid_max mặc định -> không thể còn sống
+    (tmp_path / f"{dead_pid}.json").write_text(
+        json.dumps({counter.name: [[[], 5]], gauge.name: [[[], 7]]}), encoding="utf-8")
+    total = metrics.collect_all(str(tmp_path))
+    assert total[counter.name] == {(): 6}
+    assert gauge.name not in total          # gauge của process đã thoát bị bỏ
+    assert not (tmp_path / f"{dead_pid}.json").exists()
+    assert metrics.collect_all(str(tmp_path))[counter.name] == {(): 6}
+
+
+def test_cache_hit_ratio(registry):
+    total = {metrics.CACHE_HITS.name: {("cover",): 3}, metrics.CACHE_MISSES.name: {("cover",): 1}}
+    assert 'cache_hit_ratio{cache="cover"} 0.75' in metrics.render(total)
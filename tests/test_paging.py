@@ -0,0 +1,64 @@
+# test_paging.py - Con trỏ phân trang keyset và điều kiện "đứng sau" (không cần MongoDB)
+import datetime
+
+from bson import ObjectId
+
+from paging import _split, after_filter, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip_keeps_bson_types():
+    oid = ObjectId()
+    when = datetime.datetime(2024, 5, 1, 12, 30)
+    values = ["Tiếng Việt", 3, None, when, oid]
+    token = encode_cursor(values)
+    assert "=" not in token
+    assert decode_cursor(token, len(values)) == values
+
+
+def test_bad_cursor_means_first_page():
+    assert decode_cursor(None, 2) is None
+    assert decode_cursor("", 2) is None
+    assert decode_cursor("###", 2) is None
+    assert decode_cursor("bm90IGpzb24", 2) is None              # "not json"
+    assert decode_cursor(encode_cursor([1, 2, 3]), 2) is None      # sai số khóa
+    assert decode_cursor(encode_cursor({"a": 1}), 1) is None
+
+
+def test_after_filter_ascending():
+    oid = ObjectId()
+    sort = [("title", 1), ("_id", 1)]
+    assert after_filter(sort, ["B", oid]) == {"$or": [
+        {"title": {"$gt": "B"}},
+        {"title": "B", "_id": {"$gt": oid}},
+    ]}
+
+
+def test_after_filter_descending_includes_missing_fields():
+    oid = ObjectId()
+    sort = [("year", -1), ("_id", -1)]
+    assert after_filter(sort, [2020, oid]) == {"$or": [
+        {"year": {"$not": {"$gte": 2020}}},
+        {"year": 2020, "_id": {"$not": {"$gte": oid}}},
+    ]}
+
+
+def test_after_filter_null_values():
+    oid = ObjectId()
+    assert after_filter([("year", 1), ("_id", 1)], [None, oid]) == {"$or": [
+        {"year": {"$ne": None}},
+        {"year": None, "_id": {"$gt": oid}},
+    ]}
+    # null là nhỏ nhất: sắp giảm dần thì chỉ còn so _id
+    assert after_filter([("year", -1), ("_id", -1)], [None, oid]) == {"$or": [
+        {"year": None, "_id": {"$not": {"$gte": oid}}},
+    ]}
+    assert after_filter([("year", -1)], [None]) == {"_id": {"$exists": False}}
+
+
+def test_split_returns_cursor_only_when_more_pages():
+    sort = [("n", 1), ("_id", 1)]
+    docs = [{"_id": i, "n": i * 10} for i in range(4)]
+    page, cursor = _split(docs, sort, 3)
+    assert page == docs[:3]
+    assert decode_cursor(cursor, 2) == [20, 2]
+    assert _split(docs[:3], sort, 3) == (docs[:3], None)
@@ -0,0 +1,101 @@
+# test_profiler.py - Token profile có chữ ký và middleware chỉ profile cho đúng admin (không cần MongoDB)
+import cProfile
+import pstats
+
+import pytest
+from flask import Flask, session
+
+import profiler
+
+SECRET = "test-secret"
+
+
+def test_sign_and_verify():
+    token = profiler.sign(SECRET, "/book/1", user_id="u1")
+    assert profiler.verify(SECRET, token, "/book/1", max_age=60) == {"path": "/book/1", "by": "u1"}
+
+
+def test_verify_rejects_wrong_path_key_and_garbage():
+    token = profiler.sign(SECRET, "/book/1", user_id="u1")
+    assert profiler.verify(SECRET, token, "/book/2", max_age=60) is None
+    assert profiler.verify("other-secret", token, "/book/1", max_age=60) is None
+    assert profiler.verify(SECRET, token[:-2], "/book/1", max_age=60) is None
+    assert profiler.verify(SECRET, "rác", "/book/1", max_age=60) is None
+
+
+def test_verify_rejects_expired_token():
+    token = profiler.sign(SECRET, "/book/1", user_id="u1")
+    assert profiler.verify(SECRET, token, "/book/1", max_age=-1) is None
+
+
+def test_breakdown_and_top_functions():
+    profile = cProfile.Profile()
+    profile.enable()
+    sorted(range(1000), key=lambda n: -n)
+    profile.disable()
+    stats = pstats.Stats(profile)
+    assert set(profiler.breakdown(stats)) == set(profiler.CATEGORIES)
+    top = profiler.top_functions(stats, limit=3)
+    assert 0 < len(top) <= 3
+    assert top == sorted(top, key=lambda row: -row["cumtime_ms"])
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.secret_key = SECRET
+    app.config.update(PROFILE_TOKEN_TTL=60, PROFILE_DIR=str(tmp_path), PROFILE_KEEP=2)
+
+    @app.route("/login/<user_id>/<role>")
+    def login(user_id, role):
+        session["user_id"], session["user_role"] = user_id, role
+        return "ok"
+
+    @app.route("/book/<int:book_id>")
+    def book(book_id):
+        return f"book {book_id}"
+
+    profiler.init_app(app)
+    return app
+
+
+def test_middleware_profiles_only_for_owning_admin(app, tmp_path):
+    token = profiler.sign(SECRET, "/book/1", user_id="admin1")
+
+    anonymous = app.test_client()
+    assert "X-Profile-Id" not in anonymous.get(f"/book/1?_profile={token}").headers
+
+    other_admin = app.test_client()
+    other_admin.get("/login/admin2/Admin")
+    assert "X-Profile-Id" not in other_admin.get(f"/book/1?_profile={token}").headers
+
+    owner = app.test_client()
+    owner.get("/login/admin1/Admin")
+    rv = owner.get("/book/1", headers={"X-Profile": token})
+    assert rv.data == b"book 1"
+    profile_id = rv.headers["X-Profile-Id"]
+    assert profiler.profile_path(str(tmp_path), profile_id) is not None
+    meta = profiler.list_profiles(str(tmp_path))[0]
+    assert meta["path"] == "/book/1" and meta["status"] == 200 and meta["requested_by"] == "admin1"
+
+    # token chỉ đúng cho path đã ký
+    assert "X-Profile-Id" not in owner.get(f"/book/2?_profile={token}").headers
+
+
+def test_middleware_ignores_session_without_admin_role(app):
+    token = profiler.sign(SECRET, "/book/1", user_id="u1")
+    client = app.test_client()
+    client.get("/login/u1/User")
+    assert "X-Profile-Id" not in client.get(f"/book/1?_profile={token}").headers
+
+
+def test_prune_keeps_newest_profiles(tmp_path):
+    for i in range(4):
+        for ext in (".prof", ".json"):
+            (tmp_path / f"20240101-00000{i}-abcdef{ext}").write_text("{}")
+    profiler._prune(str(tmp_path), keep=2)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "20240101-000002-abcdef.json", "20240101-000002-abcdef.prof",
+        "20240101-000003-abcdef.json", "20240101-000003-abcdef.prof",
+    ]
+    assert profiler.profile_path(str(tmp_path), "../../etc/passwd") is None
@@ -0,0 +1,93 @@
+# test_query_budgets.py - Route nóng không vượt số lệnh MongoDB khai báo trong app.QUERY_BUDGETS
+from datetime import datetime
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import app as appmod
+import query_monitor
+import schema
+
+
+@pytest.fixture(scope="module")
+def flask_app(mongo_db, mongo_settings, tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("app")
+    schema.apply_indexes(mongo_db, verbose=False)
+    application = appmod.create_app({
+        "TESTING": True,
+        "QUERY_MONITOR": True,
+        "MONGO_URI": mongo_settings["MONGO_URI"],
+        "MONGO_DB": mongo_settings["MONGO_DB"],
+        "UPLOAD_FOLDER": str(tmp / "uploads"),
+        "COVER_FOLDER": str(tmp / "covers"),
+        "SEARCH_INDEX_SNAPSHOT": str(tmp / "search_index.snapshot"),
+        "PROFILE_DIR": str(tmp / "profiles"),
+        "BOOK_CACHE_DIR": None,
+        "METRICS_DIR": None,
+    })
+    yield application
+    appmod.event_buffer.close()
+    appmod.search_index.close()
+
+
+@pytest.fixture(scope="module")
+def seeded(mongo_db):
+    now = datetime.now()
+    admin_id = mongo_db.users.insert_one({
+        "name": "Quản trị", "email": "budget-admin@test.local",
+        "password_hash": generate_password_hash("admin123"),
+        "role": "Admin", "status": "Active", "created_at": now,
+    }).inserted_id
+    book_ids = mongo_db.books.insert_many([
+        {"title": f"Lập trình Python {i}", "author": "Nguyễn Văn A", "description": "Sách Python",
+         "published_year": 2020 + i % 3, "preview": "Python", "created_at": now}
+        for i in range(5)
+    ]).inserted_ids
+    mongo_db.favorites.insert_one({"user_id": admin_id, "book_id": book_ids[0], "created_at": now})
+    mongo_db.downloads.insert_one({"user_id": admin_id, "book_id": book_ids[1], "downloaded_at": now})
+    return admin_id, book_ids
+
+
+@pytest.fixture
+def client(flask_app, seeded):
+    admin_id, _ = seeded
+    client = flask_app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = str(admin_id)
+        session["user_name"] = "Quản trị"
+        session["user_role"] = "Admin"
+    return client
+
+
+@pytest.fixture
+def paths(seeded):
+    _, book_ids = seeded
+    return [
+        "/dashboard",
+        "/my-library",
+        "/search?q=python",
+        f"/book/{book_ids[0]}",
+        "/admin",
+        "/admin/books",
+        "/admin/users",
+        "/api/admin/books",
+        "/api/admin/users",
+        "/api/search/suggest?q=pyth",
+        f"/api/books/related/{book_ids[0]}",
+    ]
+
+
+def test_paths_cover_every_budget(flask_app, paths):
+    adapter = flask_app.url_map.bind("localhost")
+    endpoints = {adapter.match(path.split("?", 1)[0])[0] for path in paths}
+    assert endpoints == set(appmod.QUERY_BUDGETS)
+
+
+def test_routes_within_query_budget(flask_app, client, paths):
+    # Lượt đầu: route phải chạy thật (không bị chuyển về trang đăng nhập) và làm nóng cache
+    for path in paths:
+        assert client.get(path).status_code == 200, path
+    problems = query_monitor.check_budgets(flask_app, client, paths)
+    assert not problems, "\n".join(
+        f"{path} ({endpoint}): {count} lệnh > {budget} - {summary}"
+        for path, endpoint, count, budget, summary in problems)
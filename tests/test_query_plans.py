@@ -0,0 +1,19 @@
+# test_query_plans.py - Mọi truy vấn nóng khai báo trong schema.QUERY_SHAPES phải dùng index
+import pytest
+
+import schema
+
+
+@pytest.fixture(scope="module")
+def indexed_db(mongo_db):
+    assert schema.apply_indexes(mongo_db, verbose=False)
+    return mongo_db
+
+
+def test_hot_queries_use_indexes(indexed_db):
+    schema.assert_no_collscan(indexed_db)
+
+
+@pytest.mark.parametrize("shape", schema.QUERY_SHAPES, ids=lambda shape: shape.name)
+def test_query_shape(indexed_db, shape):
+    assert "COLLSCAN" not in schema.explain_shape(indexed_db, shape)
@@ -0,0 +1,159 @@
+# test_search_engine.py - Tách từ tiếng Việt, xếp hạng BM25 và gợi ý của index trong bộ nhớ (không cần MongoDB)
+from collections import Counter
+
+import pytest
+from bson import ObjectId
+
+from search_engine import SearchEngine, _terms, fold, tokenize
+
+
+class FakeCursor(list):
+    def batch_size(self, size):
+        return self
+
+
+class FakeBooks:
+    """Đủ cho build() / apply(): find({}) hoặc find({"_id": {"$in": [...]}})."""
+
+    def __init__(self, books):
+        self.books = {book["_id"]: book for book in books}
+
+    def find(self, query, projection=None):
+        ids = query.get("_id", {}).get("$in")
+        return FakeCursor(dict(book) for book_id, book in self.books.items()
+                          if ids is None or book_id in ids)
+
+    def estimated_document_count(self):
+        return len(self.books)
+
+
+class FakeDB:
+    def __init__(self, books):
+        self.books = FakeBooks(books)
+
+
+def book(title, author="", description="", year=None):
+    return {"_id": ObjectId(), "title": title, "author": author,
+            "description": description, "published_year": year}
+
+
+@pytest.fixture
+def books():
+    return [
+        book("Lập trình Python", "Nguyễn Văn A", "Sách nhập môn lập trình", 2020),
+        book("Trình duyệt web hiện đại", "Trần Thị B", "Lập kế hoạch và trình bày", 2021),
+        book("Đồ họa máy tính", "Nguyễn Văn A", "Xử lý ảnh", 2020),
+        book("Cấu trúc dữ liệu", "Lê C", "Thuật toán và lập trình", 2019),
+    ]
+
+
+@pytest.fixture
+def db(books):
+    return FakeDB(books)
+
+
+@pytest.fixture
+def engine(db):
+    engine = SearchEngine()
+    engine.build(db)
+    return engine
+
+
+def recount_df(engine):
+    df = Counter()
+    for term, postings in engine.postings.items():
+        docs = {p // 4 for p in postings} - engine.deleted
+        if docs:
+            df[term] = len(docs)
+    return df
+
+
+def test_fold_and_tokenize():
+    assert fold("Lập Trình Đồ Họa") == "lap trinh do hoa"
+    assert fold("đường") == "duong"
+    assert tokenize("Lập trình: Python 3!") == ["lap", "trinh", "python", "3"]
+    assert tokenize(None) == []
+    assert _terms(["lap", "trinh", "python"]) == ["lap", "trinh", "python", "lap_trinh", "trinh_python"]
+
+
+def test_search_without_diacritics(engine, books):
+    ids = [book_id for _, book_id in engine.search("lap trinh python")]
+    assert ids[0] == books[0]["_id"]
+    assert [book_id for _, book_id in engine.search("DO HOA")] == [books[2]["_id"]]
+    assert engine.search("") == [] and engine.search("không có từ này") == []
+
+
+def test_phrase_and_title_rank_above_scattered_matches():
+    in_title = book("Lập trình căn bản", description="Ghi chú")
+    phrase = book("Ghi chú", description="Lập trình căn bản")
+    scattered = book("Ghi chú", description="Lập kế trình bản")
+    engine = SearchEngine()
+    engine.build(FakeDB([scattered, phrase, in_title]))
+    # tiêu đề > cụm "lap trinh" liền nhau trong mô tả > hai âm tiết rời rạc
+    assert [b for _, b in engine.search("lập trình")] == [in_title["_id"], phrase["_id"], scattered["_id"]]
+
+
+def test_year_filter(engine, books):
+    ids = {book_id for _, book_id in engine.search("nguyen van a", year=2020)}
+    assert ids == {books[0]["_id"], books[2]["_id"]}
+    assert engine.search("nguyen van a", year=2019) == []
+
+
+def test_apply_updates_and_removals_keep_df_exact(engine, db, books):
+    changed = dict(books[1], title="Lập trình web")
+    db.books.books[changed["_id"]] = changed
+    del db.books.books[books[2]["_id"]]
+    engine.apply(db, [changed["_id"], books[2]["_id"]])
+    assert engine.df == recount_df(engine)
+    assert books[2]["_id"] not in {b for _, b in engine.search("do hoa")}
+    assert changed["_id"] in {b for _, b in engine.search("lap trinh web")}
+    # gỡ đủ nhiều sách -> compact, df vẫn đúng
+    for b in books[:2]:
+        del db.books.books[b["_id"]]
+    engine.apply(db, [b["_id"] for b in books[:2]])
+    assert not engine.deleted
+    assert engine.df == recount_df(engine)
+    assert [b for _, b in engine.search("cau truc")] == [books[3]["_id"]]
+
+
+def test_snapshot_round_trip(tmp_path, db, books):
+    path = str(tmp_path / "index.pickle")
+    engine = SearchEngine(snapshot_path=path)
+    engine.build(db)
+    engine.save_snapshot()
+    loaded = SearchEngine(snapshot_path=path)
+    assert loaded._load_snapshot(db)
+    assert loaded.df == engine.df
+    assert loaded.search("lap trinh") == engine.search("lap trinh")
+    # số sách trong db khác snapshot -> không dùng snapshot
+    del db.books.books[books[0]["_id"]]
+    assert not SearchEngine(snapshot_path=path)._load_snapshot(db)
+
+
+def test_search_page_cursor(engine):
+    ranked = engine.search("lap trinh")
+    ids, cursor, total = engine.search_page("lap trinh", 2)
+    assert total == len(ranked) and ids == [b for _, b in ranked[:2]]
+    rest, next_cursor, _ = engine.search_page("lap trinh", 2, cursor=cursor)
+    assert rest == [b for _, b in ranked[2:4]]
+    assert (next_cursor is None) == (len(ranked) <= 4)
+
+
+def test_suggestions_by_word_prefix_and_popularity(engine, books):
+    labels = [s["label"] for s in engine.suggestions("trinh")]
+    assert labels[0] == "Trình duyệt web hiện đại"          # khớp từ đầu tên trước
+    assert "Lập trình Python" in labels
+    engine.suggest.popularity = {books[0]["_id"]: 50}
+    first = engine.suggestions("trinh")[0]
+    assert first == {"type": "book", "label": "Lập trình Python",
+                     "book_id": str(books[0]["_id"]), "downloads": 50}
+    authors = [s for s in engine.suggestions("nguyen") if s["type"] == "author"]
+    assert authors == [{"type": "author", "label": "Nguyễn Văn A", "downloads": 50}]
+    assert engine.suggestions("   ") == []
+
+
+def test_suggestions_follow_removed_books(engine, db, books):
+    del db.books.books[books[3]["_id"]]
+    engine.apply(db, [books[3]["_id"]])
+    assert engine.suggestions("cau truc") == []
+    assert engine.suggestions("le c") == []
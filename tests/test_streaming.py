@@ -0,0 +1,84 @@
+# test_streaming.py - Range / If-Range khi trả file sách (không cần MongoDB)
+import datetime
+import io
+
+import pytest
+from bson import ObjectId
+from flask import Flask
+
+from streaming import send_gridfs_file, send_local_file
+
+CONTENT = bytes(range(256)) * 4        # 1024 byte
+
+
+class FakeGridOut(io.BytesIO):
+    """Đủ thuộc tính của GridOut mà streaming dùng tới."""
+
+    def __init__(self, data, filename="sach.pdf"):
+        super().__init__(data)
+        self._id = ObjectId()
+        self.length = len(data)
+        self.chunk_size = 255 * 1024
+        self.filename = filename
+        self.content_type = "application/pdf"
+        self.upload_date = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / "sach.pdf"
+    path.write_bytes(CONTENT)
+    app = Flask(__name__)
+
+    @app.route("/local")
+    def local():
+        return send_local_file(str(path), etag="v1")
+
+    @app.route("/grid")
+    def grid():
+        return send_gridfs_file(FakeGridOut(CONTENT, "Sách hay.pdf"), as_attachment=True)
+
+    return app.test_client()
+
+
+@pytest.mark.parametrize("url", ["/local", "/grid"])
+def test_full_response_advertises_ranges(client, url):
+    rv = client.get(url)
+    assert rv.status_code == 200
+    assert rv.data == CONTENT
+    assert rv.headers["Accept-Ranges"] == "bytes"
+    assert rv.headers["Content-Length"] == str(len(CONTENT))
+
+
+@pytest.mark.parametrize("url", ["/local", "/grid"])
+@pytest.mark.parametrize("header, start, end", [
+    ("bytes=0-9", 0, 9),
+    ("bytes=1000-", 1000, 1023),
+    ("bytes=-5", 1019, 1023),           # suffix range: 5 byte cuối
+    ("bytes=1000-5000", 1000, 1023),    # end vượt quá file -> cắt về cuối file
+])
+def test_range_returns_partial_content(client, url, header, start, end):
+    rv = client.get(url, headers={"Range": header})
+    assert rv.status_code == 206
+    assert rv.data == CONTENT[start:end + 1]
+    assert rv.headers["Content-Range"] == f"bytes {start}-{end}/{len(CONTENT)}"
+
+
+@pytest.mark.parametrize("url", ["/local", "/grid"])
+def test_unsatisfiable_range(client, url):
+    rv = client.get(url, headers={"Range": "bytes=2048-"})
+    assert rv.status_code == 416
+    assert rv.headers["Content-Range"] == f"bytes */{len(CONTENT)}"
+
+
+def test_if_range_with_stale_etag_sends_whole_file(client):
+    rv = client.get("/local", headers={"Range": "bytes=0-9", "If-Range": '"v0"'})
+    assert rv.status_code == 200 and rv.data == CONTENT
+    rv = client.get("/local", headers={"Range": "bytes=0-9", "If-Range": '"v1"'})
+    assert rv.status_code == 206 and rv.data == CONTENT[:10]
+
+
+def test_unicode_download_name(client):
+    disposition = client.get("/grid").headers["Content-Disposition"]
+    assert disposition.startswith("attachment")
+    assert "filename*=UTF-8''S%C3%A1ch%20hay.pdf" in disposition
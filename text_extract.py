@@ -0,0 +1,103 @@
+# text_extract.py - Trích văn bản / thông tin dẫn xuất từ file sách (PDF, DOCX, TXT)
+# Tách khỏi app.py để process worker nền import được mà không kết nối MongoDB.
+# PyPDF2 / python-docx nặng nên chỉ import trong nhánh xử lý đúng loại file.
+import io
+
+PREVIEW_PAGES = 3
+PREVIEW_PARAGRAPHS = 30
+
+
+def _truncate(text, max_chars):
+    text = text.strip()
+    return (text[:max_chars] + "...") if len(text) > max_chars else text
+
+
+def _as_stream(file_data):
+    if isinstance(file_data, (bytes, bytearray)):
+        return io.BytesIO(file_data)
+    return file_data
+
+
+def extract_derived(file_data, filename, max_chars=800):
+    """
+    Trích preview + thông tin dẫn xuất: {"preview": str, "page_count": int | None}.
+    Ném exception khi file lỗi (để job nền biết mà thử lại).
+    file_data: bytes hoặc luồng nhị phân seek được (upload, GridOut) - không cần nạp cả file.
+    """
+    ext = filename.lower().split('.')[-1]
+    stream = _as_stream(file_data)
+    if ext == "pdf":
+        import PyPDF2
+        reader = PyPDF2.PdfReader(stream)
+        text = ""
+        for page in reader.pages[:PREVIEW_PAGES]:
+            # .extract_text có thể trả None
+            text += (page.extract_text() or "")
+        return {"preview": _truncate(text, max_chars), "page_count": len(reader.pages)}
+    elif ext in ["doc", "docx"]:
+        # python-docx chỉ đọc .docx tốt; .doc có thể không đọc được => fallback
+        import docx
+        try:
+            doc = docx.Document(stream)
+            text = "\n".join(p.text for p in doc.paragraphs[:PREVIEW_PARAGRAPHS])
+        except Exception:
+            if ext == "docx":
+                raise
+            text = ""
+        if not text.strip() and ext == "doc":
+            return {"preview": "Không thể tạo xem trước cho file .doc (định dạng cũ).", "page_count": None}
+        return {"preview": _truncate(text, max_chars), "page_count": None}
+    elif ext == "txt":
+        # Chỉ cần đọc phần đầu file (UTF-8 tối đa 4 byte / ký tự)
+        head = stream.read(max_chars * 4 + 4)
+        try:
+            text = head.decode("utf-8", errors="ignore")
+        except Exception:
+            text = head.decode("latin-1", errors="ignore")
+        return {"preview": _truncate(text, max_chars), "page_count": None}
+    return {"preview": "Không thể tạo xem trước cho định dạng file này.", "page_count": None}
+
+
+def extract_text_preview(file_data, filename, max_chars=800):
+    """Trích văn bản để hiển thị preview ngắn (safe)."""
+    try:
+        return extract_derived(file_data, filename, max_chars)["preview"]
+    except Exception:
+        return "Không thể tạo xem trước."
+
+
+def _passages(chunks, passage_chars):
+    """Gom các đoạn văn bản thành passage ~passage_chars ký tự, đánh số từ 1."""
+    buffer = []
+    size = 0
+    number = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= passage_chars:
+            number += 1
+            yield number, "\n".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield number + 1, "\n".join(buffer)
+
+
+def iter_pages(file_data, filename, passage_chars=3000):
+    """
+    Duyệt toàn bộ nội dung sách theo trang (PDF) hoặc theo passage (DOCX/TXT),
+    trả (số trang/passage, văn bản) - đọc dần, không giữ cả sách trong RAM.
+    """
+    ext = filename.lower().split('.')[-1]
+    stream = _as_stream(file_data)
+    if ext == "pdf":
+        import PyPDF2
+        reader = PyPDF2.PdfReader(stream)
+        for number, page in enumerate(reader.pages, start=1):
+            yield number, page.extract_text() or ""
+    elif ext == "docx":
+        import docx
+        doc = docx.Document(stream)
+        yield from _passages((p.text for p in doc.paragraphs if p.text.strip()), passage_chars)
+    elif ext == "txt":
+        text_stream = io.TextIOWrapper(stream, encoding="utf-8", errors="ignore")
+        yield from _passages(iter(lambda: text_stream.read(passage_chars), ""), passage_chars)